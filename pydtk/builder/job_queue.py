@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+
+# Copyright Toolkit Authors
+
+"""Job queue on a shared filesystem for distributing batch builders over hosts.
+
+A queue is a directory with the following sub-directories:
+
+- `pending/`: jobs waiting to be processed (`<job>.json`)
+- `claimed/`: jobs being processed (`<job>.<owner>.json`), whose mtime is the last heartbeat
+- `done/`: completed jobs
+- `failed/`: jobs that failed more than `max_retries` times
+
+Every state transition is a single `rename()` (or `link()`), which is atomic on local
+filesystems and NFS, so that no external service is required. Claims are compared with the
+local clock, so `lease` should be much longer than the clock skew between hosts.
+
+A job is identified by its task ID and payload, so a task is queued again after it has
+been done if its payload changes (e.g. the size or mtime of the file to process).
+
+"""
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from multiprocessing import Process
+
+_STATES = ["pending", "claimed", "done", "failed"]
+
+
+def _to_builtin(obj):
+    """Convert numpy scalars in payloads to JSON-serializable values."""
+    if hasattr(obj, "item"):
+        return obj.item()
+    raise TypeError("Object of type {} is not JSON serializable".format(type(obj).__name__))
+
+
+def _job_name(task_id, payload):
+    pre_hash = json.dumps([task_id, payload], sort_keys=True, default=_to_builtin)
+    return hashlib.sha1(pre_hash.encode("utf-8")).hexdigest()
+
+
+@contextmanager
+def file_lock(path):
+    """Lock a file exclusively among processes and hosts sharing the filesystem.
+
+    Args:
+        path (str): path to the lock file (created if it does not exist)
+
+    """
+    with open(path, "a") as f:
+        fcntl.lockf(f.fileno(), fcntl.LOCK_EX)  # POSIX locks are supported by NFS
+        try:
+            yield
+        finally:
+            fcntl.lockf(f.fileno(), fcntl.LOCK_UN)
+
+
+class JobQueue(object):
+    """File-lock-based job queue."""
+
+    def __init__(self, queue_dir, lease=600.0, max_retries=2, owner=None):
+        """Initialize JobQueue.
+
+        Args:
+            queue_dir (str): path to the queue directory (created if it does not exist)
+            lease (float): seconds after the last heartbeat until a claim expires
+            max_retries (int): maximum number of retries of a failed job
+            owner (str): name of this worker (defaults to '<hostname>-<pid>-<random>')
+
+        """
+        self.queue_dir = queue_dir
+        self.lease = float(lease)
+        self.max_retries = int(max_retries)
+        if owner is None:
+            owner = "{}-{}-{}".format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+        self.owner = owner.replace(".", "_")
+        for state in _STATES + ["tmp"]:
+            os.makedirs(os.path.join(queue_dir, state), exist_ok=True)
+
+    def _path(self, state, name, owner=None):
+        if owner is not None:
+            name = "{}.{}".format(name, owner)
+        return os.path.join(self.queue_dir, state, name + ".json")
+
+    def _names(self, state):
+        return [
+            f[:-5] for f in os.listdir(os.path.join(self.queue_dir, state)) if f.endswith(".json")
+        ]
+
+    def _write(self, path, job):
+        """Write a job atomically, failing if the destination exists."""
+        tmp_path = self._path("tmp", uuid.uuid4().hex)
+        with open(tmp_path, "w") as f:
+            json.dump(job, f, default=_to_builtin)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.link(tmp_path, path)
+            return True
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(tmp_path)
+
+    def put(self, tasks):
+        """Add jobs unless the same jobs are already in the queue.
+
+        Several workers may add the same jobs; each job is added only once.
+        Jobs are compared by both the task ID and the payload, so a done (or failed) task
+        whose payload has changed since then is added again.
+
+        Args:
+            tasks (list): list of pydtk.builder.scheduler.Task with JSON-serializable payloads
+
+        Returns:
+            (int): number of the added jobs
+
+        """
+        claimed = set(name.split(".")[0] for name in self._names("claimed"))
+        finished = set(self._names("done")) | set(self._names("failed"))
+        num_added = 0
+        for task in tasks:
+            name = _job_name(task.task_id, task.payload)
+            if name in claimed or name in finished:
+                continue
+            job = {"id": task.task_id, "payload": task.payload, "weight": task.weight}
+            job["attempts"] = 0
+            num_added += int(self._write(self._path("pending", name), job))
+        return num_added
+
+    def claim(self, num_jobs=1):
+        """Claim pending jobs.
+
+        Args:
+            num_jobs (int): maximum number of jobs to claim
+
+        Returns:
+            (list): list of claimed jobs (dict with keys 'id', 'payload', 'weight', 'attempts')
+
+        """
+        names = self._names("pending")
+        random.shuffle(names)  # Avoid contention between workers
+        jobs = []
+        for name in names:
+            if len(jobs) >= num_jobs:
+                break
+            pending_path = self._path("pending", name)
+            claimed_path = self._path("claimed", name, self.owner)
+            try:
+                # Renaming keeps the mtime, so it is refreshed first not to be expired at once
+                os.utime(pending_path)
+                os.rename(pending_path, claimed_path)
+                with open(claimed_path, "r") as f:
+                    job = json.load(f)
+            except FileNotFoundError:
+                continue  # Claimed by another worker, or expired right after the claim
+            job["_name"] = name
+            jobs.append(job)
+        return jobs
+
+    def heartbeat(self, jobs):
+        """Extend claims of jobs.
+
+        Args:
+            jobs (list): list of claimed jobs
+
+        Returns:
+            (list): list of jobs whose claims have been lost (expired and taken by others)
+
+        """
+        lost = []
+        for job in jobs:
+            try:
+                os.utime(self._path("claimed", job["_name"], self.owner))
+            except FileNotFoundError:
+                lost.append(job)
+        return lost
+
+    def complete(self, job):
+        """Mark a claimed job as done.
+
+        Args:
+            job (dict): claimed job
+
+        Returns:
+            (bool): False if the claim had been lost
+
+        """
+        try:
+            os.rename(
+                self._path("claimed", job["_name"], self.owner), self._path("done", job["_name"])
+            )
+            return True
+        except FileNotFoundError:
+            return False
+
+    def fail(self, job, error):
+        """Return a claimed job to the queue, or mark it as failed if retried too many times.
+
+        Args:
+            job (dict): claimed job
+            error (str): error message
+
+        Returns:
+            (bool): False if the claim had been lost
+
+        """
+        # The claim is moved out of `claimed/` first, so that it is not expired meanwhile
+        name = job["_name"]
+        failing_path = self._path("tmp", name, self.owner)
+        try:
+            os.rename(self._path("claimed", name, self.owner), failing_path)
+        except FileNotFoundError:
+            return False
+        job = {**{k: v for k, v in job.items() if k != "_name"}, "error": error}
+        job["attempts"] += 1
+        state = "pending" if job["attempts"] <= self.max_retries else "failed"
+        if state == "failed":
+            logging.error("Job {} failed: {}".format(job["id"], error))
+        else:
+            logging.warning(
+                "Job {} failed (attempt {}): {}".format(job["id"], job["attempts"], error)
+            )
+        self._write(self._path(state, name), job)
+        os.remove(failing_path)
+        return True
+
+    def expire(self):
+        """Return jobs whose claims have not been extended within the lease to the queue.
+
+        Returns:
+            (int): number of the expired claims
+
+        """
+        num_expired = 0
+        now = time.time()
+        for name in self._names("claimed"):
+            path = os.path.join(self.queue_dir, "claimed", name + ".json")
+            try:
+                if now - os.stat(path).st_mtime < self.lease:
+                    continue
+                os.rename(path, self._path("pending", name.split(".")[0]))
+            except FileNotFoundError:
+                continue  # Completed or expired by another worker
+            logging.warning("Claim expired: {}".format(name))
+            num_expired += 1
+        return num_expired
+
+    def counts(self):
+        """Return the number of jobs in each state."""
+        return {state: len(self._names(state)) for state in _STATES}
+
+    def drain(self, worker, batch_size=1, heartbeat_interval=None, poll_interval=None):
+        """Process jobs until the queue becomes empty.
+
+        Jobs claimed by other workers are waited for, so that those of crashed workers are
+        taken over once their claims expire.
+
+        Args:
+            worker (object): an object implementing `process(chunk)`
+                             (see pydtk.builder.scheduler.Scheduler)
+            batch_size (int): number of jobs claimed at once
+            heartbeat_interval (float): interval of heartbeats [sec] (defaults to lease / 4)
+            poll_interval (float): interval of polling while waiting for the other workers
+
+        Returns:
+            (dict): number of the jobs 'completed' and 'failed' by this worker
+
+        """
+        if heartbeat_interval is None:
+            heartbeat_interval = self.lease / 4
+        if poll_interval is None:
+            poll_interval = min(heartbeat_interval, 1.0)
+        summary = {"completed": 0, "failed": 0}
+        while True:
+            jobs = self.claim(batch_size)
+            if len(jobs) == 0:
+                self.expire()
+                jobs = self.claim(batch_size)
+            if len(jobs) == 0:
+                if len(self._names("claimed")) == 0 and len(self._names("pending")) == 0:
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            # Keep the claims alive while processing
+            stop = threading.Event()
+            lost = set()
+
+            def _heartbeat():
+                while not stop.wait(heartbeat_interval):
+                    for job in self.heartbeat([job for job in jobs if job["_name"] not in lost]):
+                        logging.warning("Claim lost: {}".format(job["id"]))
+                        lost.add(job["_name"])
+
+            thread = threading.Thread(target=_heartbeat, daemon=True)
+            thread.start()
+            try:
+                results = worker.process([(job["id"], job["payload"]) for job in jobs])
+            except Exception as e:
+                error = "{}: {}".format(type(e).__name__, e)
+                results = {job["id"]: error for job in jobs}
+            finally:
+                stop.set()
+                thread.join()
+
+            for job in jobs:
+                error = results.get(job["id"], "No result")
+                if job["_name"] in lost:
+                    continue  # Taken over by another worker, which records the result
+                if error is None:
+                    summary["completed"] += int(self.complete(job))
+                else:
+                    summary["failed"] += int(self.fail(job, error))
+        return summary
+
+
+def _drain(queue_kwargs, worker_class, worker_kwargs, drain_kwargs):
+    queue = JobQueue(**queue_kwargs)
+    queue.drain(worker_class(**worker_kwargs), **drain_kwargs)
+
+
+def run_workers(
+    queue_dir,
+    worker_class,
+    worker_kwargs=None,
+    num_jobs=1,
+    batch_size=1,
+    lease=600.0,
+    max_retries=2,
+):
+    """Drain a queue with worker processes on this host.
+
+    Args:
+        queue_dir (str): path to the queue directory
+        worker_class (type): class of workers (see pydtk.builder.scheduler.Scheduler)
+        worker_kwargs (dict): keyword arguments for initializing workers
+        num_jobs (int): number of worker processes
+        batch_size (int): number of jobs claimed at once
+        lease (float): seconds after the last heartbeat until a claim expires
+        max_retries (int): maximum number of retries of a failed job
+
+    Returns:
+        (dict): number of jobs in each state after draining
+
+    """
+    queue_kwargs = {"queue_dir": queue_dir, "lease": lease, "max_retries": max_retries}
+    args = (queue_kwargs, worker_class, worker_kwargs or {}, {"batch_size": batch_size})
+    if num_jobs == 1:
+        _drain(*args)
+    else:
+        processes = [Process(target=_drain, args=args) for _ in range(num_jobs)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+    return JobQueue(**queue_kwargs).counts()
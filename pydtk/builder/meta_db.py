@@ -5,11 +5,14 @@
 import logging
 import os
 import time
+from contextlib import nullcontext
 from pathlib import Path
 
 import fire
 from tqdm import tqdm
 
+from pydtk.builder.job_queue import JobQueue, file_lock, run_workers
+from pydtk.builder.scheduler import Task
 from pydtk.db import V3DBHandler, V4DBHandler
 from pydtk.db.v4.engines import DB_ENGINES
 from pydtk.models import MetaDataModel
@@ -30,6 +33,84 @@ def _find_json(db_dir):
     return json_list
 
 
+_BATCH_SIZE = 1000
+
+
+def _add_metadata(handler, records):
+    """Add metadata loaded from files to a DB-handler.
+
+    Args:
+        handler (MetaDBHandler): DB-handler
+        records (list): list of metadata (stored without being copied if possible)
+
+    """
+    if hasattr(handler, "add_many"):
+        handler.add_many(records, copy=False)
+    else:
+        for record in records:
+            handler.add_data(record)
+
+
+class _MetaDataWorker(object):
+    """Load metadata files and add them to DB."""
+
+    def __init__(self, handler_kwargs, v3=False, lock_path=None):
+        """Initialize _MetaDataWorker.
+
+        Args:
+            handler_kwargs (dict): keyword arguments for initializing DB-handlers
+            v3 (bool): use V3DBHandler instead of V4DBHandler
+            lock_path (str): path to a file locked while merging configs and saving,
+                             shared by all the workers
+
+        """
+        self._handler_kwargs = handler_kwargs
+        self._handler_class = V3DBHandler if v3 else V4DBHandler
+        self._lock_path = lock_path
+
+    def process(self, chunk):
+        """Add metadata files in a chunk to DB.
+
+        Args:
+            chunk (list): list of (task_id, payload with the path to a metadata file)
+
+        Returns:
+            (dict): task_id -> error message (None if succeeded)
+
+        """
+        # A handler is made for each chunk to load the latest config, as the other workers
+        # may have added columns since the last chunk
+        handler = self._handler_class(db_class="meta", read_on_init=False, **self._handler_kwargs)
+        results, records = {}, []
+        for task_id, payload in chunk:
+            path = payload["path"]
+            if not MetaDataModel.is_loadable(path):
+                results[task_id] = "Failed to load metadata file: {}".format(path)
+                continue
+            metadata = MetaDataModel()
+            metadata.load(path)
+            records.append(metadata.data)
+            results[task_id] = None
+        _add_metadata(handler, records)
+
+        if self._handler_class is V3DBHandler:
+            handler.save(remove_duplicates=True)
+            return results
+
+        # Configs are merged and saved by one worker at a time, otherwise columns added by
+        # a worker could be overwritten by another which has not read them yet
+        with file_lock(self._lock_path) if self._lock_path is not None else nullcontext():
+            latest = self._handler_class(
+                db_class="meta", read_on_init=False, **self._handler_kwargs
+            )
+            names = [c["name"] for c in handler.config["columns"]]
+            handler.config["columns"] = handler.config["columns"] + [
+                c for c in latest.config.get("columns", []) if c["name"] not in names
+            ]
+            handler.save(remove_duplicates=True)
+        return results
+
+
 def main(
     target_dir,
     database_id="default",
@@ -39,10 +120,19 @@ def main(
     output_db_username=None,
     output_db_password=None,
     output_db_name=None,
+    queue_dir=None,
+    num_jobs=1,
+    lease=600.0,
+    max_retries=2,
     verbose=False,
 ):
     """Create meta_db.
 
+    If `queue_dir` is given, metadata files are put into a job queue on a shared filesystem
+    and loaded by `num_jobs` worker processes, together with workers on the other hosts
+    running the same command. The output DB must accept concurrent writers
+    (e.g. mongodb or an SQL server).
+
     Args:
         target_dir (str): Path to database directory
         database_id (str): ID of the database (e.g. "Driving Behavior Database")
@@ -52,6 +142,10 @@ def main(
         output_db_username (str): Username for the database
         output_db_password (str): Password for the database
         output_db_name (str): Database name
+        queue_dir (str): Path to a job queue directory shared among hosts
+        num_jobs (int): Number of worker processes (only used with `queue_dir`)
+        lease (float): Seconds until a job claimed by an unresponsive worker is taken over
+        max_retries (int): Maximum number of retries of a failed job
         verbose (bool): Verbose mode
 
     """
@@ -85,26 +179,61 @@ def main(
 
     # Preparation
     base_dir_path = base_dir if base_dir is not None else target_dir
-    handler = DBHandler(
-        db_class="meta",
-        db_engine=output_db_engine,
-        db_host=output_db_host,
-        db_username=output_db_username,
-        db_password=output_db_password,
-        db_name=output_db_name,
-        database_id=database_id,
-        base_dir_path=base_dir_path,
-    )
+    handler_kwargs = {
+        "db_engine": output_db_engine,
+        "db_host": output_db_host,
+        "db_username": output_db_username,
+        "db_password": output_db_password,
+        "db_name": output_db_name,
+        "database_id": database_id,
+        "base_dir_path": base_dir_path,
+    }
+
+    # Distribute metadata files over workers
+    if queue_dir is not None:
+        # The mtime is in the payload so that modified files are loaded again
+        tasks = [
+            Task(
+                str(path),
+                {"path": str(path), "mtime": os.path.getmtime(path)},
+                weight=os.path.getsize(path),
+            )
+            for path in json_list
+        ]
+        queue = JobQueue(queue_dir, lease=lease, max_retries=max_retries)
+        logging.info("Added {} jobs to the queue".format(queue.put(tasks)))
+        counts = run_workers(
+            queue_dir,
+            _MetaDataWorker,
+            worker_kwargs={
+                "handler_kwargs": handler_kwargs,
+                "v3": DBHandler is V3DBHandler,
+                "lock_path": os.path.join(queue_dir, "config.lock"),
+            },
+            num_jobs=num_jobs,
+            batch_size=100,
+            lease=lease,
+            max_retries=max_retries,
+        )
+        logging.info("Done.(Total: {0:.03f} secs, jobs: {1})".format(time.time() - t0, counts))
+        return
+
+    handler = DBHandler(db_class="meta", **handler_kwargs)
 
     # Append metadata to db
     logging.info("Loading metadata...")
+    records = []
     for path in tqdm(json_list, desc="Load metadata", leave=False):
         if not MetaDataModel.is_loadable(path):
             logging.warning("Failed to load metadata file: {}, skipped".format(path))
             continue
         metadata = MetaDataModel()
         metadata.load(path)
-        handler.add_data(metadata.data)
+        records.append(metadata.data)
+        if len(records) >= _BATCH_SIZE:
+            _add_metadata(handler, records)
+            records = []
+    _add_metadata(handler, records)
     t2 = time.time()
     logging.info("Finished loading metadata.({0:.03f} secs)".format(t2 - t1))
 
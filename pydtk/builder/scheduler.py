@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+
+# Copyright Toolkit Authors
+
+"""Work scheduler for batch builders."""
+
+import heapq
+import json
+import logging
+import os
+import time
+from contextlib import ExitStack, contextmanager
+from multiprocessing import Pool
+
+from tqdm import tqdm
+
+
+class Task(object):
+    """A unit of work."""
+
+    def __init__(self, task_id, payload, weight=1.0):
+        """Initialize Task.
+
+        Args:
+            task_id (str): unique ID of the task (used for checkpointing)
+            payload (object): picklable data passed to the worker
+            weight (float): estimated cost of the task (e.g. file size)
+
+        """
+        self.task_id = task_id
+        self.payload = payload
+        self.weight = float(weight) if weight is not None else 1.0
+        self.attempts = 0
+
+
+def pack_chunks(tasks, num_chunks):
+    """Pack tasks into balanced chunks, largest first.
+
+    Each task is assigned to the currently lightest chunk in descending order of weight
+    (LPT scheduling), so that the total weights of the chunks are close to each other.
+
+    Args:
+        tasks (list): list of Task
+        num_chunks (int): number of chunks
+
+    Returns:
+        (list): list of chunks (list of Task) in descending order of total weight
+
+    """
+    num_chunks = max(1, min(int(num_chunks), len(tasks)))
+    chunks = [[] for _ in range(num_chunks)]
+    heap = [(0.0, i) for i in range(num_chunks)]
+    for task in sorted(tasks, key=lambda t: t.weight, reverse=True):
+        total, i = heapq.heappop(heap)
+        chunks[i].append(task)
+        heapq.heappush(heap, (total + task.weight, i))
+    chunks = [chunk for chunk in chunks if len(chunk) > 0]
+    return sorted(chunks, key=lambda c: sum(t.weight for t in c), reverse=True)
+
+
+class Checkpoint(object):
+    """Record of completed tasks stored in a JSON-lines file."""
+
+    def __init__(self, path):
+        """Initialize Checkpoint.
+
+        Args:
+            path (str): path to the checkpoint file (created if it does not exist)
+
+        """
+        self.path = path
+        self._completed = set()
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        self._completed.add(json.loads(line)["id"])
+                    except (ValueError, KeyError):
+                        # A line may be truncated if the previous run was killed
+                        continue
+
+    def __contains__(self, task_id):
+        """Check if the task has been completed."""
+        return task_id in self._completed
+
+    def __len__(self):
+        """Return the number of completed tasks."""
+        return len(self._completed)
+
+    def add(self, task_ids):
+        """Mark tasks as completed.
+
+        Args:
+            task_ids (list): list of task IDs
+
+        """
+        task_ids = [task_id for task_id in task_ids if task_id not in self._completed]
+        if len(task_ids) == 0:
+            return
+        with open(self.path, "a") as f:
+            for task_id in task_ids:
+                f.write(json.dumps({"id": task_id, "time": time.time()}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._completed.update(task_ids)
+
+
+_worker = None
+
+
+def _initialize_worker(worker_class, worker_kwargs):
+    global _worker
+    _worker = worker_class(**worker_kwargs)
+
+
+def _run_chunk(chunk):
+    """Run a chunk on the worker of this process.
+
+    Args:
+        chunk (list): list of (task_id, payload)
+
+    Returns:
+        (dict): task_id -> error message (None if succeeded)
+
+    """
+    try:
+        return _worker.process(chunk)
+    except Exception as e:
+        error = "{}: {}".format(type(e).__name__, e)
+        return {task_id: error for task_id, _ in chunk}
+
+
+class Scheduler(object):
+    """Run tasks on a pool of workers.
+
+    A worker is an instance of `worker_class` created once per process and reused for
+    all the chunks assigned to the process. It must implement `process(chunk)`, which takes
+    a list of (task_id, payload) and returns a dict mapping task_id to an error message
+    (None if the task succeeded).
+
+    """
+
+    def __init__(
+        self,
+        worker_class,
+        worker_kwargs=None,
+        num_jobs=1,
+        chunks_per_job=4,
+        max_retries=2,
+        checkpoint=None,
+        desc="Processing",
+    ):
+        """Initialize Scheduler.
+
+        Args:
+            worker_class (type): class of workers
+            worker_kwargs (dict): keyword arguments for initializing workers
+            num_jobs (int): number of worker processes
+            chunks_per_job (int): number of chunks per worker (more chunks balance better)
+            max_retries (int): maximum number of retries of a failed task
+            checkpoint (str): path to a checkpoint file to resume from
+            desc (str): description shown in the progress bar
+
+        """
+        self.worker_class = worker_class
+        self.worker_kwargs = worker_kwargs if worker_kwargs is not None else {}
+        self.num_jobs = max(1, int(num_jobs))
+        self.chunks_per_job = max(1, int(chunks_per_job))
+        self.max_retries = max(0, int(max_retries))
+        self.checkpoint = Checkpoint(checkpoint) if checkpoint is not None else None
+        self.desc = desc
+
+    @contextmanager
+    def _workers(self):
+        """Provide workers shared by all the rounds (retries) of a run.
+
+        The workers are started at the first call of the yielded function.
+
+        Yields:
+            (callable): function yielding results of chunks in the order of completion
+
+        """
+        workers = {}
+        with ExitStack() as stack:
+
+            def _map(chunks):
+                if self.num_jobs > 1:
+                    if "pool" not in workers.keys():
+                        workers["pool"] = stack.enter_context(
+                            Pool(
+                                self.num_jobs,
+                                initializer=_initialize_worker,
+                                initargs=(self.worker_class, self.worker_kwargs),
+                            )
+                        )
+                    yield from workers["pool"].imap_unordered(_run_chunk, chunks)
+                    return
+
+                if "worker" not in workers.keys():
+                    workers["worker"] = self.worker_class(**self.worker_kwargs)
+                for chunk in chunks:
+                    try:
+                        result = workers["worker"].process(chunk)
+                    except Exception as e:
+                        error = "{}: {}".format(type(e).__name__, e)
+                        result = {task_id: error for task_id, _ in chunk}
+                    yield result
+
+            yield _map
+
+    def run(self, tasks):
+        """Run tasks.
+
+        Args:
+            tasks (list): list of Task
+
+        Returns:
+            (dict): summary with keys 'succeeded', 'skipped', 'failed' (task_id -> error)
+                    and 'elapsed'
+
+        """
+        tasks_by_id = {}
+        num_skipped = 0
+        for task in tasks:
+            if self.checkpoint is not None and task.task_id in self.checkpoint:
+                num_skipped += 1
+                continue
+            tasks_by_id[task.task_id] = task
+        if num_skipped > 0:
+            logging.info("Skipped {} tasks completed in the previous run".format(num_skipped))
+
+        succeeded, failed = 0, {}
+        t_b = time.time()
+        done_weight = 0.0
+        pending = list(tasks_by_id.values())
+        with self._workers() as _map, tqdm(
+            total=len(pending), desc=self.desc, leave=False
+        ) as progress:
+            while len(pending) > 0:
+                chunks = pack_chunks(pending, self.num_jobs * self.chunks_per_job)
+                chunks = [[(task.task_id, task.payload) for task in chunk] for chunk in chunks]
+                pending = []
+                for result in _map(chunks):
+                    completed = []
+                    for task_id, error in result.items():
+                        task = tasks_by_id[task_id]
+                        task.attempts += 1
+                        if error is None:
+                            completed.append(task_id)
+                            failed.pop(task_id, None)
+                            done_weight += task.weight
+                            progress.update(1)
+                        elif task.attempts <= self.max_retries:
+                            logging.warning(
+                                "Task {} failed (attempt {}): {}".format(
+                                    task_id, task.attempts, error
+                                )
+                            )
+                            failed[task_id] = error
+                            pending.append(task)
+                        else:
+                            logging.error("Task {} failed: {}".format(task_id, error))
+                            failed[task_id] = error
+                            progress.update(1)
+                    succeeded += len(completed)
+                    if self.checkpoint is not None:
+                        self.checkpoint.add(completed)
+
+                    elapsed = max(time.time() - t_b, 1e-9)
+                    progress.set_postfix(
+                        tasks_per_sec="{:.2f}".format(succeeded / elapsed),
+                        weight_per_sec="{:.3g}".format(done_weight / elapsed),
+                    )
+
+        elapsed = time.time() - t_b
+        logging.info(
+            "Processed {} tasks in {:.03f} secs ({:.2f} tasks/s, {:.3g} weight/s)".format(
+                succeeded,
+                elapsed,
+                succeeded / max(elapsed, 1e-9),
+                done_weight / max(elapsed, 1e-9),
+            )
+            + " (failed: {}, skipped: {})".format(len(failed), num_skipped)
+        )
+        return {
+            "succeeded": succeeded,
+            "skipped": num_skipped,
+            "failed": failed,
+            "elapsed": elapsed,
+        }
@@ -4,23 +4,279 @@
 
 
 import logging
+import os
 import time
-from functools import partial
-from multiprocessing import Pool
 
 import fire
-from tqdm import tqdm
+import pandas as pd
 
+from pydtk.builder.job_queue import JobQueue, run_workers
+from pydtk.builder.scheduler import Scheduler, Task
 from pydtk.db import V3DBHandler as DBHandler
 from pydtk.io import BaseFileReader
 from pydtk.statistics import BaseStatisticCalculation
+from pydtk.utils.utils import deserialize_dict_1d
 
 
-def _analysis(*args, **kwargs):
+class _BulkWriter(object):
+    """Buffer statistic tables and write them to DB with a small number of saves."""
+
+    def __init__(self, handler, max_rows=100000):
+        """Initialize _BulkWriter.
+
+        Args:
+            handler (StatisticsDBHandler): handler of the output DB
+            max_rows (int): maximum number of rows per save
+
+        """
+        self._handler = handler
+        self._max_rows = max_rows
+        self._dfs = []
+        self._keys = set()
+        self._num_rows = 0
+
+    def add(self, df):
+        """Add a statistic table to the buffer.
+
+        Args:
+            df (pd.DataFrame): statistic table with columns 'record_id' and 'timestamp'
+
+        """
+        keys = set(zip(df["record_id"].tolist(), df["timestamp"].tolist()))
+
+        # Rows sharing (record_id, timestamp) share the same UUID, so they must not be
+        # saved together, otherwise only the last one would be stored
+        if not keys.isdisjoint(self._keys) or self._num_rows + len(df) > self._max_rows:
+            self.flush()
+
+        self._dfs.append(df)
+        self._keys.update(keys)
+        self._num_rows += len(df)
+
+    def flush(self):
+        """Write the buffered tables to DB."""
+        if len(self._dfs) == 0:
+            return
+        self._handler.df = pd.concat(self._dfs, ignore_index=True, sort=False)
+        self._handler.save()
+        self._dfs, self._keys, self._num_rows = [], set(), 0
+
+
+def _file_signature(path):
+    """Return size and modification time of a file.
+
+    Args:
+        path (str): path to the file
+
+    Returns:
+        (tuple): (size, mtime), or (None, None) if the file does not exist
+
+    """
     try:
-        main(*args, **kwargs)
-    except Exception as e:
-        print(e)
+        stat = os.stat(path)
+    except OSError:
+        return None, None
+    return float(stat.st_size), float(stat.st_mtime)
+
+
+def _is_up_to_date(state, current):
+    """Check if the statistics recorded in `state` were computed from `current`.
+
+    Args:
+        state (dict): a row of the state table
+        current (dict): state of the current source file and metadata
+
+    Returns:
+        (bool): True if nothing has changed since the last calculation
+
+    """
+    if state is None or current["file_size"] is None:
+        return False
+    if state["meta_uuid"] != current["meta_uuid"]:
+        return False
+    for key in ["file_size", "file_mtime", "meta_creation_time"]:
+        if state[key] is None or pd.isna(state[key]):
+            return False
+        if abs(float(state[key]) - current[key]) > 1e-3:
+            return False
+    return True
+
+
+def _plan_tasks(meta_db_handler, span, states=None):
+    """Make a task for each file and content in the meta DB.
+
+    Args:
+        meta_db_handler (MetaDBHandler): handler of the meta DB
+        span (float): Size of divided frame[sec]
+        states (dict): states of the previous calculation; tasks of files that have not
+                       changed since then are skipped
+
+    Returns:
+        (tuple): list of Task, and number of the skipped tasks
+
+    """
+    tasks, num_skipped = [], 0
+    meta_df = meta_db_handler.df
+    for meta_uuid, row in zip(meta_df.index.tolist(), meta_df.to_dict(orient="records")):
+        # Values of the task and its state are taken from the same row of the meta DB
+        meta_creation_time = row.pop("creation_time_in_df", None)
+        row.pop("uuid_in_df", None)
+        relative_path, content = row["path"], row["contents"]
+        item = meta_db_handler._deserialize_contents_and_solve_path(deserialize_dict_1d(row))
+        key = (item["record_id"], relative_path, content)
+        file_size, file_mtime = _file_signature(item["path"])
+        current = {
+            "record_id": key[0],
+            "path": key[1],
+            "contents": key[2],
+            "span": span,
+            "file_size": file_size,
+            "file_mtime": file_mtime,
+            "meta_uuid": meta_uuid,
+            "meta_creation_time": meta_creation_time,
+        }
+        previous = states.get(key, None) if states is not None else None
+        if previous is not None and _is_up_to_date(previous, current):
+            num_skipped += 1
+            continue
+
+        # Files are read as a whole regardless of the content, so the cost is estimated
+        # from the file size, falling back to the number of messages
+        weight = file_size
+        if weight is None:
+            weight = item["contents"].get(content, {}).get("msg_count", None)
+        # Statistics computed before from the changed file are replaced
+        payload = {"item": item, "state": current, "replace": previous is not None}
+        tasks.append(Task("|".join(key), payload, weight=weight or 1.0))
+    return tasks, num_skipped
+
+
+class _StatisticsWorker(object):
+    """Calculate statistics of files and write them to DB, reusing readers and handlers."""
+
+    def __init__(
+        self,
+        database_id,
+        span=60.0,
+        output_db_engine=None,
+        output_db_host=None,
+        output_db_username=None,
+        output_db_password=None,
+        output_db_name=None,
+        sketches=False,
+        relative_accuracy=0.01,
+        histogram_edges=None,
+        incremental=False,
+        bulk_size=100000,
+    ):
+        """Initialize _StatisticsWorker.
+
+        Args:
+            database_id (str): ID of the target database
+            span (float): Size of divided frame[sec]
+            output_db_engine (str): Database engine for storing statistics data
+            output_db_host (str): HOST of database of statistics data
+            output_db_username (str): Username for the database of statistics data
+            output_db_password (str): Password for the database of statistics data
+            output_db_name (str): Database name of statistics data
+            sketches (bool): Store mergeable quantile sketches (and histograms) as well
+            relative_accuracy (float): Relative accuracy of quantile sketches
+            histogram_edges (list): Bin edges of histograms
+            incremental (bool): Record states of the calculation
+            bulk_size (int): Maximum number of rows written to DB at once
+
+        """
+        self._reader = BaseFileReader()
+        self._calculator = BaseStatisticCalculation(
+            span,
+            sync_timestamps=True,
+            sketches=sketches,
+            relative_accuracy=relative_accuracy,
+            histogram_edges=histogram_edges,
+        )
+        db_kwargs = {
+            "db_engine": output_db_engine,
+            "db_host": output_db_host,
+            "db_name": output_db_name,
+            "db_username": output_db_username,
+            "db_password": output_db_password,
+            "database_id": database_id,
+            "span": span,
+            "read_on_init": False,
+        }
+        self._stat_db_handler = DBHandler(db_class="statistics", **db_kwargs)
+        self._state_db_handler = None
+        if incremental:
+            self._state_db_handler = DBHandler(db_class="statistics_state", **db_kwargs)
+        self._bulk_size = bulk_size
+
+    def process(self, chunk):
+        """Calculate statistics of the files in a chunk.
+
+        Args:
+            chunk (list): list of (task_id, payload)
+
+        Returns:
+            (dict): task_id -> error message (None if succeeded)
+
+        """
+        results, states = {}, []
+        writer = _BulkWriter(self._stat_db_handler, max_rows=self._bulk_size)
+        try:
+            for task_id, payload in chunk:
+                item = payload["item"]
+                try:
+                    timestamps, data, columns = self._reader.read(metadata=item)
+                    stat_df = self._calculator.statistic_tables(timestamps, data, columns)
+                    stat_df.insert(0, "record_id", item["record_id"])
+                except Exception as e:
+                    results[task_id] = "{}: {}".format(type(e).__name__, e)
+                    continue
+                if payload.get("replace", False):
+                    # Old rows of the file may be in the buffer, so it is written first
+                    writer.flush()
+                    columns = [c for c in stat_df.columns if c not in ["record_id", "timestamp"]]
+                    self._stat_db_handler.remove_rows(item["record_id"], columns)
+                writer.add(stat_df)
+                states.append(payload["state"])
+                results[task_id] = None
+
+            # Write the remaining tables, then record what they were computed from
+            writer.flush()
+            if self._state_db_handler is not None and len(states) > 0:
+                self._state_db_handler.df = pd.DataFrame(states)
+                self._state_db_handler.save()
+        except Exception as e:
+            # Tables of the succeeded tasks may not have been written
+            error = "{}: {}".format(type(e).__name__, e)
+            results = {task_id: results.get(task_id, None) or error for task_id, _ in chunk}
+        return results
+
+
+def _load_states(database_id, span, where=None, **db_kwargs):
+    """Load states of the previous calculation.
+
+    Args:
+        database_id (str): ID of the target database
+        span (float): Size of divided frame[sec]
+        where (str): condition to filter states
+
+    Returns:
+        (dict): (record_id, path, contents) -> state
+
+    """
+    state_db_handler = DBHandler(
+        db_class="statistics_state",
+        database_id=database_id,
+        span=span,
+        read_on_init=False,
+        **db_kwargs,
+    )
+    state_db_handler.read(where=where)
+    return {
+        (state["record_id"], state["path"], state["contents"]): state
+        for state in state_db_handler.df.to_dict(orient="records")
+    }
 
 
 def batch_analysis(
@@ -38,10 +294,26 @@ def batch_analysis(
     output_db_username=None,
     output_db_password=None,
     output_db_name=None,
+    sketches=False,
+    relative_accuracy=0.01,
+    histogram_edges=None,
+    incremental=False,
+    bulk_size=100000,
+    chunks_per_job=4,
+    max_retries=2,
+    checkpoint=None,
+    queue_dir=None,
+    lease=600.0,
     verbose=False,
 ):
     """Make Statistics Dataframe Table with all contents.
 
+    Tasks (a pair of a file and a content) are packed into chunks of similar total file
+    size, largest first, and processed by `num_jobs` workers each of which keeps its own
+    file reader and DB handlers.
+    If `queue_dir` is given, the tasks are put into a job queue on a shared filesystem instead,
+    so that workers on several hosts running the same command can process them together.
+
     Args:
         database_id (str): ID of the target database (e.g. "Driving Behavior Database")
         span (float): Size of divided frame[sec]
@@ -57,27 +329,26 @@ def batch_analysis(
         output_db_username (str): Username for the database of statistics data
         output_db_password (str): Password for the database of statistics data
         output_db_name (str): Database name of statistics data
+        sketches (bool): Store mergeable quantile sketches (and histograms) as well
+        relative_accuracy (float): Relative accuracy of quantile sketches
+        histogram_edges (list): Bin edges of histograms (histograms are skipped if None)
+        incremental (bool): Only recompute statistics of new or changed files
+        bulk_size (int): Maximum number of rows written to DB at once
+        chunks_per_job (int): Number of chunks per job
+        max_retries (int): Maximum number of retries of a failed task
+        checkpoint (str): Path to a file recording completed tasks, to resume an interrupted run
+        queue_dir (str): Path to a job queue directory shared among hosts
+        lease (float): Seconds until a job claimed by an unresponsive worker is taken over
         verbose (bool): Verbose mode
 
+    Returns:
+        (dict): summary of the run (number of jobs in each state if `queue_dir` is given)
+
     """
-    # Prepare method
-    analysis = partial(
-        _analysis,
-        database_id,
-        span=span,
-        meta_db_base_dir=meta_db_base_dir,
-        meta_db_engine=meta_db_engine,
-        meta_db_host=meta_db_host,
-        meta_db_username=meta_db_username,
-        meta_db_password=meta_db_password,
-        meta_db_name=meta_db_name,
-        output_db_engine=output_db_engine,
-        output_db_host=output_db_host,
-        output_db_username=output_db_username,
-        output_db_password=output_db_password,
-        output_db_name=output_db_name,
-        verbose=verbose,
-    )
+    if verbose:
+        logging.basicConfig(level=logging.DEBUG)
+    else:
+        logging.basicConfig(level=logging.ERROR)
 
     # Load meta DB
     meta_db_handler = DBHandler(
@@ -90,13 +361,53 @@ def batch_analysis(
         database_id=database_id,
         base_dir_path=meta_db_base_dir,
     )
+    output_db_kwargs = {
+        "db_engine": output_db_engine,
+        "db_host": output_db_host,
+        "db_name": output_db_name,
+        "db_username": output_db_username,
+        "db_password": output_db_password,
+    }
+    states = _load_states(database_id, span, **output_db_kwargs) if incremental else None
+    tasks, num_skipped = _plan_tasks(meta_db_handler, span, states=states)
+    logging.info("Planned {} tasks (up to date: {})".format(len(tasks), num_skipped))
 
-    # Get list of contents
-    contents = meta_db_handler.df["contents"].to_list()
+    worker_kwargs = {
+        "database_id": database_id,
+        "span": span,
+        "output_db_engine": output_db_engine,
+        "output_db_host": output_db_host,
+        "output_db_username": output_db_username,
+        "output_db_password": output_db_password,
+        "output_db_name": output_db_name,
+        "sketches": sketches,
+        "relative_accuracy": relative_accuracy,
+        "histogram_edges": histogram_edges,
+        "incremental": incremental,
+        "bulk_size": bulk_size,
+    }
+    if queue_dir is not None:
+        queue = JobQueue(queue_dir, lease=lease, max_retries=max_retries)
+        logging.info("Added {} jobs to the queue".format(queue.put(tasks)))
+        return run_workers(
+            queue_dir,
+            _StatisticsWorker,
+            worker_kwargs=worker_kwargs,
+            num_jobs=num_jobs,
+            lease=lease,
+            max_retries=max_retries,
+        )
 
-    # Process one-by-one
-    with Pool(num_jobs) as pool:
-        pool.map(analysis, contents)
+    scheduler = Scheduler(
+        _StatisticsWorker,
+        worker_kwargs=worker_kwargs,
+        num_jobs=num_jobs,
+        chunks_per_job=chunks_per_job,
+        max_retries=max_retries,
+        checkpoint=checkpoint,
+        desc="Load files, calculate and write",
+    )
+    return scheduler.run(tasks)
 
 
 def main(
@@ -114,6 +425,11 @@ def main(
     output_db_username=None,
     output_db_password=None,
     output_db_name=None,
+    sketches=False,
+    relative_accuracy=0.01,
+    histogram_edges=None,
+    incremental=False,
+    bulk_size=100000,
     verbose=False,
 ):
     """Make Statistics Dataframe Table.
@@ -133,6 +449,12 @@ def main(
         output_db_username (str): Username for the database of statistics data
         output_db_password (str): Password for the database of statistics data
         output_db_name (str): Database name of statistics data
+        sketches (bool): Store mergeable quantile sketches (and histograms) as well
+        relative_accuracy (float): Relative accuracy of quantile sketches
+        histogram_edges (list): Bin edges of histograms (histograms are skipped if None)
+        incremental (bool): Only recompute statistics of files whose size, mtime or metadata
+                            changed since the last run
+        bulk_size (int): Maximum number of rows written to DB at once
         verbose (bool): Verbose mode
 
     """
@@ -156,41 +478,50 @@ def main(
         read_on_init=False,
     )
     logging.info("Loading content: {}".format(q_content))
-    meta_db_handler.read(where='contents like "{}"'.format(q_content))
-    reader = BaseFileReader()
-    calculator = BaseStatisticCalculation(span, sync_timestamps=True)
+    where = 'contents like "{}"'.format(q_content)
+    meta_db_handler.read(where=where)
+    worker = _StatisticsWorker(
+        database_id,
+        span=span,
+        output_db_engine=output_db_engine,
+        output_db_host=output_db_host,
+        output_db_username=output_db_username,
+        output_db_password=output_db_password,
+        output_db_name=output_db_name,
+        sketches=sketches,
+        relative_accuracy=relative_accuracy,
+        histogram_edges=histogram_edges,
+        incremental=incremental,
+        bulk_size=bulk_size,
+    )
     t_n, t_p = time.time(), t_n
     logging.info("Loaded index and filtered files.({0:.03f} secs)".format(t_n - t_p))
 
-    # Initialize DB-Handler
-    stat_db_handler = DBHandler(
-        db_class="statistics",
-        db_engine=output_db_engine,
-        db_host=output_db_host,
-        db_name=output_db_name,
-        db_username=output_db_username,
-        db_password=output_db_password,
-        database_id=database_id,
-        span=span,
-        read_on_init=False,
-    )
+    # Load the state of the previous calculation
+    states = None
+    if incremental:
+        states = _load_states(
+            database_id,
+            span,
+            where=where,
+            db_engine=output_db_engine,
+            db_host=output_db_host,
+            db_name=output_db_name,
+            db_username=output_db_username,
+            db_password=output_db_password,
+        )
+    tasks, num_skipped = _plan_tasks(meta_db_handler, span, states=states)
 
     # Read data and write calculated data in DB
-    def write_stat_to_db(item):
-        # Load data from file and get statistical table
-        timestamps, data, columns = reader.read(metadata=item)
-        stat_df = calculator.statistic_tables(timestamps, data, columns)
-        stat_df.insert(0, "record_id", item["record_id"])
-
-        # Write to DB
-        stat_db_handler.df = stat_df
-        stat_db_handler.save()
-
-    tqdm.pandas(desc="Load files, calculate and write")
-    for sample in meta_db_handler:
-        write_stat_to_db(sample)
+    results = worker.process([(task.task_id, task.payload) for task in tasks])
+    for task_id, error in results.items():
+        if error is not None:
+            raise RuntimeError("Failed to calculate statistics of {}: {}".format(task_id, error))
     t_n, t_p = time.time(), t_n
-    logging.info("Calculated statistics and wrote to DB.({0:.03f} secs)".format(t_n - t_p))
+    logging.info(
+        "Calculated statistics and wrote to DB.({0:.03f} secs)".format(t_n - t_p)
+        + " (calculated: {0}, skipped: {1})".format(len(tasks), num_skipped)
+    )
 
     logging.info("Done.(Total: {0:.03f} secs)".format(t_n - t_b))
 
@@ -8,7 +8,11 @@
 # Handlers
 from .handlers import BaseDBHandler as DBHandler  # NOQA
 from .handlers.meta import MetaDBHandler  # NOQA
-from .handlers.statistics import StatisticsCassandraDBHandler, StatisticsDBHandler  # NOQA
+from .handlers.statistics import (  # NOQA
+    StatisticsCassandraDBHandler,
+    StatisticsDBHandler,
+    StatisticsStateDBHandler,
+)
 from .handlers.time_series import TimeSeriesCassandraDBHandler, TimeSeriesDBHandler  # NOQA
 
 # Search engines
@@ -6,6 +6,8 @@
 import hashlib
 import os
 
+from sqlalchemy import inspect, sql
+
 from . import register_handler
 from .time_series import TimeSeriesCassandraDBHandler, TimeSeriesDBHandler
 
@@ -77,6 +79,51 @@ class StatisticsDBHandler(TimeSeriesDBHandler):
         """Setter for self._df_name."""
         raise RuntimeError("Setting df_name is not supported in StatisticsDBHandler")
 
+    def remove_rows(self, record_id, columns, chunk_size=100):
+        """Remove rows of a record having a value in any of the given columns from DB.
+
+        Args:
+            record_id (str): record ID
+            columns (list): names of statistic columns (e.g. 'x/mean')
+            chunk_size (int): number of columns checked by a statement
+
+        """
+        if not inspect(self._engine).has_table(self.df_name):
+            return
+        columns = sorted(set(columns).intersection(self._get_column_names_from_db()))
+        table = sql.table(self.df_name, *[sql.column(c) for c in ["record_id"] + columns])
+        for i in range(0, len(columns), chunk_size):
+            conditions = [table.c[c].isnot(None) for c in columns[i : i + chunk_size]]
+            self._engine.execute(
+                table.delete().where(table.c.record_id == record_id).where(sql.or_(*conditions))
+            )
+
+
+@register_handler(db_classes=["statistics_state"], db_engines=["sqlite", "mysql", "mariadb"])
+class StatisticsStateDBHandler(StatisticsDBHandler):
+    """DB Handler for the state of incremental statistics calculation.
+
+    Each row records the source file and the metadata that the statistics of
+    a (record_id, path, contents, span) were computed from.
+
+    """
+
+    _df_class = "statistics_state_df"
+
+    @property
+    def _df_name(self):
+        """Return _df_name."""
+        template = self._config[self._df_class]["df_name"]
+        database_id_hashed = hashlib.blake2s(
+            self._database_id.encode("utf-8"), digest_size=self._config.hash.digest_size
+        ).hexdigest()
+        return template.format(**{"database_id": database_id_hashed, "span": self._span})
+
+    @_df_name.setter
+    def _df_name(self, value):
+        """Setter for self._df_name."""
+        raise RuntimeError("Setting df_name is not supported in StatisticsStateDBHandler")
+
 
 @register_handler(db_classes=["statistics"], db_engines=["cassandra"])
 class StatisticsCassandraDBHandler(TimeSeriesCassandraDBHandler):
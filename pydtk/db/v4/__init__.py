@@ -5,6 +5,9 @@
 
 """V4DB."""
 
+# Engines
+from .engines import close_connections  # NOQA
+
 # Handlers
 from .handlers import BaseDBHandler as DBHandler  # NOQA
 from .handlers.annotation import AnnotationDBHandler  # NOQA
@@ -5,22 +5,363 @@
 
 """V4DBHandler."""
 
+import base64
 import importlib
+import json
 import logging
 import os
+import threading
+from datetime import datetime
+from numbers import Number
+
+from ._index import _MISSING, get_value
 
 DB_ENGINES = {}  # key: db_class, value: dict( key: db_engine, value: handler )
 
 logger = logging.getLogger(__name__)
 
+_CONNECTIONS = {}  # key: (engine, host, ...), value: (connection, function to close it)
+_CONNECTIONS_LOCK = threading.Lock()
+
+
+def get_connection(key, factory, close=None, validate=None):
+    """Return a connection shared in this process, creating it if needed.
+
+    Args:
+        key (tuple): key of the connection starting with the engine name
+                     (e.g. ('mongodb', host, port, username, password))
+        factory (callable): function creating a new connection
+        close (callable): function closing a connection
+        validate (callable): function returning False if a pooled connection is not usable anymore
+
+    Returns:
+        (any): connection
+
+    """
+    with _CONNECTIONS_LOCK:
+        if key in _CONNECTIONS.keys():
+            connection, _close = _CONNECTIONS[key]
+            if validate is None or validate(connection):
+                return connection
+            del _CONNECTIONS[key]
+            _close_connection(connection, _close)
+        connection = factory()
+        _CONNECTIONS[key] = (connection, close)
+        return connection
+
+
+def close_connections(engine=None):
+    """Close connections shared in this process.
+
+    Args:
+        engine (str): name of the engine whose connections are closed (if None, all)
+
+    """
+    with _CONNECTIONS_LOCK:
+        for key in list(_CONNECTIONS.keys()):
+            if engine is None or key[0] == engine:
+                _close_connection(*_CONNECTIONS.pop(key))
+
+
+def _close_connection(connection, close):
+    if close is None:
+        return
+    try:
+        close(connection)
+    except Exception as e:
+        logger.warning("Failed to close connection: {}".format(e))
+
+
+def _reset_connections():
+    """Forget connections inherited from the parent process (they must not be shared)."""
+    global _CONNECTIONS_LOCK
+    _CONNECTIONS.clear()
+    _CONNECTIONS_LOCK = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_connections)
+
+
+def same_file(handle, path):
+    """Check if an open file still exists at the path (i.e. not removed or replaced).
+
+    Args:
+        handle (file): file object
+        path (str): path to the file
+
+    Returns:
+        (bool): True if the file at the path is the opened one
+
+    """
+    try:
+        if handle.closed:
+            return False
+        stat, fstat = os.stat(path), os.fstat(handle.fileno())
+    except (OSError, ValueError):
+        return False
+    return (stat.st_dev, stat.st_ino) == (fstat.st_dev, fstat.st_ino)
+
+
+def get_projection(fields=None, exclude=None):
+    """Return a MongoDB-style projection of fields.
+
+    Args:
+        fields (list): names of the fields to fetch (`_uuid` is always fetched)
+        exclude (list): names of the fields not to fetch
+
+    Returns:
+        (dict): projection, or None if all the fields are fetched
+
+    """
+    if fields is not None and exclude is not None:
+        raise ValueError("Either fields or exclude can be specified")
+    if fields is not None:
+        return {**{field: 1 for field in fields}, "_uuid": 1}
+    if exclude is not None:
+        if "_uuid" in exclude:
+            raise ValueError('"_uuid" cannot be excluded')
+        return {field: 0 for field in exclude}
+    return None
+
+
+def apply_projection(document, projection):
+    """Apply a projection to a document, for engines without projections.
+
+    Args:
+        document (dict): document (not modified)
+        projection (dict): projection made by `get_projection`
+
+    Returns:
+        (dict): projected document sharing nested values with the given one
+
+    """
+    if projection is None:
+        return document
+    if any(projection.values()):
+        projected = {}
+        for field in projection.keys():
+            keys = field.split(".")
+            source, destination = document, projected
+            for key in keys[:-1]:
+                if not isinstance(source, dict) or key not in source.keys():
+                    break
+                source = source[key]
+                destination = destination.setdefault(key, {})
+            else:
+                if isinstance(source, dict) and keys[-1] in source.keys():
+                    destination[keys[-1]] = source[keys[-1]]
+        return projected
+
+    projected = dict(document)
+    for field in projection.keys():
+        keys = field.split(".")
+        destination = projected
+        for key in keys[:-1]:
+            if not isinstance(destination.get(key, None), dict):
+                break
+            destination[key] = dict(destination[key])
+            destination = destination[key]
+        else:
+            destination.pop(keys[-1], None)
+    return projected
+
+
+def keyset_order(order_by=None):
+    """Return the sort order used for keyset pagination.
+
+    `_uuid` is appended as a tie-breaker so that records are in a total order.
+
+    Args:
+        order_by (list): column name to sort by with format [ ( column1, 1 or -1 ), ... ]
+
+    Returns:
+        (list): list of (key, direction) ending with `_uuid`
+
+    """
+    order = [(item[0], int(item[1])) for item in order_by or []]
+    if "_uuid" not in [key for key, _ in order]:
+        order.append(("_uuid", 1))
+    return order
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and list(value.keys()) == ["$date"]:
+        return datetime.fromisoformat(value["$date"])
+    return value
+
+
+def encode_cursor(record, order_by=None):
+    """Encode the position of a record into a cursor token for `read(after=...)`.
+
+    Args:
+        record (dict): the last record of a page
+        order_by (list): sort order of the page
+
+    Returns:
+        (str): cursor token
+
+    """
+    order = keyset_order(order_by)
+    values = [get_value(record, key) for key, _ in order]
+    values = [None if value is _MISSING else _encode_value(value) for value in values]
+    payload = json.dumps({"keys": order, "values": values}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(token, order_by=None):
+    """Decode a cursor token made by `encode_cursor`.
+
+    Args:
+        token (str): cursor token
+        order_by (list): sort order of the page (must be the one of the token)
+
+    Returns:
+        (list): values of the keys in `keyset_order(order_by)`
+
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode("ascii")).decode("utf-8"))
+        keys, values = payload["keys"], payload["values"]
+    except (ValueError, KeyError, TypeError, AttributeError):
+        raise ValueError("Invalid cursor: {}".format(token))
+    if [list(key) for key in keyset_order(order_by)] != keys:
+        raise ValueError("The cursor was made with a different order: {}".format(keys))
+    return [_decode_value(value) for value in values]
+
+
+def keyset_query(order_by, values):
+    """Return a MongoDB-style query selecting records after a position.
+
+    Null and missing values are sorted before any other values as MongoDB does,
+    whereas they are not matched by `$gt` or `$lt`, so they are selected explicitly.
+
+    Args:
+        order_by (list): list of (key, direction) made by `keyset_order`
+        values (list): values of the keys at the position
+
+    Returns:
+        (dict): query
+
+    """
+    clauses = []
+    for i, (key, direction) in enumerate(order_by):
+        clause = {k: v for (k, _), v in zip(order_by[:i], values[:i])}
+        if direction >= 0 and values[i] is None:
+            clause[key] = {"$ne": None}
+        elif direction >= 0:
+            clause[key] = {"$gt": values[i]}
+        elif values[i] is None:
+            continue  # nothing comes after null in descending order
+        else:
+            clause["$or"] = [{key: {"$lt": values[i]}}, {key: None}]
+        clauses.append(clause)
+    if len(clauses) == 0:
+        return {"_uuid": {"$in": []}}
+    return {"$or": clauses} if len(clauses) > 1 else clauses[0]
+
+
+def _sort_key(value):
+    """Return a key ordering values of different types as MongoDB does."""
+    if value is None or value is _MISSING:
+        return 0, 0
+    if isinstance(value, bool):
+        return 5, value
+    if isinstance(value, Number):
+        return 1, value
+    if isinstance(value, str):
+        return 2, value
+    if isinstance(value, datetime):
+        return 6, value.timestamp()
+    return 3, json.dumps(value, sort_keys=True, default=str)
+
+
+class _Descending(object):
+    """Wrapper reversing the order of a sort key."""
+
+    __slots__ = ["key"]
+
+    def __init__(self, key):
+        self.key = key
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+
+def _values_key(values, order_by):
+    return tuple(
+        _sort_key(value) if direction >= 0 else _Descending(_sort_key(value))
+        for value, (_, direction) in zip(values, order_by)
+    )
+
+
+def _document_key(document, order_by):
+    return _values_key([get_value(document, key) for key, _ in order_by], order_by)
+
+
+def sort_documents(documents, order_by):
+    """Sort documents by multiple keys, for engines without sorting.
+
+    Args:
+        documents (list): list of documents
+        order_by (list): column name to sort by with format [ ( column1, 1 or -1 ), ... ]
+
+    Returns:
+        (list): sorted documents
+
+    """
+    order = [(item[0], int(item[1])) for item in order_by]
+    return sorted(documents, key=lambda document: _document_key(document, order))
+
+
+def paginate(documents, order_by=None, limit=None, offset=None, after=None):
+    """Sort and paginate documents, for engines without pagination.
+
+    Documents are sorted by `keyset_order(order_by)` if a page is requested,
+    so that the pages can be continued with cursors.
+
+    Args:
+        documents (list): list of documents matching a query
+        order_by (list): column name to sort by with format [ ( column1, 1 or -1 ), ... ]
+        limit (int): number of items to return per a page
+        offset (int): offset of cursor
+        after (str): cursor token made by `encode_cursor`
+
+    Returns:
+        (list): documents in the page
+
+    """
+    if after is not None or (limit is not None and limit > 0):
+        order_by = keyset_order(order_by)
+    if order_by is not None:
+        documents = sort_documents(documents, order_by)
+    if after is not None:
+        position = _values_key(decode_cursor(after, order_by), order_by)
+        documents = [
+            document for document in documents if position < _document_key(document, order_by)
+        ]
+    offset = offset if offset is not None else 0
+    if limit is not None and limit > 0:
+        return documents[offset : offset + limit]
+    return documents[offset:]
+
 
 def register_engines():
     """Register engines."""
     for filename in os.listdir(os.path.join(os.path.dirname(__file__))):
         if not os.path.isfile(os.path.join(os.path.dirname(__file__), filename)):
             continue
-        if filename == "__init__.py":
-            continue
+        if filename.startswith("_"):
+            continue  # __init__.py and helper modules
 
         try:
             engine_name = str(os.path.splitext(filename)[0])
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright Toolkit Authors
+
+"""In-process aggregation for DB-engines without `$group`."""
+
+import json
+from numbers import Number
+
+from . import _sort_key
+from ._index import _MISSING, get_value
+
+
+def get_accumulators(handler, group_by, order_by=None, fields=None, exclude=None):
+    """Return the accumulator of each column for grouping records.
+
+    Columns are aggregated by `aggregation` in the column configs (`first` by default).
+
+    Args:
+        handler (BaseDBHandler): DBHandler
+        group_by (str): key to group by
+        order_by (list): column name to sort by with format [ ( column1, 1 or -1 ), ... ]
+        fields (list): names of the fields to fetch
+        exclude (list): names of the fields not to fetch
+
+    Returns:
+        (dict): column name -> name of the accumulator (e.g. 'first', 'push')
+
+    """
+    configs = {}
+    if handler is not None and "columns" in handler.config.keys():
+        for config in handler.config["columns"]:
+            if isinstance(config, dict) and "name" in config.keys():
+                configs.setdefault(config["name"], config)
+
+    if fields is not None:
+        columns = set([field.split(".")[0] for field in fields] + ["_uuid"])
+    else:
+        columns = set(configs.keys()).union(["_uuid", "_creation_time"])
+        if handler is not None:
+            columns = columns.union(handler.columns)
+        if exclude is not None:
+            columns = columns.difference(exclude)
+    columns = columns.union([item[0].split(".")[0] for item in order_by or []])
+    columns.add(group_by.split(".")[0])
+
+    return {
+        column: configs.get(column, {}).get("aggregation", "first") for column in sorted(columns)
+    }
+
+
+def _present(values):
+    return [value for value in values if value is not _MISSING]
+
+
+def _first(values):
+    return values[0] if len(values) > 0 and values[0] is not _MISSING else None
+
+
+def _last(values):
+    return values[-1] if len(values) > 0 and values[-1] is not _MISSING else None
+
+
+def _push(values):
+    return _present(values)
+
+
+def _add_to_set(values):
+    unique = {}
+    for value in _present(values):
+        unique.setdefault(_hash_key(value), value)
+    return list(unique.values())
+
+
+def _merge_objects(values):
+    merged = {}
+    for value in values:
+        if isinstance(value, dict):
+            merged.update(value)
+    return merged
+
+
+def _comparable(values):
+    return [value for value in _present(values) if value is not None]
+
+
+def _min(values):
+    values = _comparable(values)
+    return min(values, key=_sort_key) if len(values) > 0 else None
+
+
+def _max(values):
+    values = _comparable(values)
+    return max(values, key=_sort_key) if len(values) > 0 else None
+
+
+def _numbers(values):
+    return [v for v in values if isinstance(v, Number) and not isinstance(v, bool)]
+
+
+def _sum(values):
+    return sum(_numbers(values))
+
+
+def _avg(values):
+    values = _numbers(values)
+    return sum(values) / len(values) if len(values) > 0 else None
+
+
+ACCUMULATORS = {
+    "first": _first,
+    "last": _last,
+    "push": _push,
+    "addToSet": _add_to_set,
+    "mergeObjects": _merge_objects,
+    "min": _min,
+    "max": _max,
+    "sum": _sum,
+    "avg": _avg,
+}
+
+
+def _hash_key(value):
+    """Return a hashable key of a value (values equal in MongoDB have the same key)."""
+    if isinstance(value, bool):
+        return "bool", value
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return "json", json.dumps(value, sort_keys=True, default=str)
+
+
+def group_documents(documents, group_by, accumulators):
+    """Group documents by a key with hash grouping.
+
+    Groups are in the order of their first documents, and each column is aggregated at once.
+
+    Args:
+        documents (list): list of documents
+        group_by (str): key to group by
+        accumulators (dict): column name -> name of the accumulator
+
+    Returns:
+        (list): list of aggregated documents
+
+    """
+    for accumulator in accumulators.values():
+        if accumulator not in ACCUMULATORS.keys():
+            raise ValueError("Unsupported aggregation: {}".format(accumulator))
+
+    group_indices, groups = [], {}
+    for document in documents:
+        key = get_value(document, group_by)
+        key = _hash_key(None if key is _MISSING else key)
+        group_indices.append(groups.setdefault(key, len(groups)))
+
+    results = [{} for _ in range(len(groups))]
+    for column, accumulator in accumulators.items():
+        values = [[] for _ in range(len(groups))]
+        for index, document in zip(group_indices, documents):
+            values[index].append(document.get(column, _MISSING))
+        func = ACCUMULATORS[accumulator]
+        for result, group_values in zip(results, values):
+            result[column] = func(group_values)
+    return results
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright Toolkit Authors
+
+"""In-process indexes for DB-engines without native indexes."""
+
+from bisect import bisect_left, bisect_right
+from numbers import Number
+
+_MISSING = object()
+_RANGE_OPERATORS = ["$gt", "$gte", "$lt", "$lte"]
+
+
+def get_value(document, key):
+    """Return the value of a (dotted) key in a document.
+
+    Args:
+        document (dict): document
+        key (str): key (e.g. 'contents./topic.tags')
+
+    Returns:
+        (any): value, or `_MISSING` if the key does not exist
+
+    """
+    value = document
+    for sub_key in key.split("."):
+        if not isinstance(value, dict) or sub_key not in value.keys():
+            return _MISSING
+        value = value[sub_key]
+    return value
+
+
+def _type_group(value):
+    """Return the group of mutually comparable types of a value (None if not indexable)."""
+    if isinstance(value, Number):
+        return "number"
+    if isinstance(value, str):
+        return "string"
+    return None
+
+
+def _is_hashable(value):
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+
+class LocalIndex(object):
+    """Hash index over documents, with sorted values of the first key for range filters.
+
+    Arrays are indexed by their elements (like multikey indexes of MongoDB).
+    Lookups return a superset of the matching positions, which must be filtered by the engine.
+
+    """
+
+    def __init__(self, keys, unique=False):
+        """Initialize LocalIndex.
+
+        Args:
+            keys (list): list of (key, direction)
+            unique (bool): unused, for compatibility with native indexes
+
+        """
+        self.keys = [key for key, _ in keys]
+        self.unique = unique
+        self._hash = {}  # key: value (tuple for compound indexes), value: list of positions
+        self._sorted = {}  # key: type group, value: (sorted values, positions) of the first key
+
+    def build(self, documents):
+        """Build the index.
+
+        Args:
+            documents (list): list of documents
+
+        Returns:
+            (LocalIndex): self
+
+        """
+        hash_entries = self._hash
+        sorted_entries = {}
+        for position, document in enumerate(documents):
+            values = [get_value(document, key) for key in self.keys]
+            if any(value is _MISSING for value in values):
+                continue
+
+            # Arrays are expanded into their elements
+            expanded = [[]]
+            for value in values:
+                elements = value if isinstance(value, list) else [value]
+                expanded = [prefix + [element] for prefix in expanded for element in elements]
+            for entry in expanded:
+                entry = tuple(entry) if len(self.keys) > 1 else entry[0]
+                if _is_hashable(entry):
+                    hash_entries.setdefault(entry, []).append(position)
+
+            first_values = values[0] if isinstance(values[0], list) else [values[0]]
+            for value in first_values:
+                group = _type_group(value)
+                if group is not None:
+                    sorted_entries.setdefault(group, []).append((value, position))
+
+        for group, entries in sorted_entries.items():
+            entries.sort(key=lambda entry: entry[0])
+            self._sorted[group] = ([entry[0] for entry in entries], [entry[1] for entry in entries])
+        return self
+
+    def lookup(self, conditions):
+        """Return positions of documents which may satisfy the conditions.
+
+        Args:
+            conditions (dict): key -> condition (a value or a dict of operators)
+
+        Returns:
+            (set): positions, or None if the index cannot be used for the conditions
+
+        """
+        if all(key in conditions.keys() for key in self.keys):
+            values = [_equal_values(conditions[key]) for key in self.keys]
+            if all(value is not None for value in values):
+                entries = [[]]
+                for candidates in values:
+                    entries = [prefix + [value] for prefix in entries for value in candidates]
+                positions = set()
+                for entry in entries:
+                    entry = tuple(entry) if len(self.keys) > 1 else entry[0]
+                    positions.update(self._hash.get(entry, []))
+                return positions
+
+        if self.keys[0] in conditions.keys():
+            return self._lookup_range(conditions[self.keys[0]])
+        return None
+
+    def _lookup_range(self, condition):
+        if not isinstance(condition, dict):
+            return None
+        bounds = {op: value for op, value in condition.items() if op in _RANGE_OPERATORS}
+        if len(bounds) == 0:
+            return None
+        groups = set(_type_group(value) for value in bounds.values())
+        if len(groups) != 1 or None in groups:
+            return None
+        values, positions = self._sorted.get(groups.pop(), ([], []))
+
+        begin, end = 0, len(values)
+        for op, value in bounds.items():
+            if op == "$gt":
+                begin = max(begin, bisect_right(values, value))
+            elif op == "$gte":
+                begin = max(begin, bisect_left(values, value))
+            elif op == "$lt":
+                end = min(end, bisect_left(values, value))
+            elif op == "$lte":
+                end = min(end, bisect_right(values, value))
+        return set(positions[begin:end])
+
+
+def _equal_values(condition):
+    """Return candidate values of an equality condition (None if not an equality)."""
+    if isinstance(condition, dict):
+        if "$eq" in condition.keys():
+            condition = condition["$eq"]
+        elif "$in" in condition.keys() and isinstance(condition["$in"], list):
+            values = condition["$in"]
+            if all(_is_hashable(value) and value is not None for value in values):
+                return values
+            return None
+        else:
+            return None
+    if condition is None or isinstance(condition, (dict, list)) or not _is_hashable(condition):
+        return None
+    return [condition]
+
+
+class IndexedDocuments(object):
+    """Documents kept in memory with in-process indexes."""
+
+    def __init__(self, documents, indexes=None):
+        """Initialize IndexedDocuments.
+
+        Args:
+            documents (list): list of documents
+            indexes (list): list of index specs (dicts with keys 'keys' and 'unique')
+
+        """
+        self.documents = documents
+        self.indexes = [
+            LocalIndex(index["keys"], index.get("unique", False)).build(documents)
+            for index in (indexes if indexes is not None else [])
+        ]
+
+    def candidates(self, query):
+        """Return documents which may match a MongoDB-style query.
+
+        Args:
+            query (dict): query
+
+        Returns:
+            (list): documents in the original order, or None if no index can be used
+
+        """
+        positions = self._lookup(query)
+        if positions is None:
+            return None
+        return [self.documents[position] for position in sorted(positions)]
+
+    def _lookup(self, query):
+        if not isinstance(query, dict):
+            return None
+        conditions = {key: value for key, value in query.items() if not key.startswith("$")}
+        results = [index.lookup(conditions) for index in self.indexes]
+        if isinstance(query.get("$and", None), list):
+            results += [self._lookup(sub_query) for sub_query in query["$and"]]
+
+        positions = None
+        for result in results:
+            if result is not None:
+                positions = result if positions is None else positions & result
+        return positions
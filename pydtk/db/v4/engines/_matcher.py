@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright Toolkit Authors
+
+"""In-process matching of documents with MongoDB-style queries."""
+
+import re
+from numbers import Number
+
+from ._index import _MISSING, get_value
+
+_REGEX_FLAGS = {"i": re.IGNORECASE, "m": re.MULTILINE, "s": re.DOTALL, "x": re.VERBOSE}
+
+
+def match(document, query):
+    """Check if a document matches a query as MongoDB does.
+
+    Args:
+        document (dict): document
+        query (dict): query made by `PQL.find` (if empty, all the documents match)
+
+    Returns:
+        (bool): True if the document matches
+
+    """
+    for key, condition in query.items():
+        if key == "$and":
+            if not all(match(document, sub_query) for sub_query in condition):
+                return False
+        elif key == "$or":
+            if not any(match(document, sub_query) for sub_query in condition):
+                return False
+        elif key == "$nor":
+            if any(match(document, sub_query) for sub_query in condition):
+                return False
+        elif key.startswith("$"):
+            raise ValueError("Unsupported query operator: {}".format(key))
+        elif not _match_field(get_value(document, key), condition):
+            return False
+    return True
+
+
+def query_keys(query):
+    """Return the keys used in a query.
+
+    Args:
+        query (dict): query
+
+    Returns:
+        (set): keys (e.g. 'contents./topic')
+
+    """
+    keys = set()
+    for key, condition in (query or {}).items():
+        if key in ("$and", "$or", "$nor"):
+            for sub_query in condition:
+                keys.update(query_keys(sub_query))
+        elif not key.startswith("$"):
+            keys.add(key)
+    return keys
+
+
+def _is_operators(condition):
+    return isinstance(condition, dict) and any(key.startswith("$") for key in condition.keys())
+
+
+def _match_field(value, condition):
+    if _is_operators(condition):
+        return all(
+            _match_operator(value, operator, operand, condition)
+            for operator, operand in condition.items()
+            if operator != "$options"
+        )
+    if isinstance(condition, re.Pattern):
+        return _match_operator(value, "$regex", condition, {})
+    return _equals(value, condition)
+
+
+def _candidates(value):
+    """Return the value and its elements, which are compared with operands."""
+    if value is _MISSING:
+        return []
+    if isinstance(value, list):
+        return [value] + value
+    return [value]
+
+
+def _same(a, b):
+    if isinstance(a, bool) != isinstance(b, bool):
+        return False
+    return a == b
+
+
+def _equals(value, operand):
+    if operand is None and value is _MISSING:
+        return True
+    return any(_same(candidate, operand) for candidate in _candidates(value))
+
+
+def _comparable(a, b):
+    if isinstance(a, bool) or isinstance(b, bool):
+        return isinstance(a, bool) and isinstance(b, bool)
+    if isinstance(a, Number) and isinstance(b, Number):
+        return True
+    return isinstance(a, str) and isinstance(b, str)
+
+
+def _compare(value, operator, operand):
+    if operand is None:
+        return operator in ("$gte", "$lte") and _equals(value, None)
+    for candidate in _candidates(value):
+        if not _comparable(candidate, operand):
+            continue
+        if operator == "$gt" and candidate > operand:
+            return True
+        if operator == "$gte" and candidate >= operand:
+            return True
+        if operator == "$lt" and candidate < operand:
+            return True
+        if operator == "$lte" and candidate <= operand:
+            return True
+    return False
+
+
+def _regex(operand, options=""):
+    if isinstance(operand, re.Pattern):
+        return operand
+    flags = 0
+    for option in options:
+        flags |= _REGEX_FLAGS.get(option, 0)
+    return re.compile(operand, flags)
+
+
+def _match_operator(value, operator, operand, spec):
+    if operator == "$eq":
+        return _equals(value, operand)
+    if operator == "$ne":
+        return not _equals(value, operand)
+    if operator == "$in":
+        return any(_equals(value, item) for item in operand)
+    if operator == "$nin":
+        return not any(_equals(value, item) for item in operand)
+    if operator in ("$gt", "$gte", "$lt", "$lte"):
+        return _compare(value, operator, operand)
+    if operator == "$exists":
+        return (value is not _MISSING) == bool(operand)
+    if operator == "$regex":
+        pattern = _regex(operand, spec.get("$options", ""))
+        return any(
+            isinstance(candidate, str) and pattern.search(candidate) is not None
+            for candidate in _candidates(value)
+        )
+    if operator == "$not":
+        if isinstance(operand, (str, re.Pattern)):
+            operand = {"$regex": operand}
+        return not _match_field(value, operand)
+    if operator == "$all":
+        return len(operand) > 0 and all(_equals(value, item) for item in operand)
+    if operator == "$size":
+        return isinstance(value, list) and len(value) == operand
+    if operator == "$elemMatch":
+        if not isinstance(value, list):
+            return False
+        if _is_operators(operand):
+            return any(_match_field(element, operand) for element in value)
+        return any(isinstance(element, dict) and match(element, operand) for element in value)
+    raise ValueError("Unsupported query operator: {}".format(operator))
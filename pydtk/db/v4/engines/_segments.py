@@ -0,0 +1,404 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright Toolkit Authors
+
+"""Sharded storage of collections for DB-engines storing data in files.
+
+A database is a directory with a sub-directory per collection::
+
+    <database>/
+        meta.json                   format and the number of shards
+        .lock                       lock for writes and compactions
+        collections/<collection>/
+            segment-0000.json       documents of the shard 0 ({_uuid: document})
+            ...
+            log.jsonl               header line and appended upserts/removals
+
+Documents are assigned to shards by the hash of `_uuid`. Writes are appended to the log,
+which is merged into the segments of the modified shards by compaction.
+
+"""
+
+import fcntl
+import json
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+import zlib
+from contextlib import contextmanager
+from urllib.parse import quote, unquote
+
+FORMAT_VERSION = 1
+DEFAULT_NUM_SHARDS = 16
+COMPACTION_THRESHOLD = 16 * 1024 * 1024  # size of a log in bytes which triggers compaction
+
+_META_FILENAME = "meta.json"
+_LOCK_FILENAME = ".lock"
+_COLLECTIONS_DIRNAME = "collections"
+_LOG_FILENAME = "log.jsonl"
+
+_STORES = {}  # key: (path to database, collection), value: SegmentStore
+_STORES_LOCK = threading.Lock()
+
+
+def is_sharded(path):
+    """Check if a directory is a sharded database.
+
+    Args:
+        path (str): path to the database directory
+
+    Returns:
+        (bool): True if the database exists
+
+    """
+    return os.path.isfile(os.path.join(path, _META_FILENAME))
+
+
+def create(path, collections=None, num_shards=DEFAULT_NUM_SHARDS):
+    """Create a sharded database at once.
+
+    The database is built in a temporary directory which is then renamed,
+    so an interrupted creation leaves nothing at the path.
+
+    Args:
+        path (str): path to the database directory (must not exist)
+        collections (dict): collection name -> list of documents
+        num_shards (int): number of shards of each collection
+
+    """
+    if os.path.exists(path):
+        raise FileExistsError("Database already exists: {}".format(path))
+    if num_shards < 1:
+        raise ValueError("num_shards must be positive")
+
+    tmp_path = tempfile.mkdtemp(
+        prefix=".{}.".format(os.path.basename(path)), dir=os.path.dirname(os.path.abspath(path))
+    )
+    try:
+        _write_json(
+            os.path.join(tmp_path, _META_FILENAME),
+            {"format": FORMAT_VERSION, "num_shards": num_shards},
+        )
+        for name, documents in (collections or {}).items():
+            collection_path = _collection_path(tmp_path, name)
+            os.makedirs(collection_path)
+            shards = [{} for _ in range(num_shards)]
+            for document in documents:
+                shards[_shard(document["_uuid"], num_shards)][document["_uuid"]] = document
+            for shard, segment in enumerate(shards):
+                if len(segment) > 0:
+                    _write_json(_segment_path(collection_path, shard), segment)
+            _write_log_header(collection_path)
+        os.rename(tmp_path, path)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+
+def get_store(path, collection_name):
+    """Return the store of a collection shared in this process.
+
+    Args:
+        path (str): path to the database directory
+        collection_name (str): collection name
+
+    Returns:
+        (SegmentStore): store
+
+    """
+    key = (os.path.abspath(path), collection_name)
+    with _STORES_LOCK:
+        if key not in _STORES.keys():
+            _STORES[key] = SegmentStore(*key)
+        return _STORES[key]
+
+
+def list_collections(path):
+    """Return names of the collections in a sharded database.
+
+    Args:
+        path (str): path to the database directory
+
+    Returns:
+        (list): collection names
+
+    """
+    try:
+        names = sorted(os.listdir(os.path.join(path, _COLLECTIONS_DIRNAME)))
+    except FileNotFoundError:
+        return []
+    return [
+        unquote(name)
+        for name in names
+        if os.path.isfile(os.path.join(path, _COLLECTIONS_DIRNAME, name, _LOG_FILENAME))
+    ]
+
+
+class SegmentStore(object):
+    """Documents of a collection in hash-partitioned segments with an append-only log.
+
+    The documents are kept in memory and updated incrementally by reading the appended
+    part of the log, so writes by other processes are seen without reloading the segments.
+
+    """
+
+    def __init__(self, path, collection_name):
+        """Initialize SegmentStore.
+
+        Args:
+            path (str): path to the database directory
+            collection_name (str): collection name
+
+        """
+        with open(os.path.join(path, _META_FILENAME), "r") as f:
+            meta = json.load(f)
+        if meta.get("format", None) != FORMAT_VERSION:
+            raise ValueError("Unsupported format of sharded database: {}".format(path))
+
+        self.db_path = path
+        self.path = _collection_path(path, collection_name)
+        self.num_shards = meta["num_shards"]
+        self._lock = threading.RLock()
+        self._documents = {}  # key: _uuid, value: document (replaced, never modified in place)
+        self._generation = None  # generation of the log replayed
+        self._offset = 0  # bytes of the log replayed
+        self._dirty = set()  # shards modified by the log
+        self._version = 0
+
+    @property
+    def _log_path(self):
+        return os.path.join(self.path, _LOG_FILENAME)
+
+    def exists(self):
+        """Check if the collection exists.
+
+        Returns:
+            (bool): True if the collection exists
+
+        """
+        return os.path.isfile(self._log_path)
+
+    def refresh(self):
+        """Apply changes in the files since the last refresh.
+
+        Returns:
+            (int): version of the documents, which changes when they are modified
+
+        """
+        with self._lock:
+            try:
+                log = open(self._log_path, "rb")
+            except FileNotFoundError:
+                if self._generation is not None or len(self._documents) > 0:
+                    self._reset({}, None, 0)
+                return self._version
+
+            with log:
+                # The log is opened before reading segments, as it is replaced after compaction
+                header = log.readline()
+                generation = json.loads(header.decode("utf-8"))["generation"]
+                if generation != self._generation:
+                    self._reset(self._read_segments(), generation, len(header))
+                log.seek(self._offset)
+                chunk = log.read()
+
+            end = chunk.rfind(b"\n") + 1  # a line being appended is read at the next refresh
+            if end > 0:
+                for line in chunk[:end].splitlines():
+                    if line.strip():
+                        self._apply(json.loads(line.decode("utf-8")))
+                self._offset += end
+                self._version += 1
+            return self._version
+
+    def snapshot(self):
+        """Return the documents in the collection with their version.
+
+        Returns:
+            (int, list): version and documents (must not be modified)
+
+        """
+        with self._lock:
+            return self.refresh(), list(self._documents.values())
+
+    def upsert(self, documents):
+        """Append upserts of documents to the log.
+
+        Fields of existing documents are updated with those of the given ones.
+
+        Args:
+            documents (list): documents with `_uuid`
+
+        """
+        self._append([{"op": "upsert", "document": document} for document in documents])
+
+    def remove(self, uuids):
+        """Append removals of documents to the log.
+
+        Args:
+            uuids (list): list of `_uuid`
+
+        """
+        self._append([{"op": "remove", "_uuid": uuid} for uuid in uuids])
+
+    def compact(self):
+        """Merge the log into the segments of the modified shards and start a new log."""
+        with self._locked():
+            self._compact()
+
+    def _compact(self):
+        """Compact the log (the database must be locked by `_locked`)."""
+        self.refresh()
+        if not self.exists() or len(self._dirty) == 0:
+            return
+        segments = {shard: {} for shard in self._dirty}
+        for _uuid, document in self._documents.items():
+            shard = self.shard(_uuid)
+            if shard in segments.keys():
+                segments[shard][_uuid] = document
+        for shard, segment in segments.items():
+            if len(segment) > 0:
+                _write_json(_segment_path(self.path, shard), segment)
+            elif os.path.exists(_segment_path(self.path, shard)):
+                os.remove(_segment_path(self.path, shard))
+        self._generation, self._offset = _write_log_header(self.path)
+        self._dirty = set()
+
+    def drop(self):
+        """Remove the collection."""
+        with self._locked():
+            shutil.rmtree(self.path, ignore_errors=True)
+            self.refresh()
+
+    def shard(self, _uuid):
+        """Return the shard of a document.
+
+        Args:
+            _uuid (str): `_uuid` of the document
+
+        Returns:
+            (int): index of the shard
+
+        """
+        return _shard(_uuid, self.num_shards)
+
+    def _append(self, entries):
+        if len(entries) == 0:
+            return
+        lines = b"".join(
+            json.dumps(entry, separators=(",", ":")).encode("utf-8") + b"\n" for entry in entries
+        )
+        with self._locked():
+            if not self.exists():
+                os.makedirs(self.path, exist_ok=True)
+                _write_log_header(self.path)
+            with open(self._log_path, "ab") as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+                size = f.tell()
+            self.refresh()
+            if size >= COMPACTION_THRESHOLD:
+                self._compact()
+
+    def _apply(self, entry):
+        if entry["op"] == "upsert":
+            document = entry["document"]
+            _uuid = document["_uuid"]
+            if _uuid in self._documents.keys():
+                document = {**self._documents[_uuid], **document}
+            self._documents[_uuid] = document
+        elif entry["op"] == "remove":
+            _uuid = entry["_uuid"]
+            self._documents.pop(_uuid, None)
+        else:
+            raise ValueError("Unknown operation in log: {}".format(entry["op"]))
+        self._dirty.add(self.shard(_uuid))
+
+    def _read_segments(self):
+        documents = {}
+        for shard in range(self.num_shards):
+            try:
+                with open(_segment_path(self.path, shard), "r") as f:
+                    documents.update(json.load(f))
+            except FileNotFoundError:
+                pass
+        return documents
+
+    def _reset(self, documents, generation, offset):
+        self._documents = documents
+        self._generation = generation
+        self._offset = offset
+        self._dirty = set()
+        self._version += 1
+
+    @contextmanager
+    def _locked(self):
+        """Lock the database for writing in this process and among processes.
+
+        The file lock is not reentrant, so methods called with the lock must not take it again.
+
+        """
+        with self._lock:
+            with open(os.path.join(self.db_path, _LOCK_FILENAME), "a") as f:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _collection_path(path, name):
+    quoted = quote(name, safe="")
+    if quoted in ["", ".", ".."]:
+        quoted = quoted.replace(".", "%2E") or "%00"
+    return os.path.join(path, _COLLECTIONS_DIRNAME, quoted)
+
+
+def _shard(_uuid, num_shards):
+    return zlib.crc32(str(_uuid).encode("utf-8")) % num_shards
+
+
+def _segment_path(collection_path, shard):
+    return os.path.join(collection_path, "segment-{:04d}.json".format(shard))
+
+
+def _write_json(path, data):
+    """Write data to a temporary file and rename it to the path."""
+    fd, tmp_path = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=os.path.dirname(path))
+    try:
+        with open(fd, "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _write_log_header(collection_path):
+    """Start a new (empty) log of a collection.
+
+    Returns:
+        (str, int): generation of the log and the size of the header
+
+    """
+    generation = uuid.uuid4().hex
+    header = json.dumps({"generation": generation}) + "\n"
+    fd, tmp_path = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=collection_path)
+    try:
+        with open(fd, "w") as f:
+            f.write(header)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(collection_path, _LOG_FILENAME))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return generation, len(header.encode("utf-8"))
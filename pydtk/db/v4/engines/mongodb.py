@@ -6,12 +6,16 @@
 """DB Engines for V4DBHandler."""
 
 import logging
-from copy import deepcopy
+from functools import partial
+from itertools import islice
 from typing import Optional
 
-from pymongo import DeleteOne, MongoClient, UpdateOne
+from pymongo import DeleteOne, IndexModel, MongoClient, UpdateOne
+from pymongo.errors import OperationFailure
 
 from ..deps import pql as PQL
+from . import decode_cursor, get_connection, get_projection, keyset_order, keyset_query
+from ._aggregation import get_accumulators
 
 logger = logging.getLogger(__name__)
 
@@ -55,14 +59,28 @@ def connect(
     kwargs = {}
     if db_name is not None:
         kwargs.update({"authSource": "admin"})
-    connection = MongoClient(
-        host=address, port=port, username=db_username, password=db_password, **kwargs
+    # MongoClient has its own pool of sockets, so a client is shared among databases
+    connection = get_connection(
+        ("mongodb", address, port, db_username, db_password),
+        partial(
+            MongoClient,
+            host=address,
+            port=port,
+            username=db_username,
+            password=db_password,
+            **kwargs,
+        ),
+        close=lambda client: client.close(),
     )
     db = getattr(connection, db_name)
     collection = getattr(db, collection_name)
     return collection
 
 
+COUNT_MODES = ["exact", "estimated", "deferred", "none"]
+_BSON_OBJECT_TOO_LARGE = 10334  # error code of a document exceeding 16MB
+
+
 def read(
     db,
     query: Optional[dict] = None,
@@ -73,10 +91,18 @@ def read(
     offset: Optional[int] = None,
     handler: any = None,
     disable_count_total: bool = False,
+    fields: Optional[list] = None,
+    exclude: Optional[list] = None,
+    after: Optional[str] = None,
+    count_mode: str = "exact",
     **kwargs
 ):
     """Read data from DB.
 
+    Pages (`limit` or `after`) are sorted by `order_by` followed by `_uuid`.
+    A page of grouped records and the number of groups are fetched in a single aggregation
+    with `$facet`, unless the page exceeds the maximum size of a document.
+
     Args:
         db (Collection): DB connection
         query (dict or Query): Query to select items
@@ -87,6 +113,14 @@ def read(
         offset (int): offset of cursor
         handler (BaseDBHandler): DBHandler
         disable_count_total (bool): set True to avoid counting total number of records
+                                    (same as `count_mode='none'`)
+        fields (list): names of the fields to fetch (if None, all the fields are fetched)
+        exclude (list): names of the fields not to fetch
+        after (str): cursor token of the last record of the previous page
+        count_mode (str): how to count the total number of records;
+                          'exact', 'estimated' (metadata-based if there is no filter),
+                          'deferred' (returns None to be counted later by `count()`)
+                          or 'none' (returns the number of records in the page)
         **kwargs: kwargs for function `pandas.read_sql_query`
                   or `influxdb.DataFrameClient.query`
 
@@ -98,6 +132,10 @@ def read(
         limit = 0
     if offset is None:
         offset = 0
+    if disable_count_total:
+        count_mode = "none"
+    if count_mode not in COUNT_MODES:
+        raise ValueError("Unknown count_mode: {}".format(count_mode))
 
     if pql is not None and query is not None:
         raise ValueError("Either query or pql can be specified")
@@ -105,68 +143,219 @@ def read(
     if pql:
         query = PQL.find(pql)
 
+    projection = get_projection(fields, exclude)
+    if after is not None or limit > 0:
+        order_by = keyset_order(order_by)
+
     if group_by is None:
-        if query:
-            if order_by is None:
-                data = db.find(query).skip(offset).limit(limit)
-                count_total = db.count(query) if not disable_count_total else None
-            else:
-                data = db.find(query).sort(order_by).skip(offset).limit(limit)
-                count_total = db.count(query) if not disable_count_total else None
-        else:
-            if order_by is None:
-                data = db.find().skip(offset).limit(limit)
-                count_total = db.count({}) if not disable_count_total else None
-            else:
-                data = db.find().sort(order_by).skip(offset).limit(limit)
-                count_total = db.count({}) if not disable_count_total else None
+        # Records are read by find() rather than an aggregation with `$facet`,
+        # whose sub-pipelines cannot use indexes to sort or skip
+        find_query = query if query else {}
+        if after is not None:
+            after_query = keyset_query(order_by, decode_cursor(after, order_by))
+            find_query = {"$and": [find_query, after_query]} if find_query else after_query
+        cursor = db.find(find_query, projection)
+        if order_by is not None:
+            cursor = cursor.sort([(item[0], item[1]) for item in order_by])
+        data = list(cursor.skip(offset).limit(limit))
     else:
-        aggregate = []
-        if query:
-            aggregate.append({"$match": query})
+        # Grouped records are paged and counted after `$group`, which cannot use indexes anyway
+        aggregate = _group_stages(query, group_by, order_by, projection, fields, exclude, handler)
+        page = []
+        if after is not None:
+            page.append({"$match": keyset_query(order_by, decode_cursor(after, order_by))})
+        if order_by is not None:
+            page.append({"$sort": {item[0]: item[1] for item in order_by}})
+        if offset > 0:
+            page.append({"$skip": offset})
+        if limit > 0:
+            page.append({"$limit": limit})
 
-        columns = {}
-        for column in set(handler.columns).union(["_uuid", "_creation_time"]):
+        if limit > 0 and count_mode == "exact":
+            facet = {"$facet": {"data": page, "count": [{"$count": "count"}]}}
             try:
-                config = next(filter(lambda c: c["name"] == column, handler.config["columns"]))
-                agg = config["aggregation"]
-                columns.update({column: {"${}".format(agg): "${}".format(column)}})
-            except Exception:
-                columns.update({column: {"$first": "${}".format(column)}})
-
-        aggregate.append(
-            {
-                "$group": {
-                    **columns,
-                    "_id": "${}".format(group_by),
-                }
+                result = next(db.aggregate(aggregate + [facet], allowDiskUse=True))
+                count_total = result["count"][0]["count"] if len(result["count"]) > 0 else 0
+                return result["data"], count_total
+            except OperationFailure as e:
+                # A page larger than the limit of a document (16MB) is fetched separately
+                if e.code != _BSON_OBJECT_TOO_LARGE:
+                    raise
+        data = list(db.aggregate(aggregate + page, allowDiskUse=True))
+
+    if (limit == 0 and offset == 0 and after is None) or count_mode == "none":
+        count_total = len(data)
+    elif count_mode == "deferred":
+        count_total = None
+    else:
+        count_total = count(db, query=query, group_by=group_by, estimated=count_mode == "estimated")
+
+    return data, count_total
+
+
+def _group_stages(query, group_by, order_by, projection, fields, exclude, handler):
+    """Return aggregation stages grouping records.
+
+    Args:
+        query (dict): Query to select items
+        group_by (str): Aggregate by this key
+        order_by (list): column name to sort by with format [ ( column1, 1 or -1 ), ... ]
+        projection (dict): projection made by `get_projection`
+        fields (list): names of the fields to fetch
+        exclude (list): names of the fields not to fetch
+        handler (BaseDBHandler): DBHandler
+
+    Returns:
+        (list): aggregation stages
+
+    """
+    aggregate = []
+    if query:
+        aggregate.append({"$match": query})
+
+    if projection is not None:
+        # Keys to group and sort by are needed in the later stages
+        keys = [group_by] + [item[0] for item in order_by or []]
+        if fields is not None:
+            aggregate.append({"$project": {**projection, **{key: 1 for key in keys}}})
+        else:
+            aggregate.append({"$project": projection})
+
+    accumulators = get_accumulators(handler, group_by, order_by, fields, exclude)
+    group = {
+        column: {"${}".format(accumulator): "${}".format(column)}
+        for column, accumulator in accumulators.items()
+    }
+
+    aggregate.append(
+        {
+            "$group": {
+                **group,
+                "_id": "${}".format(group_by),
             }
-        )
-        aggregate.append({"$project": {"_id": 0}})
-        aggregate_count = deepcopy(aggregate)
-        aggregate_count.append({"$count": "count"})
+        }
+    )
+    aggregate.append({"$project": {"_id": 0}})
+    return aggregate
 
-        if order_by is not None:
-            aggregate.append({"$sort": {item[0]: item[1] for item in order_by}})
 
-        if offset > 0:
-            aggregate.append({"$skip": offset})
-        if limit > 0:
-            aggregate.append({"$limit": limit})
+def count(
+    db,
+    query: Optional[dict] = None,
+    pql: any = None,
+    group_by: Optional[str] = None,
+    estimated: bool = False,
+    **kwargs
+):
+    """Count records in DB.
 
-        data = db.aggregate(aggregate, allowDiskUse=True)
-        try:
-            count_total = (
-                list(db.aggregate(aggregate_count))[0]["count"] if not disable_count_total else None
-            )
-        except Exception as e:
-            logger.warning(e)
-            count_total = None
+    Args:
+        db (Collection): DB connection
+        query (dict or Query): Query to select items
+        pql (PQL) Python-Query-Language to select items
+        group_by (str): Count groups by this key
+        estimated (bool): if True, the count is estimated from metadata when there is no filter
 
-    data = list(data)
-    count_total = count_total if count_total is not None else len(data)
+    Returns:
+        (int): number of records (or groups)
 
-    return data, count_total
+    """
+    if pql is not None and query is not None:
+        raise ValueError("Either query or pql can be specified")
+
+    if pql:
+        query = PQL.find(pql)
+
+    if group_by is None:
+        if estimated and not query:
+            return db.estimated_document_count()
+        return db.count_documents(query if query else {})
+
+    aggregate = [{"$match": query}] if query else []
+    aggregate += [{"$group": {"_id": "${}".format(group_by)}}, {"$count": "count"}]
+    result = list(db.aggregate(aggregate, allowDiskUse=True))
+    return result[0]["count"] if len(result) > 0 else 0
+
+
+def read_iter(
+    db,
+    query: Optional[dict] = None,
+    pql: any = None,
+    order_by: Optional[list] = None,
+    batch_size: int = 1000,
+    fields: Optional[list] = None,
+    exclude: Optional[list] = None,
+    **kwargs
+):
+    """Read data from DB batch by batch.
+
+    Args:
+        db (Collection): DB connection
+        query (dict or Query): Query to select items
+        pql (PQL) Python-Query-Language to select items
+        order_by (list): column name to sort by with format [ ( column1, 1 or -1 ), ... ]
+        batch_size (int): number of items in a batch
+        fields (list): names of the fields to fetch (if None, all the fields are fetched)
+        exclude (list): names of the fields not to fetch
+
+    Yields:
+        (list): list of data
+
+    """
+    if pql is not None and query is not None:
+        raise ValueError("Either query or pql can be specified")
+
+    if pql:
+        query = PQL.find(pql)
+
+    cursor = db.find(query if query else {}, get_projection(fields, exclude))
+    cursor = cursor.batch_size(batch_size)
+    if order_by is not None:
+        cursor = cursor.sort(order_by)
+
+    try:
+        while True:
+            batch = list(islice(cursor, batch_size))
+            if len(batch) == 0:
+                break
+            yield batch
+    finally:
+        cursor.close()
+
+
+def read_one(db, query: Optional[dict] = None, fields: Optional[list] = None, **kwargs):
+    """Read a single record from DB.
+
+    Args:
+        db (Collection): DB connection
+        query (dict): Query to select the record
+        fields (list): names of the fields to fetch (if None, all the fields are fetched)
+
+    Returns:
+        (dict): the record, or None if not found
+
+    """
+    projection = None
+    if fields is not None:
+        projection = {field: 1 for field in fields}
+        projection.setdefault("_id", 0)
+    return db.find_one(query if query else {}, projection)
+
+
+def create_indexes(db, indexes, **kwargs):
+    """Create indexes on the collection (existing ones are kept as they are).
+
+    Args:
+        db (Collection): DB connection
+        indexes (list): list of dicts with keys 'keys' (list of (key, 1 or -1)) and 'unique'
+
+    """
+    models = [
+        IndexModel([tuple(key) for key in index["keys"]], unique=index.get("unique", False))
+        for index in indexes
+    ]
+    if len(models) > 0:
+        db.create_indexes(models)
 
 
 def upsert(db, data, **kwargs):
@@ -4,15 +4,28 @@
 # Copyright Toolkit Authors
 
 """DB Engines for V4DBHandler."""
+import os
 from datetime import datetime
+from functools import partial
+from itertools import islice
 from typing import Optional
 
 from montydb import MontyClient, set_storage
 
 from ..deps import pql as PQL
+from . import (
+    decode_cursor,
+    get_connection,
+    get_projection,
+    keyset_order,
+    keyset_query,
+    paginate,
+)
+from ._aggregation import get_accumulators, group_documents
 
 DEFAULT_DB_NAME = "default"
 DEFAULT_COLLECTION_NAME = "default"
+BATCH_SIZE = 1000  # number of records written in a transaction
 
 
 def connect(
@@ -26,7 +39,7 @@ def connect(
         collection_name (str): collection name
 
     Returns:
-        (MontyCollection): connection
+        (MontyCollection): connection (the client is shared with the other handlers in this process)
 
     """
     if db_name is None:
@@ -34,6 +47,24 @@ def connect(
     if collection_name is None:
         collection_name = DEFAULT_COLLECTION_NAME
 
+    client = get_connection(
+        ("montydb", os.path.abspath(db_host)),
+        partial(_open_client, db_host),
+        close=lambda client: client.close(),
+        validate=lambda client: _repository_id(db_host) == client._repository_id,
+    )
+    return getattr(getattr(client, db_name), collection_name)
+
+
+def _repository_id(db_host):
+    try:
+        stat = os.stat(db_host)
+    except FileNotFoundError:
+        return None
+    return stat.st_dev, stat.st_ino
+
+
+def _open_client(db_host):
     set_storage(
         # general settings
         repository=db_host,  # dir path for database to live on disk, default is {cwd}
@@ -44,30 +75,45 @@ def connect(
         cache_modified=0,  # the only setting that flat-file have
     )
 
-    collection = getattr(getattr(MontyClient(db_host), db_name), collection_name)
-    return collection
+    client = MontyClient(db_host)
+    client._repository_id = _repository_id(db_host)
+    return client
 
 
 def read(
     db,
     query: Optional[dict] = None,
     pql: any = None,
+    group_by: Optional[str] = None,
     order_by: Optional[str] = None,
     limit: Optional[int] = None,
     offset: Optional[int] = None,
+    handler: any = None,
     disable_count_total: bool = False,
+    fields: Optional[list] = None,
+    exclude: Optional[list] = None,
+    after: Optional[str] = None,
     **kwargs
 ):
     """Read data from DB.
 
+    Pages (`limit` or `after`) are sorted by `order_by` followed by `_uuid`.
+    MontyDB has no `$group`, so records are grouped in process with the aggregations
+    of the columns in the handler config.
+
     Args:
         db (MontyCollection): DB connection
         query (dict or Query): Query to select items
         pql (PQL) Python-Query-Language to select items
+        group_by (str): Aggregate by this key
         order_by (list): column name to sort by with format [ ( column1, 1 or -1 ), ... ]
         limit (int): number of items to return per a page
         offset (int): offset of cursor
+        handler (BaseDBHandler): DBHandler
         disable_count_total (bool): set True to avoid counting total number of records
+        fields (list): names of the fields to fetch (if None, all the fields are fetched)
+        exclude (list): names of the fields not to fetch
+        after (str): cursor token of the last record of the previous page
         **kwargs: kwargs for function `pandas.read_sql_query`
                   or `influxdb.DataFrameClient.query`
 
@@ -86,21 +132,32 @@ def read(
     if pql:
         query = PQL.find(pql)
 
-    if query:
-        query = _fix_query_exists(query)
-        if order_by is None:
-            data = db.find(query).skip(offset).limit(limit)
-            count_total = db.count(query) if not disable_count_total else None
-        else:
-            data = db.find(query).sort(order_by).skip(offset).limit(limit)
-            count_total = db.count(query) if not disable_count_total else None
-    else:
-        if order_by is None:
-            data = db.find().skip(offset).limit(limit)
-            count_total = db.count({}) if not disable_count_total else None
-        else:
-            data = db.find().sort(order_by).skip(offset).limit(limit)
-            count_total = db.count({}) if not disable_count_total else None
+    projection = get_projection(fields, exclude)
+    if after is not None or limit > 0:
+        order_by = keyset_order(order_by)
+
+    query = _fix_query_exists(query) if query else {}
+    if group_by is not None:
+        accumulators = get_accumulators(handler, group_by, order_by, fields, exclude)
+        if fields is not None:
+            # Keys to group and sort by are needed after the projection
+            keys = [group_by] + [item[0] for item in order_by or []]
+            projection = {**projection, **{key: 1 for key in keys}}
+        elif projection is None:
+            projection = {column: 1 for column in accumulators.keys()}
+        data = group_documents(list(db.find(query, projection)), group_by, accumulators)
+        count_total = len(data)
+        data = paginate(data, order_by=order_by, limit=limit, offset=offset, after=after)
+        return data, count_total if not disable_count_total else len(data)
+
+    count_total = db.count(query) if not disable_count_total else None
+    if after is not None:
+        after_query = keyset_query(order_by, decode_cursor(after, order_by))
+        query = {"$and": [query, after_query]} if query else after_query
+    cursor = db.find(query, projection)
+    if order_by is not None:
+        cursor = cursor.sort(order_by)
+    data = cursor.skip(offset).limit(limit)
 
     data = list(data)
     count_total = count_total if count_total is not None else len(data)
@@ -108,35 +165,130 @@ def read(
     return data, count_total
 
 
+def read_iter(
+    db,
+    query: Optional[dict] = None,
+    pql: any = None,
+    order_by: Optional[list] = None,
+    batch_size: int = 1000,
+    fields: Optional[list] = None,
+    exclude: Optional[list] = None,
+    **kwargs
+):
+    """Read data from DB batch by batch.
+
+    Args:
+        db (MontyCollection): DB connection
+        query (dict or Query): Query to select items
+        pql (PQL) Python-Query-Language to select items
+        order_by (list): column name to sort by with format [ ( column1, 1 or -1 ), ... ]
+        batch_size (int): number of items in a batch
+        fields (list): names of the fields to fetch (if None, all the fields are fetched)
+        exclude (list): names of the fields not to fetch
+
+    Yields:
+        (list): list of data
+
+    """
+    if pql is not None and query is not None:
+        raise ValueError("Either query or pql can be specified")
+
+    if pql:
+        query = PQL.find(pql)
+
+    cursor = db.find(_fix_query_exists(query) if query else {}, get_projection(fields, exclude))
+    if order_by is not None:
+        cursor = cursor.sort(order_by)
+
+    while True:
+        batch = list(islice(cursor, batch_size))
+        if len(batch) == 0:
+            break
+        yield batch
+
+
+def read_one(db, query: Optional[dict] = None, fields: Optional[list] = None, **kwargs):
+    """Read a single record from DB.
+
+    Args:
+        db (MontyCollection): DB connection
+        query (dict): Query to select the record
+        fields (list): names of the fields to fetch (if None, all the fields are fetched)
+
+    Returns:
+        (dict): the record, or None if not found
+
+    """
+    projection = None
+    if fields is not None:
+        projection = {field: 1 for field in fields}
+        projection.setdefault("_id", 0)
+    return db.find_one(query if query else {}, projection)
+
+
+def create_indexes(db, indexes, **kwargs):
+    """Create indexes on the collection.
+
+    Note that MontyDB accepts but does not maintain indexes at the moment.
+
+    Args:
+        db (MontyCollection): DB connection
+        indexes (list): list of dicts with keys 'keys' (list of (key, 1 or -1)) and 'unique'
+
+    """
+    for index in indexes:
+        db.create_index([tuple(key) for key in index["keys"]], unique=index.get("unique", False))
+
+
 def upsert(db, data, **kwargs):
     """Write data to DB.
 
+    Existing records are looked up with a single `$in` query per batch, and the batch is
+    written with one insert and one update, each of which is a single storage transaction.
+    New records have `_uuid` as `_id`.
+
     Args:
         db (MontyCollection): DB connection
         data (list): data to save
 
     """
+    records = {}
     for record in data:
         _record = _fix_datetime(record)
         uuid = _record["_uuid"]
-        existing_record = db.find_one({"_uuid": uuid})
-        if existing_record is not None:
-            existing_record.update(_record)
-            db.replace_one({"_uuid": uuid}, existing_record)
-        else:
-            db.insert_one(_record)
+        records[uuid] = {**records[uuid], **_record} if uuid in records.keys() else _record
+    records = list(records.values())
+
+    for i in range(0, len(records), BATCH_SIZE):
+        batch = {record["_uuid"]: record for record in records[i : i + BATCH_SIZE]}
+        existing = {
+            record["_uuid"]: record for record in db.find({"_uuid": {"$in": list(batch.keys())}})
+        }
+        inserts = [
+            {**record, "_id": uuid} for uuid, record in batch.items() if uuid not in existing
+        ]
+        updates = [
+            {**existing[uuid], **record, "_id": existing[uuid]["_id"]}
+            for uuid, record in batch.items()
+            if uuid in existing
+        ]
+        if len(inserts) > 0:
+            db.insert_many(inserts)
+        if len(updates) > 0:
+            # MontyDB has no bulk replacement, so the documents are replaced through the storage
+            db._storage.update_many(db, updates)
 
 
 def remove(db, uuids, **kwargs):
     """Remove data from DB.
 
     Args:
-        db (TinyMongoCollection): DB connection
+        db (MontyCollection): DB connection
         uuids (list): A list of unique IDs
 
     """
-    for uuid in uuids:
-        db.delete_many({"_uuid": uuid})
+    if len(uuids) > 0:
+        db.delete_many({"_uuid": {"$in": list(uuids)}})
 
 
 def drop_table(db, name, **kwargs):
@@ -0,0 +1,760 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright Toolkit Authors
+
+"""DB Engines for V4DBHandler.
+
+Collections are Parquet datasets, which suit databases mostly read and written in batches::
+
+    <db_host>/<db_name>.parquet/
+        .lock                               lock for writes and compactions
+        <collection>/
+            manifest.json                   schema and files of the current generation
+            base-<generation>-NNNN.parquet  documents in the partition NNNN
+            delta-<generation>-<id>.parquet upserted documents and removals
+
+Documents are partitioned by the hash of `record_id` (or `_uuid` without it) and sorted by
+`record_id` in each partition, so that queries are pushed down to Arrow to read only the
+needed partitions, columns and row groups. `contents` is stored as a map column.
+
+Writes are appended as delta files, which are merged into the partitions by compaction
+when there are `MAX_DELTAS` of them or the schema is changed incompatibly.
+Values of columns with mixed types are stored in JSON, and null values are not stored.
+
+"""
+import base64
+import fcntl
+import json
+import operator
+import os
+import shutil
+import tempfile
+import uuid
+import zlib
+from contextlib import contextmanager
+from datetime import datetime
+from functools import reduce
+from typing import Optional
+from urllib.parse import quote
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from ..deps import pql as PQL
+from . import apply_projection, get_projection, paginate
+from ._aggregation import get_accumulators, group_documents
+from ._matcher import match, query_keys
+
+DEFAULT_DB_NAME = "default"
+DEFAULT_COLLECTION_NAME = "default"
+FORMAT_VERSION = 1
+NUM_PARTITIONS = 16
+PARTITION_KEY = "record_id"
+MAP_COLUMNS = ["contents"]  # columns of dicts stored as maps (e.g. topic -> info)
+ROW_GROUP_SIZE = 10000
+MAX_DELTAS = 32  # number of delta files which triggers compaction
+
+_MANIFEST_FILENAME = "manifest.json"
+_LOCK_FILENAME = ".lock"
+_DELETED = "_deleted"
+_RETRIES = 3  # number of reads retried when files are removed by compaction
+_COMPARISONS = {"$gt": operator.gt, "$gte": operator.ge, "$lt": operator.lt, "$lte": operator.le}
+
+
+class ParquetCollection(object):
+    """Collection stored as a Parquet dataset."""
+
+    def __init__(self, db_path, name):
+        """Initialize ParquetCollection.
+
+        Args:
+            db_path (str): path to the database directory
+            name (str): collection name
+
+        """
+        self.db_path = db_path
+        self.name = name
+        quoted = quote(name, safe="")
+        if quoted in ["", ".", ".."]:
+            quoted = quoted.replace(".", "%2E") or "%00"
+        self.path = os.path.join(db_path, quoted)
+
+
+def connect(
+    db_host: str, db_name: Optional[str] = None, collection_name: Optional[str] = None, **kwargs
+):
+    """Connect to DB.
+
+    Args:
+        db_host (str): directory of the databases
+        db_name (str): database name (the directory `<db_host>/<db_name>.parquet` is used)
+        collection_name (str): collection name
+
+    Returns:
+        (ParquetCollection): connection
+
+    """
+    if db_name is None:
+        db_name = DEFAULT_DB_NAME
+    if collection_name is None:
+        collection_name = DEFAULT_COLLECTION_NAME
+
+    db_path = os.path.join(os.path.abspath(db_host), "{}.parquet".format(db_name))
+    return ParquetCollection(db_path, collection_name)
+
+
+def read(
+    db,
+    query: Optional[dict] = None,
+    pql: any = None,
+    group_by: Optional[str] = None,
+    order_by: Optional[list] = None,
+    limit: Optional[int] = None,
+    offset: Optional[int] = None,
+    handler: any = None,
+    disable_count_total: bool = False,
+    fields: Optional[list] = None,
+    exclude: Optional[list] = None,
+    after: Optional[str] = None,
+    **kwargs
+):
+    """Read data from DB.
+
+    Only the columns used by the query, the fields and the order are read.
+    Pages (`limit` or `after`) are sorted by `order_by` followed by `_uuid`.
+    Records are grouped in process with the aggregations of the columns in the handler config.
+
+    Args:
+        db (ParquetCollection): DB connection
+        query (dict or Query): Query to select items
+        pql (PQL) Python-Query-Language to select items
+        group_by (str): Aggregate by this key
+        order_by (list): column name to sort by with format [ ( column1, 1 or -1 ), ... ]
+        limit (int): number of items to return per a page
+        offset (int): offset of cursor
+        handler (BaseDBHandler): DBHandler
+        disable_count_total (bool): set True to return the number of records in the page
+                                    as the total number
+        fields (list): names of the fields to fetch (if None, all the fields are fetched)
+        exclude (list): names of the fields not to fetch
+        after (str): cursor token of the last record of the previous page
+        **kwargs: kwargs for function `pandas.read_sql_query`
+                  or `influxdb.DataFrameClient.query`
+
+    Returns:
+        (list, int): list of data and total number of records
+
+    """
+    if pql is not None and query is not None:
+        raise ValueError("Either query or pql can be specified")
+
+    if pql:
+        query = PQL.find(pql)
+
+    projection = get_projection(fields, exclude)
+    keys = [item[0] for item in order_by or []]
+    if group_by is not None:
+        accumulators = get_accumulators(handler, group_by, order_by, fields, exclude)
+        data = _scan(db, query, columns=set(accumulators.keys()))
+        data = group_documents(data, group_by, accumulators)
+        if fields is not None:
+            # Keys to group and sort by are needed after the projection
+            projection = {**projection, **{key: 1 for key in [group_by] + keys}}
+    else:
+        columns, excluded = None, set()
+        if fields is not None:
+            columns = set(fields + keys)
+        elif exclude is not None:
+            excluded = set(field for field in exclude if "." not in field)
+            excluded = excluded.difference([key.split(".")[0] for key in keys])
+        data = _scan(db, query, columns=columns, excluded=excluded)
+
+    count_total = len(data)
+    data = paginate(data, order_by=order_by, limit=limit, offset=offset, after=after)
+    if disable_count_total:
+        count_total = len(data)
+
+    return [apply_projection(document, projection) for document in data], count_total
+
+
+def count(
+    db, query: Optional[dict] = None, pql: any = None, group_by: Optional[str] = None, **kwargs
+):
+    """Count records in DB.
+
+    Args:
+        db (ParquetCollection): DB connection
+        query (dict or Query): Query to select items
+        pql (PQL) Python-Query-Language to select items
+        group_by (str): Count groups by this key
+
+    Returns:
+        (int): number of records (or groups)
+
+    """
+    if pql is not None and query is not None:
+        raise ValueError("Either query or pql can be specified")
+
+    if pql:
+        query = PQL.find(pql)
+
+    if group_by is None:
+        return len(_scan(db, query, columns=set()))
+    data = _scan(db, query, columns={group_by})
+    return len(group_documents(data, group_by, {"_uuid": "first"}))
+
+
+def upsert(db, data, **kwargs):
+    """Write data to DB.
+
+    Fields of existing records are updated with those of the given ones,
+    and the records are written to a delta file at once.
+
+    Args:
+        db (ParquetCollection): DB connection
+        data (list): data to save
+
+    """
+    records = {}
+    for record in data:
+        _record = _fix_datetime(record)
+        _uuid = _record["_uuid"]
+        records[_uuid] = {**records[_uuid], **_record} if _uuid in records.keys() else _record
+    if len(records) == 0:
+        return
+
+    with _locked(db):
+        manifest = _read_manifest(db.path)
+        if manifest is not None:
+            query = {"_uuid": {"$in": list(records.keys())}}
+            for document in _scan_manifest(db, manifest, query):
+                records[document["_uuid"]] = {**document, **records[document["_uuid"]]}
+        _write(db, manifest, list(records.values()), [])
+
+
+def remove(db, uuids, **kwargs):
+    """Remove data from DB.
+
+    Args:
+        db (ParquetCollection): DB connection
+        uuids (list): A list of unique IDs
+
+    """
+    if len(uuids) == 0:
+        return
+    with _locked(db):
+        manifest = _read_manifest(db.path)
+        if manifest is not None:
+            _write(db, manifest, [], list(uuids))
+
+
+def compact(db, **kwargs):
+    """Merge the delta files of a collection into its partitions.
+
+    Args:
+        db (ParquetCollection): DB connection
+
+    """
+    with _locked(db):
+        manifest = _read_manifest(db.path)
+        if manifest is not None and len(manifest["deltas"]) > 0:
+            _compact(db, manifest, [], [])
+
+
+def drop_table(db, name, **kwargs):
+    """Drop a table from DB.
+
+    Args:
+        db (ParquetCollection): DB connection
+        name (str): Name of the target table
+
+    """
+    collection = ParquetCollection(db.db_path, name)
+    with _locked(collection):
+        shutil.rmtree(collection.path, ignore_errors=True)
+
+
+def exist_table(db, name, **kwargs):
+    """Check if the specified table (collection) exist.
+
+    Args:
+        db (ParquetCollection): DB connection
+        name (str): Name of the target table
+
+    """
+    collection = ParquetCollection(db.db_path, name)
+    return os.path.isfile(os.path.join(collection.path, _MANIFEST_FILENAME))
+
+
+@contextmanager
+def _locked(db):
+    """Lock the database for writing among processes."""
+    os.makedirs(db.db_path, exist_ok=True)
+    with open(os.path.join(db.db_path, _LOCK_FILENAME), "a") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _read_manifest(path):
+    try:
+        with open(os.path.join(path, _MANIFEST_FILENAME), "r") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    if manifest.get("format", None) != FORMAT_VERSION:
+        raise ValueError("Unsupported format of Parquet dataset: {}".format(path))
+    manifest["schema"] = pa.ipc.read_schema(pa.py_buffer(base64.b64decode(manifest["schema"])))
+    return manifest
+
+
+def _write_manifest(path, manifest):
+    manifest = {
+        **manifest,
+        "format": FORMAT_VERSION,
+        "schema": base64.b64encode(manifest["schema"].serialize().to_pybytes()).decode("ascii"),
+    }
+    fd, tmp_path = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=path)
+    try:
+        with open(fd, "w") as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(path, _MANIFEST_FILENAME))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _write_table(path, table):
+    fd, tmp_path = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=os.path.dirname(path))
+    os.close(fd)
+    try:
+        pq.write_table(table, tmp_path, row_group_size=ROW_GROUP_SIZE)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _scan(db, query=None, columns=None, excluded=()):
+    """Return documents matching a query.
+
+    Args:
+        db (ParquetCollection): DB connection
+        query (dict): query
+        columns (set): keys to read (if None, all the columns are read)
+        excluded (set): columns not to read
+
+    Returns:
+        (list): documents
+
+    """
+    for retry in range(_RETRIES):
+        manifest = _read_manifest(db.path)
+        if manifest is None:
+            return []
+        try:
+            return _scan_manifest(db, manifest, query, columns, excluded)
+        except FileNotFoundError:
+            if retry == _RETRIES - 1:
+                raise  # files have been removed by compaction repeatedly
+
+
+def _scan_manifest(db, manifest, query=None, columns=None, excluded=()):
+    schema = manifest["schema"]
+    json_columns = set(manifest["json_columns"])
+    needed = set(key.split(".")[0] for key in query_keys(query)).union(["_uuid"])
+    if columns is not None:
+        needed.update(key.split(".")[0] for key in columns)
+    names = [
+        name
+        for name in schema.names
+        if name in needed or (columns is None and name not in excluded)
+    ]
+
+    # Documents in delta files supersede those in the partitions
+    changes = {}
+    for filename in manifest["deltas"]:
+        table = ds.dataset(
+            os.path.join(db.path, filename),
+            schema=schema.append(pa.field(_DELETED, pa.bool_())),
+            format="parquet",
+        ).to_table(columns=names + [_DELETED])
+        for document in _to_documents(table, json_columns):
+            changes[document["_uuid"]] = None if document.pop(_DELETED, False) else document
+
+    expression = _expression(query, schema, json_columns) if query else None
+    if len(changes) > 0:
+        superseded = ~pc.field("_uuid").isin(list(changes.keys()))
+        expression = superseded if expression is None else expression & superseded
+    partitions = _partitions(query) if query else None
+    paths = [
+        os.path.join(db.path, filename)
+        for partition, filename in sorted(manifest["base"].items())
+        if partitions is None or int(partition) in partitions
+    ]
+    documents = []
+    if len(paths) > 0:
+        table = ds.dataset(paths, schema=schema, format="parquet").to_table(
+            columns=names, filter=expression
+        )
+        documents = _to_documents(table, json_columns)
+    documents += [document for document in changes.values() if document is not None]
+
+    if query:
+        documents = [document for document in documents if match(document, query)]
+    return documents
+
+
+def _write(db, manifest, documents, removed):
+    """Write upserted (merged) documents and removals to a delta file, or compact."""
+    if manifest is None:
+        os.makedirs(db.path, exist_ok=True)
+        _compact(db, None, documents, removed)
+        return
+    schema, json_columns, compatible = _merge_schema(manifest, documents)
+    if not compatible or len(manifest["deltas"]) + 1 > MAX_DELTAS:
+        _compact(db, manifest, documents, removed)
+        return
+
+    filename = "delta-{}-{}.parquet".format(manifest["generation"], uuid.uuid4().hex)
+    rows = documents + [{"_uuid": _uuid} for _uuid in removed]
+    table = _to_table(rows, schema, json_columns)
+    table = table.append_column(
+        _DELETED, pa.array([False] * len(documents) + [True] * len(removed), pa.bool_())
+    )
+    _write_table(os.path.join(db.path, filename), table)
+    _write_manifest(
+        db.path,
+        {
+            **manifest,
+            "schema": schema,
+            "json_columns": json_columns,
+            "deltas": manifest["deltas"] + [filename],
+        },
+    )
+
+
+def _compact(db, manifest, documents, removed):
+    """Rewrite the partitions with the changes (the database must be locked)."""
+    current = {}
+    if manifest is not None:
+        current = {document["_uuid"]: document for document in _scan_manifest(db, manifest)}
+    for _uuid in removed:
+        current.pop(_uuid, None)
+    for document in documents:
+        current[document["_uuid"]] = document
+
+    schema, json_columns = _infer_schema(current.values())
+    partitions = {}
+    for document in current.values():
+        partitions.setdefault(_partition(document), []).append(document)
+
+    generation = uuid.uuid4().hex
+    base = {}
+    for partition, partition_documents in sorted(partitions.items()):
+        partition_documents.sort(key=lambda d: (_sort_value(d.get(PARTITION_KEY)), d["_uuid"]))
+        filename = "base-{}-{:04d}.parquet".format(generation, partition)
+        table = _to_table(partition_documents, schema, json_columns)
+        _write_table(os.path.join(db.path, filename), table)
+        base["{:04d}".format(partition)] = filename
+    _write_manifest(
+        db.path,
+        {
+            "generation": generation,
+            "schema": schema,
+            "json_columns": json_columns,
+            "base": base,
+            "deltas": [],
+        },
+    )
+
+    if manifest is not None:
+        for filename in list(manifest["base"].values()) + manifest["deltas"]:
+            try:
+                os.remove(os.path.join(db.path, filename))
+            except FileNotFoundError:
+                pass
+
+
+def _partition(document):
+    value = document.get(PARTITION_KEY, None)
+    value = value if isinstance(value, str) else document["_uuid"]
+    return zlib.crc32(value.encode("utf-8")) % NUM_PARTITIONS
+
+
+def _partitions(query):
+    """Return the partitions which may have documents matching a query (None if all)."""
+    condition = query.get(PARTITION_KEY, None)
+    if isinstance(condition, str):
+        values = [condition]
+    elif isinstance(condition, dict) and isinstance(condition.get("$eq", None), str):
+        values = [condition["$eq"]]
+    elif isinstance(condition, dict) and isinstance(condition.get("$in", None), list):
+        values = condition["$in"]
+    else:
+        for sub_query in query.get("$and", []):
+            partitions = _partitions(sub_query)
+            if partitions is not None:
+                return partitions
+        return None
+    if not all(isinstance(value, str) for value in values):
+        return None
+    return set(_partition({PARTITION_KEY: value}) for value in values)
+
+
+def _sort_value(value):
+    return (0, value) if isinstance(value, str) else (1, json.dumps(value, default=str))
+
+
+def _infer_type(name, values):
+    """Return the Arrow type of values, or None if they are stored in JSON."""
+    try:
+        if name in MAP_COLUMNS and all(isinstance(value, dict) for value in values):
+            items = [item for value in values for item in value.values()]
+            if len(items) == 0:
+                return None
+            type_ = pa.map_(pa.string(), pa.array(items).type)
+        else:
+            type_ = pa.array(values).type
+    except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+        return None
+    return type_ if _writable(type_) else None
+
+
+def _writable(type_):
+    if pa.types.is_struct(type_):
+        return type_.num_fields > 0 and all(_writable(field.type) for field in type_)
+    if pa.types.is_list(type_):
+        return _writable(type_.value_type)
+    if pa.types.is_map(type_):
+        return _writable(type_.item_type)
+    return True
+
+
+def _fits(new, old):
+    """Check if values of a type can be stored in a column of another type."""
+    if new == old or pa.types.is_null(new):
+        return True
+    if pa.types.is_integer(new) and pa.types.is_floating(old):
+        return True
+    if pa.types.is_struct(new) and pa.types.is_struct(old):
+        return all(
+            old.get_field_index(field.name) >= 0 and _fits(field.type, old.field(field.name).type)
+            for field in new
+        )
+    if pa.types.is_list(new) and pa.types.is_list(old):
+        return _fits(new.value_type, old.value_type)
+    if pa.types.is_map(new) and pa.types.is_map(old):
+        return _fits(new.item_type, old.item_type)
+    return False
+
+
+def _infer_schema(documents):
+    """Return the schema of documents and the columns stored in JSON."""
+    values = {"_uuid": []}
+    for document in documents:
+        for key, value in document.items():
+            if value is not None:
+                values.setdefault(key, []).append(value)
+
+    fields, json_columns = [], []
+    for name, column in values.items():
+        type_ = _infer_type(name, column) if name != "_uuid" else pa.string()
+        if type_ is None:
+            type_ = pa.string()
+            json_columns.append(name)
+        fields.append(pa.field(name, type_))
+    return pa.schema(fields), json_columns
+
+
+def _merge_schema(manifest, documents):
+    """Return the schema with columns of documents added.
+
+    Returns:
+        (pyarrow.Schema, list, bool): schema, columns stored in JSON and False if
+                                      the partitions need to be rewritten
+
+    """
+    schema, json_columns = manifest["schema"], list(manifest["json_columns"])
+    new_schema, new_json_columns = _infer_schema(documents)
+    compatible = True
+    for field in new_schema:
+        if field.name in json_columns:
+            continue
+        if field.name in schema.names:
+            if field.name in new_json_columns or not _fits(
+                field.type, schema.field(field.name).type
+            ):
+                compatible = False
+        else:
+            schema = schema.append(field)
+            if field.name in new_json_columns:
+                json_columns.append(field.name)
+    return schema, json_columns, compatible
+
+
+def _to_table(documents, schema, json_columns):
+    arrays = []
+    for field in schema:
+        values = [document.get(field.name, None) for document in documents]
+        if field.name in json_columns:
+            values = [json.dumps(value) if value is not None else None for value in values]
+        elif pa.types.is_map(field.type):
+            values = [list(value.items()) if value is not None else None for value in values]
+        arrays.append(pa.array(values, type=field.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def _to_documents(table, json_columns):
+    maps = [field.name for field in table.schema if pa.types.is_map(field.type)]
+    documents = []
+    for row in table.to_pylist():
+        document = {}
+        for key, value in row.items():
+            if value is None:
+                continue
+            if key in json_columns:
+                value = json.loads(value)
+            elif key in maps:
+                value = {k: _strip_nulls(v) for k, v in value}
+            else:
+                value = _strip_nulls(value)
+            document[key] = value
+        documents.append(document)
+    return documents
+
+
+def _strip_nulls(value):
+    """Remove null fields of structs, which are added for fields of the other documents."""
+    if isinstance(value, dict):
+        return {k: _strip_nulls(v) for k, v in value.items() if v is not None}
+    if isinstance(value, list):
+        return [_strip_nulls(v) for v in value]
+    return value
+
+
+def _expression(query, schema, json_columns):
+    """Translate a query into an Arrow filter selecting a superset of the matching rows.
+
+    Conditions which cannot be translated are evaluated only in process.
+
+    Returns:
+        (pyarrow.compute.Expression): filter, or None if the query cannot be translated
+
+    """
+    expressions = []
+    for key, condition in query.items():
+        if key == "$and":
+            sub_expressions = [_expression(q, schema, json_columns) for q in condition]
+            expressions += [e for e in sub_expressions if e is not None]
+        elif key == "$or":
+            sub_expressions = [_expression(q, schema, json_columns) for q in condition]
+            if len(sub_expressions) > 0 and all(e is not None for e in sub_expressions):
+                expressions.append(reduce(operator.or_, sub_expressions))
+        elif not key.startswith("$"):
+            expression = _field_expression(key, condition, schema, json_columns)
+            if expression is not None:
+                expressions.append(expression)
+    return reduce(operator.and_, expressions) if len(expressions) > 0 else None
+
+
+def _field_reference(key, schema, json_columns):
+    names = key.split(".")
+    if names[0] not in schema.names or names[0] in json_columns:
+        return None, None
+    type_ = schema.field(names[0]).type
+    path, reference = [names[0]], None
+    for name in names[1:]:
+        if pa.types.is_struct(type_) and type_.get_field_index(name) >= 0:
+            index = type_.get_field_index(name)
+            if reference is None:
+                path.append(name)
+            else:
+                reference = pc.struct_field(reference, [index])
+            type_ = type_.field(index).type
+        elif pa.types.is_map(type_):
+            if reference is None:
+                reference = pc.field(*path)
+            reference = pc.map_lookup(reference, pa.scalar(name, type_.key_type), "first")
+            type_ = type_.item_type
+        else:
+            return None, None
+    return (reference if reference is not None else pc.field(*path)), type_
+
+
+def _kind(value):
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, (int, float)):
+        return "number"
+    if isinstance(value, str):
+        return "string"
+    return None
+
+
+def _column_kind(type_):
+    if pa.types.is_boolean(type_):
+        return "bool"
+    if pa.types.is_integer(type_) or pa.types.is_floating(type_):
+        return "number"
+    if pa.types.is_string(type_) or pa.types.is_large_string(type_):
+        return "string"
+    return None
+
+
+def _field_expression(key, condition, schema, json_columns):
+    reference, type_ = _field_reference(key, schema, json_columns)
+    if reference is None:
+        return None
+    if not (isinstance(condition, dict) and any(k.startswith("$") for k in condition.keys())):
+        condition = {"$eq": condition}
+
+    kind = _column_kind(type_)
+    expressions = []
+    for operator_, operand in condition.items():
+        if operator_ == "$exists":
+            expressions.append(reference.is_valid() if operand else reference.is_null())
+        elif kind is None:
+            continue  # lists and nested values are matched in process
+        elif operator_ == "$eq" and operand is None:
+            expressions.append(reference.is_null())
+        elif operator_ == "$eq" and _kind(operand) == kind:
+            expressions.append(reference == operand)
+        elif operator_ == "$in" and all(_kind(v) == kind for v in operand if v is not None):
+            values = [v for v in operand if v is not None]
+            expression = reference.isin(values)
+            if len(values) < len(operand):
+                expression = expression | reference.is_null()
+            expressions.append(expression)
+        elif operator_ in _COMPARISONS.keys() and _kind(operand) == kind:
+            expressions.append(_COMPARISONS[operator_](reference, operand))
+    return reduce(operator.and_, expressions) if len(expressions) > 0 else None
+
+
+def _fix_datetime(data: dict):
+    """Fix datetime object.
+
+    Args:
+        data (dict): Input data
+
+    Returns:
+        (dict): Fixed data
+
+    """
+    _data = {}
+    for key, value in data.items():
+        if isinstance(value, datetime):
+            _data[key] = value.timestamp()
+        else:
+            _data[key] = value
+
+    return _data
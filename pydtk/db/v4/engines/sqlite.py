@@ -0,0 +1,893 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright Toolkit Authors
+
+"""DB Engines for V4DBHandler.
+
+Documents are stored as JSON in SQLite tables with the following columns::
+
+    _uuid           primary key
+    document        the document in JSON
+    $.<key>         virtual column generated from the document for each indexed key
+
+`record_id`, `path` and the keys of the configured indexes have generated columns with
+indexes, which are used by queries, sorting and grouping on the keys.
+Queries made by `PQL.find` are translated into SQL with `json_extract`.
+
+"""
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from numbers import Number
+from typing import Optional
+
+from ..deps import pql as PQL
+from . import (
+    apply_projection,
+    decode_cursor,
+    get_connection,
+    get_projection,
+    keyset_order,
+    keyset_query,
+)
+from ._aggregation import ACCUMULATORS, get_accumulators, group_documents
+
+DEFAULT_DB_NAME = "default"
+DEFAULT_COLLECTION_NAME = "default"
+GENERATED_KEYS = ["record_id", "path"]  # keys with generated columns in every table
+BATCH_SIZE = 500  # number of UUIDs in a statement
+
+_COMPARISONS = {
+    "$gt": (">", lambda a, b: a > b),
+    "$gte": (">=", lambda a, b: a >= b),
+    "$lt": ("<", lambda a, b: a < b),
+    "$lte": ("<=", lambda a, b: a <= b),
+}
+_REGEX_FLAGS = "imsx"
+
+
+class SQLiteCollection(object):
+    """Table of documents in a SQLite database."""
+
+    def __init__(self, path, name):
+        """Initialize SQLiteCollection.
+
+        Args:
+            path (str): path to the database file
+            name (str): table name
+
+        """
+        self.path = path
+        self.name = name
+        self._schema = None  # (database, schema version, table exists, generated columns)
+        self._lock = threading.Lock()
+
+    @property
+    def connection(self):
+        """Connection to the database used in the current thread."""
+        return get_connection(
+            ("sqlite", self.path, threading.get_ident()),
+            lambda: _open_connection(self.path),
+            close=lambda connection: connection.close(),
+            validate=lambda connection: connection.file_id == _file_id(self.path),
+        )
+
+    @property
+    def table(self):
+        """Quoted table name."""
+        return _quote(self.name)
+
+    def schema(self, connection=None):
+        """Return the state of the table, which is cached until the schema is changed.
+
+        Args:
+            connection (sqlite3.Connection): connection (if None, `self.connection`)
+
+        Returns:
+            (bool, dict): True if the table exists, and key -> generated column
+
+        """
+        connection = connection if connection is not None else self.connection
+        version = connection.execute("PRAGMA schema_version").fetchone()[0]
+        with self._lock:
+            if self._schema is not None and self._schema[:2] == (connection.file_id, version):
+                return self._schema[2:]
+
+        rows = connection.execute("PRAGMA table_xinfo({})".format(self.table)).fetchall()
+        columns = {"_uuid": "_uuid"} if len(rows) > 0 else {}
+        for row in rows:
+            if row[6] in (2, 3) and row[1].startswith("$."):
+                columns[row[1][2:]] = row[1]
+        with self._lock:
+            self._schema = (connection.file_id, version, len(rows) > 0, columns)
+        return len(rows) > 0, columns
+
+    def fields(self):
+        """Return SQL expressions of the fields of the documents in the table.
+
+        Returns:
+            (_Fields): fields
+
+        """
+        return _Fields("document", self.schema()[1])
+
+
+class _Connection(sqlite3.Connection):
+    """Connection remembering the file it was opened for."""
+
+    file_id = None
+
+
+def _file_id(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_dev, stat.st_ino
+
+
+def _open_connection(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    connection = sqlite3.connect(
+        path,
+        timeout=60,
+        isolation_level="IMMEDIATE",
+        check_same_thread=False,
+        factory=_Connection,
+    )
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.create_function("regexp", 2, _regexp, deterministic=True)
+    connection.create_function("pydtk_merge", 2, _merge, deterministic=True)
+    connection.create_aggregate("pydtk_group", 4, _GroupAggregate)
+    connection.file_id = _file_id(path)
+    return connection
+
+
+def _regexp(pattern, value):
+    return value is not None and re.search(pattern, value) is not None
+
+
+def _merge(document, fields):
+    return json.dumps({**json.loads(document), **json.loads(fields)})
+
+
+class _GroupAggregate(object):
+    """Aggregate function grouping documents with the accumulators of `_aggregation`."""
+
+    def __init__(self):
+        self.accumulators = None
+        self.group_by = None
+        self.documents = []
+
+    def step(self, accumulators, group_by, rowid, document):
+        self.accumulators, self.group_by = accumulators, group_by
+        self.documents.append((rowid, document))
+
+    def finalize(self):
+        # Documents are aggregated in the order of insertion as in the other engines
+        documents = [json.loads(document) for _, document in sorted(self.documents)]
+        accumulators = json.loads(self.accumulators)
+        return json.dumps(group_documents(documents, self.group_by, accumulators)[0])
+
+
+def connect(
+    db_host: str, db_name: Optional[str] = None, collection_name: Optional[str] = None, **kwargs
+):
+    """Connect to DB.
+
+    Args:
+        db_host (str): directory of the database files
+        db_name (str): database name (the file `<db_host>/<db_name>.sqlite` is used)
+        collection_name (str): collection (table) name
+
+    Returns:
+        (SQLiteCollection): connection (connections are shared with the other handlers
+                            in each thread)
+
+    """
+    if db_name is None:
+        db_name = DEFAULT_DB_NAME
+    if collection_name is None:
+        collection_name = DEFAULT_COLLECTION_NAME
+
+    path = os.path.join(os.path.abspath(db_host), "{}.sqlite".format(db_name))
+    return SQLiteCollection(path, collection_name)
+
+
+def read(
+    db,
+    query: Optional[dict] = None,
+    pql: any = None,
+    group_by: Optional[str] = None,
+    order_by: Optional[str] = None,
+    limit: Optional[int] = None,
+    offset: Optional[int] = None,
+    handler: any = None,
+    disable_count_total: bool = False,
+    fields: Optional[list] = None,
+    exclude: Optional[list] = None,
+    after: Optional[str] = None,
+    **kwargs
+):
+    """Read data from DB.
+
+    Pages (`limit` or `after`) are sorted by `order_by` followed by `_uuid`.
+    Records are grouped by SQLite with the aggregations of the columns in the handler config.
+
+    Args:
+        db (SQLiteCollection): DB connection
+        query (dict or Query): Query to select items
+        pql (PQL) Python-Query-Language to select items
+        group_by (str): Aggregate by this key
+        order_by (list): column name to sort by with format [ ( column1, 1 or -1 ), ... ]
+        limit (int): number of items to return per a page
+        offset (int): offset of cursor
+        handler (BaseDBHandler): DBHandler
+        disable_count_total (bool): set True to avoid counting total number of records
+        fields (list): names of the fields to fetch (if None, all the fields are fetched)
+        exclude (list): names of the fields not to fetch
+        after (str): cursor token of the last record of the previous page
+        **kwargs: kwargs for function `pandas.read_sql_query`
+                  or `influxdb.DataFrameClient.query`
+
+    Returns:
+        (list, int): list of data and total number of records
+
+    """
+    if limit is None:
+        limit = 0
+    if offset is None:
+        offset = 0
+
+    if pql is not None and query is not None:
+        raise ValueError("Either query or pql can be specified")
+
+    if pql:
+        query = PQL.find(pql)
+
+    projection = get_projection(fields, exclude)
+    if after is not None or limit > 0:
+        order_by = keyset_order(order_by)
+
+    if not db.schema()[0]:
+        return [], 0
+
+    fields_ = db.fields()
+    where, params = _where_clause(query, fields_)
+    if group_by is not None:
+        accumulators = get_accumulators(handler, group_by, order_by, fields, exclude)
+        if fields is not None:
+            # Keys to group and sort by are needed after the projection
+            keys = [group_by] + [item[0] for item in order_by or []]
+            projection = {**projection, **{key: 1 for key in keys}}
+        sql, params = _group_statement(db, where, params, group_by, accumulators)
+        count_sql = "SELECT COUNT(*) FROM ({})".format(sql)
+        sql = "SELECT document FROM ({}) AS page".format(sql)
+        fields_ = _Fields("document")
+    else:
+        sql = "SELECT document FROM {}".format(db.table)
+        count_sql = "SELECT COUNT(*) FROM {} WHERE {}".format(db.table, where)
+        sql += " WHERE {}".format(where)
+    count_params = list(params)
+
+    if after is not None:
+        after_where, after_params = _where_clause(
+            keyset_query(order_by, decode_cursor(after, order_by)), fields_
+        )
+        sql += "{} ({})".format(" AND" if group_by is None else " WHERE", after_where)
+        params = params + after_params
+    sql, params = _paginate(sql, params, fields_, order_by, limit, offset)
+
+    connection = db.connection
+    data = [
+        apply_projection(json.loads(row[0]), projection) for row in connection.execute(sql, params)
+    ]
+    if disable_count_total or (limit == 0 and offset == 0 and after is None):
+        count_total = len(data)
+    else:
+        count_total = connection.execute(count_sql, count_params).fetchone()[0]
+
+    return data, count_total
+
+
+def count(
+    db,
+    query: Optional[dict] = None,
+    pql: any = None,
+    group_by: Optional[str] = None,
+    estimated: bool = False,
+    **kwargs
+):
+    """Count records in DB.
+
+    Args:
+        db (SQLiteCollection): DB connection
+        query (dict or Query): Query to select items
+        pql (PQL) Python-Query-Language to select items
+        group_by (str): Count groups by this key
+        estimated (bool): not used (counts are exact)
+
+    Returns:
+        (int): number of records (or groups)
+
+    """
+    if pql is not None and query is not None:
+        raise ValueError("Either query or pql can be specified")
+
+    if pql:
+        query = PQL.find(pql)
+
+    if not db.schema()[0]:
+        return 0
+
+    fields = db.fields()
+    where, params = _where_clause(query, fields)
+    if group_by is None:
+        sql = "SELECT COUNT(*) FROM {} WHERE {}".format(db.table, where)
+    else:
+        sql = "SELECT COUNT(*) FROM (SELECT 1 FROM {} WHERE {} GROUP BY {})".format(
+            db.table, where, fields.value(group_by)
+        )
+    return db.connection.execute(sql, params).fetchone()[0]
+
+
+def read_iter(
+    db,
+    query: Optional[dict] = None,
+    pql: any = None,
+    order_by: Optional[list] = None,
+    batch_size: int = 1000,
+    fields: Optional[list] = None,
+    exclude: Optional[list] = None,
+    **kwargs
+):
+    """Read data from DB batch by batch.
+
+    Args:
+        db (SQLiteCollection): DB connection
+        query (dict or Query): Query to select items
+        pql (PQL) Python-Query-Language to select items
+        order_by (list): column name to sort by with format [ ( column1, 1 or -1 ), ... ]
+        batch_size (int): number of items in a batch
+        fields (list): names of the fields to fetch (if None, all the fields are fetched)
+        exclude (list): names of the fields not to fetch
+
+    Yields:
+        (list): list of data
+
+    """
+    if pql is not None and query is not None:
+        raise ValueError("Either query or pql can be specified")
+
+    if pql:
+        query = PQL.find(pql)
+
+    projection = get_projection(fields, exclude)
+    if not db.schema()[0]:
+        return
+
+    fields_ = db.fields()
+    where, params = _where_clause(query, fields_)
+    sql = "SELECT document FROM {} WHERE {}".format(db.table, where)
+    sql, params = _paginate(sql, params, fields_, order_by)
+
+    cursor = db.connection.execute(sql, params)
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if len(rows) == 0:
+            break
+        yield [apply_projection(json.loads(row[0]), projection) for row in rows]
+
+
+def read_one(db, query: Optional[dict] = None, fields: Optional[list] = None, **kwargs):
+    """Read a single record from DB.
+
+    Args:
+        db (SQLiteCollection): DB connection
+        query (dict): Query to select the record
+        fields (list): names of the fields to fetch (if None, all the fields are fetched)
+
+    Returns:
+        (dict): the record, or None if not found
+
+    """
+    if not db.schema()[0]:
+        return None
+    where, params = _where_clause(query, db.fields())
+    sql = "SELECT document FROM {} WHERE {} LIMIT 1".format(db.table, where)
+    row = db.connection.execute(sql, params).fetchone()
+    if row is None:
+        return None
+    projection = {field: 1 for field in fields} if fields is not None else None
+    return apply_projection(json.loads(row[0]), projection)
+
+
+def create_indexes(db, indexes, **kwargs):
+    """Create indexes on the collection.
+
+    Each key of the indexes gets a generated column, which is used by queries on the key.
+    Values of indexed keys are expected to be scalars (i.e. not lists).
+
+    Args:
+        db (SQLiteCollection): DB connection
+        indexes (list): list of dicts with keys 'keys' (list of (key, 1 or -1)) and 'unique'
+
+    """
+    connection = db.connection
+    _ensure_table(db, connection)
+    for index in indexes:
+        keys = [(key, int(direction)) for key, direction in index["keys"]]
+        if [key for key, _ in keys] == ["_uuid"]:
+            continue  # primary key
+        for key, _ in keys:
+            _ensure_column(db, connection, key)
+        unique = index.get("unique", False)
+        name = "{}/{}{}".format(
+            db.name,
+            ",".join("{}{}".format("-" if direction < 0 else "", key) for key, direction in keys),
+            "/unique" if unique else "",
+        )
+        connection.execute(
+            "CREATE {}INDEX IF NOT EXISTS {} ON {} ({})".format(
+                "UNIQUE " if unique else "",
+                _quote(name),
+                db.table,
+                ", ".join(
+                    "{} {}".format(_column(key), "DESC" if direction < 0 else "ASC")
+                    for key, direction in keys
+                ),
+            )
+        )
+
+
+def upsert(db, data, **kwargs):
+    """Write data to DB.
+
+    Fields of existing records are updated with those of the given ones,
+    and all the records are written in a single transaction.
+
+    Args:
+        db (SQLiteCollection): DB connection
+        data (list): data to save
+
+    """
+    records = {}
+    for record in data:
+        _record = _fix_datetime(record)
+        uuid = _record["_uuid"]
+        records[uuid] = {**records[uuid], **_record} if uuid in records.keys() else _record
+    if len(records) == 0:
+        return
+
+    connection = db.connection
+    _ensure_table(db, connection)
+    with connection:
+        connection.executemany(
+            "INSERT INTO {} (_uuid, document) VALUES (?, ?) "
+            "ON CONFLICT (_uuid) DO UPDATE SET document = pydtk_merge(document, excluded.document)"
+            "".format(db.table),
+            [(uuid, _dumps(record)) for uuid, record in records.items()],
+        )
+
+
+def remove(db, uuids, **kwargs):
+    """Remove data from DB.
+
+    Args:
+        db (SQLiteCollection): DB connection
+        uuids (list): A list of unique IDs
+
+    """
+    uuids = list(uuids)
+    if len(uuids) == 0 or not db.schema()[0]:
+        return
+    connection = db.connection
+    with connection:
+        for i in range(0, len(uuids), BATCH_SIZE):
+            batch = uuids[i : i + BATCH_SIZE]
+            connection.execute(
+                "DELETE FROM {} WHERE _uuid IN ({})".format(db.table, ", ".join("?" * len(batch))),
+                batch,
+            )
+
+
+def drop_table(db, name, **kwargs):
+    """Drop a table from DB.
+
+    Args:
+        db (SQLiteCollection): DB connection
+        name (str): Name of the target table
+
+    """
+    db.connection.execute("DROP TABLE IF EXISTS {}".format(_quote(name)))
+
+
+def exist_table(db, name, **kwargs):
+    """Check if the specified table (collection) exist.
+
+    Args:
+        db (SQLiteCollection): DB connection
+        name (str): Name of the target table
+
+    """
+    row = db.connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+    ).fetchone()
+    return row is not None
+
+
+def _quote(name):
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def _column(key):
+    return _quote("$." + key)
+
+
+def _json_path(key):
+    """Return a SQL literal of the JSON path of a key (e.g. 'contents./points')."""
+    path = "$" + "".join('."{}"'.format(k) for k in key.split(".")) if key is not None else "$"
+    return "'{}'".format(path.replace("'", "''"))
+
+
+def _ensure_table(db, connection):
+    if db.schema(connection)[0]:
+        return
+    columns = "".join(
+        ", {} GENERATED ALWAYS AS (json_extract(document, {})) VIRTUAL".format(
+            _column(key), _json_path(key)
+        )
+        for key in GENERATED_KEYS
+    )
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS {} (_uuid TEXT PRIMARY KEY NOT NULL, document TEXT NOT NULL{})"
+        "".format(db.table, columns)
+    )
+    for key in GENERATED_KEYS:
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS {} ON {} ({})".format(
+                _quote("{}/{}".format(db.name, key)), db.table, _column(key)
+            )
+        )
+
+
+def _ensure_column(db, connection, key):
+    if key in db.schema(connection)[1].keys():
+        return
+    try:
+        connection.execute(
+            "ALTER TABLE {} ADD COLUMN {} GENERATED ALWAYS AS (json_extract(document, {})) VIRTUAL"
+            "".format(db.table, _column(key), _json_path(key))
+        )
+    except sqlite3.OperationalError as e:
+        if "duplicate column name" not in str(e):
+            raise  # the column has been added by another process otherwise
+
+
+def _group_statement(db, where, params, group_by, accumulators):
+    """Return a statement aggregating the documents matching a condition in each group."""
+    for accumulator in accumulators.values():
+        if accumulator not in ACCUMULATORS.keys():
+            raise ValueError("Unsupported aggregation: {}".format(accumulator))
+    sql = (
+        "SELECT pydtk_group(?, ?, rowid, document) AS document FROM {} WHERE {} "
+        "GROUP BY {} ORDER BY MIN(rowid)".format(db.table, where, db.fields().value(group_by))
+    )
+    return sql, [json.dumps(accumulators), group_by] + params
+
+
+def _paginate(sql, params, fields, order_by=None, limit=0, offset=0):
+    if order_by is not None and len(order_by) > 0:
+        sql += " ORDER BY " + ", ".join(
+            "{} {}".format(fields.value(key), "DESC" if int(direction) < 0 else "ASC")
+            for key, direction in order_by
+        )
+    if limit > 0 or offset > 0:
+        sql += " LIMIT ? OFFSET ?"
+        params = params + [limit if limit > 0 else -1, offset]
+    return sql, params
+
+
+class _Fields(object):
+    """SQL expressions of the fields of JSON documents."""
+
+    def __init__(self, source, columns=None, depth=0, value=None, type_=None):
+        """Initialize _Fields.
+
+        Args:
+            source (str): SQL expression of the documents in JSON
+            columns (dict): key -> generated column
+            depth (int): depth of nested `json_each`
+            value (str): SQL expression of the value of the documents (e.g. array elements)
+            type_ (str): SQL expression of the JSON type of the documents
+
+        """
+        self.source = source
+        self.columns = columns or {}
+        self.depth = depth
+        self._value = value
+        self._type = type_
+
+    def indexed(self, key):
+        return key in self.columns.keys()
+
+    def value(self, key):
+        if key is None:
+            return self._value
+        if key in self.columns.keys():
+            return _quote(self.columns[key])
+        return "json_extract({}, {})".format(self.source, _json_path(key))
+
+    def type(self, key):
+        if key is None:
+            return self._type
+        if key == "_uuid" and self.indexed(key):
+            return "'text'"
+        return "json_type({}, {})".format(self.source, _json_path(key))
+
+    def elements(self):
+        """Return the fields of elements of arrays iterated by `json_each`.
+
+        Returns:
+            (str, _Fields): alias of `json_each` and the fields of the elements
+
+        """
+        alias = "e{}".format(self.depth)
+        return alias, _Fields(
+            "IIF({0}.type IN ('object', 'array'), {0}.value, NULL)".format(alias),
+            depth=self.depth + 1,
+            value="{}.value".format(alias),
+            type_="{}.type".format(alias),
+        )
+
+
+def _where_clause(query, fields):
+    """Translate a MongoDB-style query into a SQL condition.
+
+    Returns:
+        (str, list): condition and its parameters
+
+    """
+    params = []
+    where = _where(query, fields, params) if query else "1"
+    return where, params
+
+
+def _where(query, fields, params):
+    clauses = []
+    for key, value in query.items():
+        if key in ("$and", "$or", "$nor"):
+            conditions = ["({})".format(_where(item, fields, params)) for item in value]
+            if key == "$and":
+                clauses.append(" AND ".join(conditions) or "1")
+            elif key == "$or":
+                clauses.append(" OR ".join(conditions) or "0")
+            else:
+                clauses.append(_negate(" OR ".join(conditions) or "0"))
+        elif key.startswith("$"):
+            raise ValueError("Unsupported query operator: {}".format(key))
+        else:
+            clauses.append(_field_condition(key, value, fields, params))
+    return " AND ".join("({})".format(clause) for clause in clauses) or "1"
+
+
+def _negate(condition):
+    # Conditions on missing fields are NULL, which must be false before negation
+    return "NOT IFNULL(({}), 0)".format(condition)
+
+
+def _field_condition(key, value, fields, params):
+    if isinstance(value, dict) and any(k.startswith("$") for k in value.keys()):
+        clauses = [
+            _operator_condition(key, operator, operand, value, fields, params)
+            for operator, operand in value.items()
+            if operator != "$options"
+        ]
+        return " AND ".join("({})".format(clause) for clause in clauses) or "1"
+    if isinstance(value, re.Pattern):
+        return _operator_condition(key, "$regex", value, {}, fields, params)
+    return _match(key, [value], fields, params)
+
+
+def _operator_condition(key, operator, operand, spec, fields, params):
+    if operator == "$eq":
+        return _match(key, [operand], fields, params)
+    if operator == "$ne":
+        return _negate(_match(key, [operand], fields, params))
+    if operator == "$in":
+        return _match(key, list(operand), fields, params)
+    if operator == "$nin":
+        return _negate(_match(key, list(operand), fields, params))
+    if operator in _COMPARISONS.keys():
+        operand = _fix_value(operand)
+        condition = _compare(fields.value(key), fields.type(key), operator, operand, params)
+        if operand is None and operator in ("$gte", "$lte"):
+            condition = "{} IS NULL OR {}".format(fields.type(key), condition)
+        return _or_elements(
+            key,
+            fields,
+            condition,
+            lambda value, type_: _compare(value, type_, operator, operand, params),
+        )
+    if operator == "$exists":
+        return "{} IS {}NULL".format(fields.type(key), "NOT " if operand else "")
+    if operator == "$regex":
+        pattern = operand.pattern if isinstance(operand, re.Pattern) else operand
+        options = "".join(f for f in spec.get("$options", "") if f in _REGEX_FLAGS)
+        if isinstance(operand, re.Pattern):
+            options += "".join(
+                f
+                for f in _REGEX_FLAGS
+                if operand.flags & getattr(re, f.upper()) and f not in options
+            )
+        if options:
+            pattern = "(?{}){}".format(options, pattern)
+        condition = "{} = 'text' AND {} REGEXP ?".format(fields.type(key), fields.value(key))
+        params.append(pattern)
+        return _or_elements(
+            key,
+            fields,
+            condition,
+            lambda value, type_: _regex(value, type_, pattern, params),
+        )
+    if operator == "$not":
+        if isinstance(operand, (str, re.Pattern)):
+            operand = {"$regex": operand}
+        return _negate(_field_condition(key, operand, fields, params))
+    if operator == "$all":
+        return " AND ".join("({})".format(_match(key, [v], fields, params)) for v in operand) or "0"
+    if operator == "$size":
+        params.append(operand)
+        return "{} = 'array' AND json_array_length({}, {}) = ?".format(
+            fields.type(key), fields.source, _json_path(key)
+        )
+    if operator == "$elemMatch":
+        alias, elements = fields.elements()
+        if all(k.startswith("$") for k in operand.keys()):
+            condition = _field_condition(None, operand, elements, params)
+        else:
+            condition = _where(operand, elements, params)
+        return "{} = 'array' AND EXISTS (SELECT 1 FROM json_each({}, {}) AS {} WHERE {})".format(
+            fields.type(key), fields.source, _json_path(key), alias, condition
+        )
+    raise ValueError("Unsupported query operator: {}".format(operator))
+
+
+def _or_elements(key, fields, condition, element_condition):
+    """Return a condition also matching arrays with an element matching the condition.
+
+    Indexed keys are expected to have scalars, which keeps the condition usable with indexes.
+
+    """
+    if fields.indexed(key):
+        return condition
+    alias, elements = fields.elements()
+    return (
+        "({}) OR ({} = 'array' AND EXISTS (SELECT 1 FROM json_each({}, {}) AS {} WHERE {}))"
+        "".format(
+            condition,
+            fields.type(key),
+            fields.source,
+            _json_path(key),
+            alias,
+            element_condition(elements.value(None), elements.type(None)),
+        )
+    )
+
+
+def _match(key, values, fields, params):
+    """Return a condition matching a field equal to one of the values (or containing it)."""
+    values = [_fix_value(value) for value in values]
+    condition = _equals_any(fields.value(key), fields.type(key), values, params)
+    if any(value is None for value in values):
+        condition = "{} IS NULL OR {}".format(fields.type(key), condition)
+    return _or_elements(
+        key,
+        fields,
+        condition,
+        lambda value, type_: _equals_any(value, type_, values, params),
+    )
+
+
+def _equals_any(value, type_, values, params):
+    clauses = []
+    strings = [v for v in values if isinstance(v, str)]
+    if len(strings) > 0:
+        clauses.append(
+            "{} = 'text' AND {} IN ({})".format(type_, value, ", ".join("?" * len(strings)))
+        )
+        params.extend(strings)
+    numbers = [v for v in values if isinstance(v, Number) and not isinstance(v, bool)]
+    if len(numbers) > 0:
+        clauses.append(
+            "{} IN ('integer', 'real') AND {} IN ({})".format(
+                type_, value, ", ".join("?" * len(numbers))
+            )
+        )
+        params.extend(numbers)
+    for boolean in (True, False):
+        if any(v is boolean for v in values):
+            clauses.append("{} = '{}'".format(type_, json.dumps(boolean)))
+    if any(v is None for v in values):
+        clauses.append("{} = 'null'".format(type_))
+    for v in values:
+        if isinstance(v, (dict, list)):
+            clauses.append("{} IN ('object', 'array') AND {} = json(?)".format(type_, value))
+            params.append(json.dumps(v))
+        elif not isinstance(v, (str, Number)) and v is not None:
+            raise ValueError("Unsupported value in query: {}".format(v))
+    return " OR ".join("({})".format(clause) for clause in clauses) or "0"
+
+
+def _compare(value, type_, operator, operand, params):
+    sql_operator, compare = _COMPARISONS[operator]
+    if isinstance(operand, bool):
+        # false < true as in MongoDB
+        matches = [v for v in (False, True) if compare(v, operand)]
+        return " OR ".join("{} = '{}'".format(type_, json.dumps(v)) for v in matches) or "0"
+    if operand is None:
+        return "{} = 'null'".format(type_) if operator in ("$gte", "$lte") else "0"
+    if isinstance(operand, Number):
+        params.append(operand)
+        return "{} IN ('integer', 'real') AND {} {} ?".format(type_, value, sql_operator)
+    if isinstance(operand, str):
+        params.append(operand)
+        return "{} = 'text' AND {} {} ?".format(type_, value, sql_operator)
+    raise ValueError("Unsupported value to compare: {}".format(operand))
+
+
+def _regex(value, type_, pattern, params):
+    params.append(pattern)
+    return "{} = 'text' AND {} REGEXP ?".format(type_, value)
+
+
+def _fix_value(value):
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, tuple):
+        return list(value)
+    return value
+
+
+def _dumps(document):
+    """Dump a document into JSON, where NaN and infinity are replaced with null."""
+    try:
+        return json.dumps(document, allow_nan=False)
+    except ValueError:
+        return json.dumps(_replace_non_finite(document), allow_nan=False)
+
+
+def _replace_non_finite(value):
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, dict):
+        return {k: _replace_non_finite(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_replace_non_finite(v) for v in value]
+    return value
+
+
+def _fix_datetime(data: dict):
+    """Fix datetime object.
+
+    Args:
+        data (dict): Input data
+
+    Returns:
+        (dict): Fixed data
+
+    """
+    _data = {}
+    for key, value in data.items():
+        if isinstance(value, datetime):
+            _data[key] = value.timestamp()
+        else:
+            _data[key] = value
+
+    return _data
@@ -5,12 +5,20 @@
 
 """DB Engines for V4DBHandler."""
 
+import json
 import logging
+import os
+import stat
+import tempfile
 from datetime import datetime
+from functools import partial
 from typing import Optional
 
 from tinydb import Query, TinyDB
 from tinydb import __version__ as tinydb_version
+from tinydb.storages import JSONStorage
+
+from . import apply_projection, get_connection, get_projection, same_file
 
 logger = logging.getLogger(__name__)
 
@@ -25,28 +33,106 @@ def connect(db_host: str, collection_name: Optional[str] = None, **kwargs):
         collection_name (str): collection name
 
     Returns:
-        (any): connection
+        (any): connection (shared with the other handlers in this process)
 
     """
     if collection_name is None:
         collection_name = DEFAULT_COLLECTION_NAME
 
+    return get_connection(
+        ("tinydb", os.path.abspath(db_host), collection_name),
+        partial(_open, db_host, collection_name),
+        close=lambda db: db.close(),
+        validate=lambda db: same_file(db._storage._handle, db_host),
+    )
+
+
+class AtomicJSONStorage(JSONStorage):
+    """JSON storage replacing the file atomically on writes.
+
+    Data are written to a temporary file which is then renamed to the DB file,
+    so that readers never see a half-written file.
+
+    """
+
+    def __init__(self, path, create_dirs=False, encoding=None, **kwargs):
+        """Initialize AtomicJSONStorage.
+
+        Args:
+            path (str): path to the JSON file
+            create_dirs (bool): create the parent directories if they do not exist
+            encoding (str): encoding of the file
+            **kwargs: kwargs for function `json.dumps`
+
+        """
+        super().__init__(path, create_dirs=create_dirs, encoding=encoding, **kwargs)
+        self._path = path
+        self._encoding = encoding
+
+    def read(self):
+        """Read data from the file, reopening it if it was replaced by another connection.
+
+        Returns:
+            (dict): data
+
+        """
+        if not same_file(self._handle, self._path):
+            self._reopen()
+        return super().read()
+
+    def write(self, data):
+        """Write data to a temporary file and rename it to the DB file.
+
+        Args:
+            data (dict): data
+
+        """
+        fd, tmp_path = tempfile.mkstemp(
+            prefix=".", suffix=".tmp", dir=os.path.dirname(os.path.abspath(self._path))
+        )
+        try:
+            with open(fd, "w", encoding=self._encoding) as f:
+                f.write(json.dumps(data, **self.kwargs))
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp_path, stat.S_IMODE(os.stat(self._path).st_mode))
+            os.replace(tmp_path, self._path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._reopen()
+
+    def _reopen(self):
+        self._handle.close()
+        self._handle = open(self._path, "r+", encoding=self._encoding)
+
+
+def _open(db_host, collection_name):
     if tinydb_version.startswith("4"):
-        db = TinyDB(db_host)
+        db = TinyDB(db_host, storage=AtomicJSONStorage)
         db.default_table_name = collection_name
     elif tinydb_version.startswith("3"):
-        db = TinyDB(db_host, default_table=collection_name)
+        db = TinyDB(db_host, default_table=collection_name, storage=AtomicJSONStorage)
     else:
         raise RuntimeError("TinyDB version < 3, >4 is not supported")
     return db
 
 
-def read(db, query: Optional[dict or Query] = None, **kwargs):
+def read(
+    db,
+    query: Optional[dict or Query] = None,
+    fields: Optional[list] = None,
+    exclude: Optional[list] = None,
+    **kwargs
+):
     """Read data from DB.
 
     Args:
         db (TinyDB): DB connection
         query (dict or Query): Query to select items
+        fields (list): names of the fields to fetch (if None, all the fields are fetched)
+        exclude (list): names of the fields not to fetch
         **kwargs: kwargs for function `pandas.read_sql_query`
                   or `influxdb.DataFrameClient.query`
 
@@ -59,21 +145,65 @@ def read(db, query: Optional[dict or Query] = None, **kwargs):
     else:
         data = db.all()
 
+    projection = get_projection(fields, exclude)
+    if projection is not None:
+        data = [apply_projection(document, projection) for document in data]
+
     return data, len(data)
 
 
+def update_table(table, updater):
+    """Update the documents of a table in memory and write them to the file at once.
+
+    Args:
+        table (Table): TinyDB table
+        updater (callable): function modifying a dict (key: doc_id, value: document) in place
+
+    """
+    if tinydb_version.startswith("4"):
+        table._update_table(updater)
+        table._next_id = None
+    else:
+        documents = table._read()
+        updater(documents)
+        table._write(documents)
+        table._last_id = max(documents.keys(), default=0)
+
+
+def _default_table(db):
+    if tinydb_version.startswith("4"):
+        return db.table(db.default_table_name)
+    return db._table
+
+
 def upsert(db, data, **kwargs):
     """Write data to DB.
 
+    Records are matched with the existing ones by a map of `_uuid` to doc_id,
+    and the table is written to the file only once.
+
     Args:
         db (TinyDB): DB connection
         data (list): data to save
 
     """
-    for record in data:
-        _record = _fix_datetime(record)
-        uuid = _record["_uuid"]
-        db.upsert(_record, Query()._uuid == uuid)
+    if len(data) == 0:
+        return
+
+    def updater(documents):
+        doc_ids = {document.get("_uuid", None): doc_id for doc_id, document in documents.items()}
+        next_id = max(documents.keys(), default=0) + 1
+        for record in data:
+            _record = _fix_datetime(record)
+            doc_id = doc_ids.get(_record["_uuid"], None)
+            if doc_id is not None:
+                documents[doc_id].update(_record)
+            else:
+                documents[next_id] = _record
+                doc_ids[_record["_uuid"]] = next_id
+                next_id += 1
+
+    update_table(_default_table(db), updater)
 
 
 def remove(db, uuids, **kwargs):
@@ -84,8 +214,15 @@ def remove(db, uuids, **kwargs):
         uuids (list): A list of unique IDs
 
     """
-    for uuid in uuids:
-        db.remove(Query()._uuid == uuid)
+    if len(uuids) == 0:
+        return
+
+    def updater(documents):
+        uuids_to_remove = set(uuids)
+        for doc_id in [k for k, v in documents.items() if v.get("_uuid") in uuids_to_remove]:
+            del documents[doc_id]
+
+    update_table(_default_table(db), updater)
 
 
 def drop_table(db, name, **kwargs):
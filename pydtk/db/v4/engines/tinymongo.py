@@ -5,9 +5,14 @@
 
 """DB Engines for V4DBHandler."""
 
+import fcntl
 import logging
 import os
+import threading
+from contextlib import contextmanager
+from copy import deepcopy
 from datetime import datetime
+from functools import partial
 from typing import Optional
 
 from tinydb import TinyDB
@@ -15,14 +20,32 @@ from tinydb import __version__ as tinydb_version
 from tinydb.database import Document as _Document
 from tinydb.database import StorageProxy as _StorageProxy
 from tinymongo import TinyMongoClient
+from tinymongo.tinymongo import TinyMongoCollection, generate_id
 
 from ..deps import pql as PQL
+from . import (
+    _segments,
+    apply_projection,
+    get_connection,
+    get_projection,
+    paginate,
+    same_file,
+)
+from ._aggregation import get_accumulators, group_documents
+from ._index import IndexedDocuments
+from .tinydb import update_table
 
 logger = logging.getLogger(__name__)
 
 
 DEFAULT_DB_NAME = "default"
 DEFAULT_COLLECTION_NAME = "default"
+SHARES_NESTED_VALUES = True  # records returned by `read` share nested values with the snapshot
+
+_INDEXES = {}  # key: (path to DB file, collection), value: list of index specs
+_SNAPSHOTS = {}  # key: (path to DB file, collection), value: (stat, indexes, IndexedDocuments)
+_UUID_INDEX = {"keys": [("_uuid", 1)], "unique": True}
+_SNAPSHOTS_LOCK = threading.Lock()
 
 
 class Document(_Document):
@@ -55,18 +78,52 @@ class StorageProxy(_StorageProxy):
         return Document(val, doc_id)
 
 
+class ShardedCollection(object):
+    """Collection of a database migrated to the sharded layout by `migrate`."""
+
+    def __init__(self, db_host, db_name, collection_name):
+        """Initialize ShardedCollection.
+
+        Args:
+            db_host (str): database host
+            db_name (str): database name
+            collection_name (str): collection name
+
+        """
+        self._db_host = db_host
+        self._db_name = db_name
+        self._collection_name = collection_name
+        self.store = _segments.get_store(_shards_path(db_host, db_name), collection_name)
+        self._parser = TinyMongoCollection(collection_name)
+
+    def parse_query(self, query):
+        """Parse a MongoDB-style query into a TinyDB condition.
+
+        Args:
+            query (dict): query
+
+        Returns:
+            (Query): condition
+
+        """
+        return self._parser.parse_query(query)
+
+
 def connect(
     db_host: str, db_name: Optional[str] = None, collection_name: Optional[str] = None, **kwargs
 ):
     """Connect to DB.
 
+    Databases migrated by `migrate` are connected in the sharded layout.
+
     Args:
         db_host (str): database host
         db_name (str): database name
         collection_name (str): collection name
 
     Returns:
-        (TinyMongoCollection): connection
+        (TinyMongoCollection or ShardedCollection): connection (the database is shared with
+                                                    the other handlers in this process)
 
     """
     if db_name is None:
@@ -77,11 +134,33 @@ def connect(
     if not os.path.isdir(db_host):
         os.makedirs(db_host, exist_ok=True)
 
+    if _segments.is_sharded(_shards_path(db_host, db_name)):
+        return ShardedCollection(db_host, db_name, collection_name)
+
+    db = get_connection(
+        ("tinymongo", os.path.abspath(db_host), db_name),
+        partial(_open_database, db_host, db_name),
+        close=lambda db: db.tinydb.close(),
+        validate=lambda db: same_file(
+            db.tinydb._storage._handle, os.path.join(db_host, db_name + ".json")
+        ),
+    )
+    return _get_collection(db, db_host, db_name, collection_name)
+
+
+def _shards_path(db_host, db_name):
+    return os.path.join(db_host, db_name + ".shards")
+
+
+def _open_database(db_host, db_name):
     # Customize storage-proxy
     TinyDB.storage_proxy_class = StorageProxy
 
     connection = TinyMongoClient(db_host)
-    db = getattr(connection, db_name)
+    return getattr(connection, db_name)
+
+
+def _get_collection(db, db_host, db_name, collection_name):
     collection = getattr(db, collection_name)
 
     # Add attributes
@@ -93,15 +172,41 @@ def connect(
 
 
 def read(
-    db, query: Optional[dict] = None, pql: any = None, order_by: Optional[list] = None, **kwargs
+    db,
+    query: Optional[dict] = None,
+    pql: any = None,
+    group_by: Optional[str] = None,
+    order_by: Optional[list] = None,
+    limit: Optional[int] = None,
+    offset: Optional[int] = None,
+    handler: any = None,
+    disable_count_total: bool = False,
+    fields: Optional[list] = None,
+    exclude: Optional[list] = None,
+    after: Optional[str] = None,
+    **kwargs
 ):
     """Read data from DB.
 
+    Pages (`limit` or `after`) are sorted by `order_by` followed by `_uuid`.
+    Records are grouped in process with the aggregations of the columns in the handler config.
+    The records are shallow copies of the documents in the snapshot of the collection,
+    so their nested values (e.g. `contents`) must be copied before being modified in place.
+
     Args:
         db (TinyMongoCollection): DB connection
         query (dict or Query): Query to select items
         pql (PQL) Python-Query-Language to select items
+        group_by (str): Aggregate by this key
         order_by (list): column name to sort by with format [ ( column1, 1 or -1 ), ... ]
+        limit (int): number of items to return per a page
+        offset (int): offset of cursor
+        handler (BaseDBHandler): DBHandler
+        disable_count_total (bool): set True to return the number of records in the page
+                                    as the total number
+        fields (list): names of the fields to fetch (if None, all the fields are fetched)
+        exclude (list): names of the fields not to fetch
+        after (str): cursor token of the last record of the previous page
         **kwargs: kwargs for function `pandas.read_sql_query`
                   or `influxdb.DataFrameClient.query`
 
@@ -109,13 +214,6 @@ def read(
         (list, int): list of data and total number of records
 
     """
-    # Re-initialize DB to reload data (This operation is needed as tinymongo caches data in memory)
-    db = connect(
-        db_host=db._db_host,
-        db_name=db._db_name,
-        collection_name=db._collection_name,
-    )
-
     if pql is not None and query is not None:
         raise ValueError("Either query or pql can be specified")
 
@@ -126,37 +224,278 @@ def read(
     if query:
         query = _fix_query_exists(query)
 
-    if query:
-        if order_by is None:
-            data = db.find(query)
-        else:
-            data = db.find(query).sort(order_by)
-    else:
-        if order_by is None:
-            data = db.find()
-        else:
-            data = db.find().sort(order_by)
+    projection = get_projection(fields, exclude)
+
+    data = _find_indexed(db, query)
+    if group_by is not None:
+        data = _group(data, group_by, order_by, fields, exclude, projection, handler)
+
+    count_total = len(data)
+    data = paginate(data, order_by=order_by, limit=limit, offset=offset, after=after)
+    if disable_count_total:
+        count_total = len(data)
+
+    # Documents in the snapshot are shared among reads
+    if group_by is not None:
+        return [dict(document) for document in data], count_total
+    data = [
+        Document(apply_projection(dict(document), projection), document.doc_id) for document in data
+    ]
 
-    data = list(data)
+    return data, count_total
 
-    return data, len(data)
+
+def _group(documents, group_by, order_by, fields, exclude, projection, handler):
+    """Group documents in process as MongoDB does with `$group`.
+
+    Args:
+        documents (list): documents matching a query
+        group_by (str): Aggregate by this key
+        order_by (list): column name to sort by with format [ ( column1, 1 or -1 ), ... ]
+        fields (list): names of the fields to fetch
+        exclude (list): names of the fields not to fetch
+        projection (dict): projection made by `get_projection`
+        handler (BaseDBHandler): DBHandler
+
+    Returns:
+        (list): aggregated documents
+
+    """
+    if fields is not None:
+        # Keys to group and sort by are needed after the projection
+        keys = [group_by] + [item[0] for item in order_by or []]
+        projection = {**projection, **{key: 1 for key in keys}}
+    documents = [apply_projection(document, projection) for document in documents]
+    accumulators = get_accumulators(handler, group_by, order_by, fields, exclude)
+    return group_documents(documents, group_by, accumulators)
+
+
+def _table_key(db):
+    db_path = os.path.abspath(os.path.join(db._db_host, db._db_name + ".json"))
+    return db_path, db._collection_name
+
+
+def _stat(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def _get_indexes(key):
+    indexes = _INDEXES.get(key, [])
+    if not any([k[0] for k in index["keys"]] == ["_uuid"] for index in indexes):
+        indexes = [_UUID_INDEX] + indexes
+    return indexes
+
+
+def _get_snapshot(db):
+    """Return the documents in the collection with in-process indexes.
+
+    The parsed documents are kept in memory and reused until the DB file is modified
+    (e.g. by another process) or the indexes are changed.
+    Sharded collections are updated incrementally by their stores.
+
+    Args:
+        db (TinyMongoCollection): DB connection
+
+    Returns:
+        (IndexedDocuments): documents
+
+    """
+    key = _table_key(db)
+    sharded = isinstance(db, ShardedCollection)
+    stat = db.store.refresh() if sharded else _stat(key[0])
+    indexes = _get_indexes(key)
+    with _SNAPSHOTS_LOCK:
+        if key in _SNAPSHOTS.keys() and stat is not None:
+            if _SNAPSHOTS[key][:2] == (stat, indexes):
+                return _SNAPSHOTS[key][2]
+
+    if sharded:
+        stat, documents = db.store.snapshot()
+        documents = [Document(document, None) for document in documents]
+        return _set_snapshot(key, stat, documents, indexes)
+
+    database = _open_database(db._db_host, db._db_name)
+    collection = _get_collection(database, db._db_host, db._db_name, db._collection_name)
+    collection.build_table()
+    documents = collection.table.all()
+    database.tinydb.close()
+
+    return _set_snapshot(key, stat, documents, indexes)
+
+
+def _set_snapshot(key, stat, documents, indexes):
+    snapshot = IndexedDocuments(documents, indexes)
+    with _SNAPSHOTS_LOCK:
+        _SNAPSHOTS[key] = (stat, indexes, snapshot)
+    return snapshot
+
+
+def _invalidate_snapshot(db):
+    with _SNAPSHOTS_LOCK:
+        _SNAPSHOTS.pop(_table_key(db), None)
+
+
+def _find_indexed(db, query):
+    """Find documents in the snapshot of the collection using in-process indexes.
+
+    Args:
+        db (TinyMongoCollection): DB connection
+        query (dict): Query to select items
+
+    Returns:
+        (list): documents shared with the snapshot (must not be modified)
+
+    """
+    snapshot = _get_snapshot(db)
+    if not query:
+        return snapshot.documents
+    candidates = snapshot.candidates(query)
+    if candidates is None:
+        candidates = snapshot.documents
+    condition = db.parse_query(query)
+    try:
+        return [document for document in candidates if condition(document)]
+    except (AttributeError, TypeError):
+        return []
+
+
+def read_iter(
+    db,
+    query: Optional[dict] = None,
+    pql: any = None,
+    order_by: Optional[list] = None,
+    batch_size: int = 1000,
+    fields: Optional[list] = None,
+    exclude: Optional[list] = None,
+    **kwargs
+):
+    """Read data from DB batch by batch.
+
+    Note that TinyMongo loads the whole table on reading, so only the post-processes of
+    the handler are done batch by batch.
+
+    Args:
+        db (TinyMongoCollection): DB connection
+        query (dict or Query): Query to select items
+        pql (PQL) Python-Query-Language to select items
+        order_by (list): column name to sort by with format [ ( column1, 1 or -1 ), ... ]
+        batch_size (int): number of items in a batch
+        fields (list): names of the fields to fetch (if None, all the fields are fetched)
+        exclude (list): names of the fields not to fetch
+
+    Yields:
+        (list): list of data
+
+    """
+    data, _ = read(db, query=query, pql=pql, order_by=order_by, fields=fields, exclude=exclude)
+    for i in range(0, len(data), batch_size):
+        yield data[i : i + batch_size]
+
+
+def create_indexes(db, indexes, **kwargs):
+    """Create in-process indexes on the collection.
+
+    TinyMongo has no indexes, so reads of the collection are served from a snapshot of
+    the collection with hash and sorted indexes, which is reloaded when the DB file is modified.
+
+    Args:
+        db (TinyMongoCollection): DB connection
+        indexes (list): list of dicts with keys 'keys' (list of (key, 1 or -1)) and 'unique'
+
+    """
+    key = _table_key(db)
+    _INDEXES[key] = deepcopy(indexes)
+    with _SNAPSHOTS_LOCK:
+        _SNAPSHOTS.pop(key, None)
+
+
+@contextmanager
+def _locked(path):
+    """Lock the DB file against writes by the other processes.
+
+    Args:
+        path (str): path to the DB file
+
+    """
+    with open(path + ".lock", "a") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _update_collection(db, updater):
+    """Update the documents of the collection in memory and write them to the file at once.
+
+    The snapshot of the collection is replaced with the updated documents
+    and the stat of the file taken under the same lock as the write,
+    so a write by another process after this one is never mistaken for this one.
+
+    Args:
+        db (TinyMongoCollection): DB connection
+        updater (callable): function modifying a dict (key: doc_id, value: document) in place
+
+    """
+    if db.table is None:
+        db.build_table()
+
+    updated = {}
+
+    def _updater(documents):
+        updater(documents)
+        updated.update(documents)
+
+    key = _table_key(db)
+    _invalidate_snapshot(db)
+    with _locked(key[0]):
+        update_table(db.table, _updater)
+        stat = _stat(key[0])
+    documents = [Document(document, doc_id) for doc_id, document in updated.items()]
+    _set_snapshot(key, stat, documents, _get_indexes(key))
 
 
 def upsert(db, data, **kwargs):
     """Write data to DB.
 
+    Records are matched with the existing ones by a map of `_uuid` to doc_id,
+    and the DB file is rewritten only once.
+    In the sharded layout, the records are appended to the log of the collection.
+
     Args:
         db (TinyMongoCollection): DB connection
         data (list): data to save
 
     """
-    for record in data:
-        _record = _fix_datetime(record)
-        uuid = record["_uuid"]
-        if db.find_one({"_uuid": uuid}) is not None:
-            db.update({"_uuid": uuid}, _record)
-        else:
-            db.insert(_record)
+    if len(data) == 0:
+        return
+    if isinstance(db, ShardedCollection):
+        records = [_fix_datetime(record) for record in data]
+        for record in records:
+            record.setdefault("_id", generate_id())
+        db.store.upsert(records)
+        return
+
+    def updater(documents):
+        doc_ids = {document.get("_uuid", None): doc_id for doc_id, document in documents.items()}
+        next_id = max(documents.keys(), default=0) + 1
+        for record in data:
+            # Copied not to share nested values between the snapshot and the caller
+            _record = _fix_datetime(deepcopy(record))
+            doc_id = doc_ids.get(_record["_uuid"], None)
+            if doc_id is not None:
+                documents[doc_id].update(_record)
+            else:
+                _record.setdefault("_id", generate_id())
+                documents[next_id] = _record
+                doc_ids[_record["_uuid"]] = next_id
+                next_id += 1
+
+    _update_collection(db, updater)
 
 
 def remove(db, uuids, **kwargs):
@@ -167,8 +506,18 @@ def remove(db, uuids, **kwargs):
         uuids (list): A list of unique IDs
 
     """
-    for uuid in uuids:
-        db.delete_many({"_uuid": uuid})
+    if len(uuids) == 0:
+        return
+    if isinstance(db, ShardedCollection):
+        db.store.remove(uuids)
+        return
+
+    def updater(documents):
+        uuids_to_remove = set(uuids)
+        for doc_id in [k for k, v in documents.items() if v.get("_uuid") in uuids_to_remove]:
+            del documents[doc_id]
+
+    _update_collection(db, updater)
 
 
 def drop_table(db, name, **kwargs):
@@ -179,7 +528,11 @@ def drop_table(db, name, **kwargs):
         name (str): Name of the target table
 
     """
-    if tinydb_version.startswith("4"):
+    with _SNAPSHOTS_LOCK:
+        _SNAPSHOTS.pop((_table_key(db)[0], name), None)
+    if isinstance(db, ShardedCollection):
+        _segments.get_store(_shards_path(db._db_host, db._db_name), name).drop()
+    elif tinydb_version.startswith("4"):
         db.parent.tinydb.drop_table(name)
     else:
         db.parent.tinydb.purge_table(name)
@@ -193,9 +546,70 @@ def exist_table(db, name, **kwargs):
         name (str): Name of the target table
 
     """
+    if isinstance(db, ShardedCollection):
+        return _segments.get_store(_shards_path(db._db_host, db._db_name), name).exists()
     return name in list(db.parent.tinydb.tables())
 
 
+def compact(db, **kwargs):
+    """Merge the log of a sharded collection into its segments.
+
+    Logs are also compacted automatically when they grow
+    over `_segments.COMPACTION_THRESHOLD` bytes.
+
+    Args:
+        db (ShardedCollection): DB connection (collections in a single file are ignored)
+
+    """
+    if isinstance(db, ShardedCollection):
+        db.store.compact()
+
+
+def migrate(
+    db_host: str, db_name: Optional[str] = None, num_shards: int = _segments.DEFAULT_NUM_SHARDS
+):
+    """Migrate a database in a single JSON file to the sharded layout.
+
+    Collections are split into segment files by the hash of `_uuid`, and writes are appended
+    to a log of each collection instead of rewriting the whole file.
+    The JSON file is renamed to `<db_name>.json.migrated` after the migration,
+    and connections made after that use the sharded layout
+    (handlers connected before the migration must be re-created).
+
+    Args:
+        db_host (str): database host
+        db_name (str): database name
+        num_shards (int): number of segment files of each collection
+
+    """
+    if db_name is None:
+        db_name = DEFAULT_DB_NAME
+    path = os.path.join(db_host, db_name + ".json")
+    shards_path = _shards_path(db_host, db_name)
+    if _segments.is_sharded(shards_path):
+        raise FileExistsError("Database is already migrated: {}".format(shards_path))
+
+    collections = {}
+    if os.path.isfile(path):
+        database = TinyDB(path)
+        try:
+            for name in database.tables():
+                collections[name] = [dict(document) for document in database.table(name).all()]
+        finally:
+            database.close()
+    for name, documents in collections.items():
+        for document in documents:
+            if "_uuid" not in document.keys():
+                raise ValueError('"_uuid" not found in a record of "{}"'.format(name))
+
+    _segments.create(shards_path, collections, num_shards=num_shards)
+    if os.path.isfile(path):
+        os.rename(path, path + ".migrated")
+    with _SNAPSHOTS_LOCK:
+        for key in [key for key in _SNAPSHOTS.keys() if key[0] == os.path.abspath(path)]:
+            del _SNAPSHOTS[key]
+
+
 def _fix_query_exists(query):
     if isinstance(query, list):
         fixed_query = []
@@ -8,20 +8,25 @@
 import hashlib
 import importlib
 import inspect
+import json
 import logging
 import os
+import pickle
+import time
 from collections.abc import MutableMapping
 from copy import deepcopy
 from datetime import datetime
+from functools import partial
 
 import iso8601
+import numpy as np
 import pandas as pd
 from addict import Dict as AttrDict
 from deepmerge import Merger
 
 from pydtk.db.exceptions import DatabaseNotInitializedError, InvalidDatabaseConfigError
 from pydtk.db.schemas import get_schema
-from pydtk.db.v4.engines import DB_ENGINES
+from pydtk.db.v4.engines import DB_ENGINES, encode_cursor, keyset_order
 from pydtk.utils.utils import (
     _deepmerge_append_list_unique,
     dtype_string_to_dtype_object,
@@ -72,6 +77,183 @@ def register_handler(db_classes, db_engines):
     return decorator
 
 
+def _to_datetime(_data):
+    if isinstance(_data, str):
+        if ":" in _data or "-" in _data:
+            # ISO format
+            return iso8601.parse_date(_data)
+        else:
+            raise ValueError(
+                f'Unknown format of datetime: "{_data}"'
+                f"Please make sure to use ISO format (YYYY-mm-dd HH:MM:SS.ffffff)"
+            )
+    elif isinstance(_data, float) or isinstance(_data, int):
+        # Epoch time
+        return datetime.fromtimestamp(_data)
+    elif isinstance(_data, datetime):
+        return _data
+    else:
+        raise TypeError(
+            f'Unsupported type ({type(_data).__name__}): "{_data}"'
+            f'Please make sure the type of value "{_data}" is either string or float'
+        )
+
+
+_DTYPE_CONVERTERS = {
+    "string": str,
+    "str": str,
+    "integer": int,
+    "int": int,
+    "float": float,
+    "double": float,
+    "number": float,
+    "list": list,
+    "dict": dict,
+    "datetime": _to_datetime,
+}
+
+_CONFIG_STAMP_KEYS = ["_config_version", "_config_hash"]
+_CONFIG_INTERNAL_KEYS = ["_id", "_uuid"] + _CONFIG_STAMP_KEYS
+
+
+def _get_config_stamp(config):
+    """Return the stamp (version, hash) of a config stored in DB, or None if not stamped."""
+    if "_config_version" not in config.keys() or "_config_hash" not in config.keys():
+        return None
+    return config["_config_version"], config["_config_hash"]
+
+
+def _fingerprint(record):
+    """Return a fingerprint of a record to detect in-place modifications.
+
+    Args:
+        record (dict): record
+
+    Returns:
+        (bytes): digest of the record, or None if it cannot be serialized
+
+    """
+    try:
+        return hashlib.md5(pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)).digest()
+    except (pickle.PicklingError, TypeError, AttributeError):
+        return None
+
+
+_ENSURED_INDEXES = set()  # key: (engine, host, database, table, index specs)
+
+
+def _normalize_indexes(indexes):
+    """Normalize index specifications in configs.
+
+    Args:
+        indexes (list): list of indexes, each of which is a list of keys or a dict with keys
+                        'keys' (list of a key name or [key name, 1 or -1]) and 'unique' (bool)
+
+    Returns:
+        (list): list of dicts with keys 'keys' (list of (key name, direction)) and 'unique',
+                starting with the unique index on `_uuid`
+
+    """
+    specs = [{"keys": [("_uuid", 1)], "unique": True}]
+    for index in indexes:
+        if not isinstance(index, dict):
+            index = {"keys": index}
+        keys = [index["keys"]] if isinstance(index["keys"], str) else index["keys"]
+        keys = [(key, 1) if isinstance(key, str) else (key[0], int(key[1])) for key in keys]
+        if keys == [("_uuid", 1)]:
+            continue
+        specs.append({"keys": keys, "unique": bool(index.get("unique", False))})
+    return specs
+
+
+_CONVERSION_PLANS = {}  # key: (signature of columns, aggregated), value: conversion plan
+_MAX_CONVERSION_PLANS = 128
+
+
+def _get_converter(dtype):
+    """Return a function converting a value to the given dtype.
+
+    Args:
+        dtype (str): dtype in column configurations
+
+    Returns:
+        (callable): converter, or None if the value is kept as it is
+
+    """
+    if dtype.lower() in _DTYPE_CONVERTERS.keys():
+        return _DTYPE_CONVERTERS[dtype.lower()]
+    if dtype.endswith("[]"):
+        return list
+    return None
+
+
+def _compile_conversion_plan(columns, aggregated=False):
+    """Compile column configurations into a conversion plan.
+
+    Args:
+        columns (list): column configurations
+        aggregated (bool): whether the data is aggregated or not
+
+    Returns:
+        (dict): column name -> converter (None if the value is kept as it is),
+                without internal columns (whose names start with '_'), which are never converted
+
+    """
+    plan = {}
+    for column_conf in columns:
+        if column_conf["name"].startswith("_") or column_conf["name"] in plan.keys():
+            # The first configuration is used
+            continue
+        converter = None
+        if "dtype" in column_conf.keys():
+            converter = _get_converter(column_conf["dtype"])
+        if converter is not None and aggregated:
+            aggregation = column_conf.get("aggregation", "first").lower()
+            if aggregation in ["push"]:
+                converter = partial(_convert_each, converter)
+            elif aggregation not in ["first", "min", "max"]:
+                converter = None
+        plan[column_conf["name"]] = converter
+    return plan
+
+
+def _convert_each(converter, values):
+    return [converter(value) for value in values]
+
+
+def _get_conversion_plan(columns, aggregated=False):
+    """Return the cached conversion plan for column configurations.
+
+    Args:
+        columns (list): column configurations
+        aggregated (bool): whether the data is aggregated or not
+
+    Returns:
+        (dict): column name -> converter (None if the value is kept as it is)
+
+    """
+    key = (
+        tuple(
+            (c["name"], c.get("dtype", None), c.get("aggregation", None) if aggregated else None)
+            for c in columns
+        ),
+        aggregated,
+    )
+    plan = _CONVERSION_PLANS.get(key, None)
+    if plan is None:
+        if len(_CONVERSION_PLANS) >= _MAX_CONVERSION_PLANS:
+            _CONVERSION_PLANS.clear()
+        plan = _compile_conversion_plan(columns, aggregated=aggregated)
+        _CONVERSION_PLANS[key] = plan
+    return plan
+
+
+def _check_columns(keys, plan):
+    for key in keys:
+        if not key.startswith("_") and key not in plan:
+            raise InvalidDatabaseConfigError(f'Column "{key}" not found')
+
+
 def _fix_data_type(data_in, columns, inplace=False, aggregated=False):
     """Fix dtype of the input data.
 
@@ -86,66 +268,43 @@ def _fix_data_type(data_in, columns, inplace=False, aggregated=False):
 
     """
     data = data_in if inplace else deepcopy(data_in)
+    plan = _get_conversion_plan(columns, aggregated=aggregated)
+    _check_columns(data.keys(), plan)
 
-    def _fix_dtype(_data, column_conf):
-        if column_conf["dtype"].lower() in ["string", "str"]:
-            return str(_data)
-        elif column_conf["dtype"].lower() in ["integer", "int"]:
-            return int(_data)
-        elif column_conf["dtype"].lower() in ["float", "double", "number"]:
-            return float(_data)
-        elif column_conf["dtype"].lower() in ["list"] or column_conf["dtype"].endswith("[]"):
-            return list(_data)
-        elif column_conf["dtype"].lower() in ["dict"]:
-            return dict(_data)
-        elif column_conf["dtype"].lower() in ["datetime"]:
-            if isinstance(_data, str):
-                if ":" in _data or "-" in _data:
-                    # ISO format
-                    return iso8601.parse_date(_data)
-                else:
-                    raise ValueError(
-                        f'Unknown format of datetime: "{_data}"'
-                        f"Please make sure to use ISO format (YYYY-mm-dd HH:MM:SS.ffffff)"
-                    )
-            elif isinstance(_data, float) or isinstance(_data, int):
-                # Epoch time
-                return datetime.fromtimestamp(_data)
-            elif isinstance(_data, datetime):
-                return _data
-            else:
-                raise TypeError(
-                    f'Unsupported type ({type(_data).__name__}): "{_data}"'
-                    f'Please make sure the type of value "{_data}" is either string or float'
-                )
-        else:
-            pass
+    for key, value in data.items():
+        converter = plan.get(key, None)
+        if value is not None and converter is not None:
+            data[key] = converter(value)
 
-        return _data
+    return data
 
-    for key in data.keys():
-        if key.startswith("_"):
-            continue
-        try:
-            column_conf = next(filter(lambda c: c["name"] == key, columns))
-        except StopIteration:
-            raise InvalidDatabaseConfigError(f'Column "{key}" not found')
-        if "dtype" not in column_conf.keys():
-            continue
-        if data[key] is None:
+
+def _fix_data_types(data, columns, aggregated=False):
+    """Fix dtypes of a batch of data column by column (in-place).
+
+    Args:
+        data (list): list of dicts
+        columns (list): column configurations
+        aggregated (bool): whether the data is aggregated or not
+
+    Returns:
+        (list): data with corrected dtypes
+
+    """
+    plan = _get_conversion_plan(columns, aggregated=aggregated)
+    keys = set()
+    for record in data:
+        keys.update(record.keys())
+    _check_columns(keys, plan)
+
+    for key in keys:
+        converter = plan.get(key, None)
+        if converter is None:
             continue
-        if not aggregated:
-            data[key] = _fix_dtype(data[key], column_conf)
-        else:
-            if "aggregation" not in column_conf.keys():
-                # First
-                data[key] = _fix_dtype(data[key], column_conf)
-            if column_conf["aggregation"].lower() in ["first", "min", "max"]:
-                data[key] = _fix_dtype(data[key], column_conf)
-            elif column_conf["aggregation"].lower() in ["push"]:
-                data[key] = [_fix_dtype(_data, column_conf) for _data in data[key]]
-            else:
-                pass
+        for record in data:
+            value = record.get(key, None)
+            if value is not None:
+                record[key] = converter(value)
 
     return data
 
@@ -226,6 +385,7 @@ class BaseDBHandler(object):
         db_password=None,
         df_name=None,
         read_on_init=False,
+        config_ttl=0.0,
         **kwargs,
     ):
         """Initialize BaseDBHandler.
@@ -238,6 +398,7 @@ class BaseDBHandler(object):
             db_password (str): password (if None, the one in the config file will be used)
             df_name (str): dataframe (table in DB) name (if None, class default value will be used)
             read_on_init (bool): if True, dataframe will be read from database on initialization
+            config_ttl (float): seconds during which the config is not checked for updates in DB
 
         """
         super(BaseDBHandler, self).__init__()
@@ -246,8 +407,19 @@ class BaseDBHandler(object):
         self._data = {}
         self._uuids_duplicated = []
         self._uuids_to_remove = []
+        self._uuids_inserted = set()
+        self._uuids_modified = set()
+        self._fingerprints = {}  # key: _uuid, value: fingerprint of the record when read or saved
+        self._shared = set()  # _uuid of records sharing nested values with the cache of the engine
+        self._config_hash = None
+        self._config_stamp = None  # (version, hash) of the config in DB
+        self._config_checked_at = None
+        self._config_ttl = config_ttl
         self._tables_to_drop = []
         self._count_total = 0
+        self._next_cursor = None
+        self._num_mutations = 0  # incremented whenever self._data is modified
+        self._df_cache = None  # (key, df)
         if df_name is not None:
             self.df_name = df_name
 
@@ -257,6 +429,7 @@ class BaseDBHandler(object):
             self._config = ConfigDict(config["db"]["df_class"][self._df_class])
         except KeyError:
             self._config = ConfigDict()
+        self._default_indexes = self._config.get("indexes", [])
 
         # Initialize deepmerger
         self._merger = Merger(
@@ -275,6 +448,7 @@ class BaseDBHandler(object):
         # Initialize database
         self._initialize_engine(db_engine, db_host, db_name, db_username, db_password)
         self._load_config_from_db()
+        self._ensure_indexes()
 
         # Fetch table
         if read_on_init:
@@ -377,17 +551,50 @@ class BaseDBHandler(object):
         else:
             raise ValueError("Unsupported engine: {}".format(db_engine))
 
-    def _load_config_from_db(self):
-        """Load configs from DB."""
+    def _get_config_hash(self):
+        """Return a hash of the current config to detect modifications."""
+        config = {k: v for k, v in dict(self._config).items() if k not in _CONFIG_INTERNAL_KEYS}
+        pre_hash = json.dumps(config, sort_keys=True, default=str).encode("utf-8")
+        return hashlib.md5(pre_hash).hexdigest()
+
+    def _load_config_from_db(self, force=False):
+        """Load configs from DB if they have been updated since the last load.
+
+        Configs in DB are stamped with a version and a hash on saving, so that only the stamp
+        needs to be fetched when the engine supports `read_one`.
+
+        Args:
+            force (bool): if True, configs are loaded regardless of the stamp and `config_ttl`
+
+        """
         if self._db_engine not in DB_ENGINES.keys():
             return
+        now = time.monotonic()
+        if (
+            not force
+            and self._config_checked_at is not None
+            and now - self._config_checked_at < self._config_ttl
+        ):
+            return
+        engine = DB_ENGINES[self._db_engine]
         try:
-            candidates = DB_ENGINES[self._db_engine].read(self._config_db, handler=self)
-            if len(candidates) > 0:
+            if not force and self._config_stamp is not None and hasattr(engine, "read_one"):
+                stamp = engine.read_one(self._config_db, fields=_CONFIG_STAMP_KEYS)
+                if stamp is not None and _get_config_stamp(stamp) == self._config_stamp:
+                    self._config_checked_at = now
+                    return
+            candidates = engine.read(self._config_db, handler=self)
+            if len(candidates[0]) > 0:
                 if isinstance(candidates[0][0], dict):
-                    self._config = ConfigDict(candidates[0][0])
+                    stamp = _get_config_stamp(candidates[0][0])
+                    if force or stamp is None or stamp != self._config_stamp:
+                        self._config = ConfigDict(deepcopy(candidates[0][0]))
+                        self._config_hash = self._get_config_hash()
+                        self._config_stamp = stamp
+                        self._df_cache = None
                 else:
                     raise TypeError("Unexpected type")
+            self._config_checked_at = now
         except Exception as e:
             self.logger.warning("Failed to load configs from DB: {}".format(str(e)))
 
@@ -396,13 +603,64 @@ class BaseDBHandler(object):
         if self._db_engine not in DB_ENGINES.keys():
             return
         try:
+            config_hash = self._get_config_hash()
+            version = self._config_stamp[0] if self._config_stamp is not None else None
+            version = version + 1 if isinstance(version, int) else 1
             config = dict(self._config)
-            config.update({"_uuid": "__config__"})
+            config.update(
+                {"_uuid": "__config__", "_config_version": version, "_config_hash": config_hash}
+            )
             config = [config]
             DB_ENGINES[self._db_engine].upsert(self._config_db, data=config, handler=self)
+            self._config_hash = config_hash
+            self._config_stamp = (version, config_hash)
+            self._config.__setitem__("_config_version", version, force=True)
+            self._config.__setitem__("_config_hash", config_hash, force=True)
         except Exception as e:
             self.logger.warning("Failed to save configs to DB: {}".format(str(e)))
 
+    def _get_indexes(self):
+        """Return specifications of the indexes on the table.
+
+        Indexes are configured in `indexes` of the config (the default one of the df_class is
+        used for configs saved without it).
+
+        Returns:
+            (list): list of dicts with keys 'keys' (list of (key name, direction)) and 'unique'
+
+        """
+        indexes = self._config["indexes"] if "indexes" in self._config.keys() else None
+        if indexes is None:
+            indexes = self._default_indexes
+        return _normalize_indexes(indexes)
+
+    def _index_key(self, name=None):
+        return (
+            self._db_engine,
+            self._db_host,
+            self._db_name,
+            name if name is not None else self._df_name,
+        )
+
+    def _ensure_indexes(self):
+        """Create indexes on the table if the engine supports indexes.
+
+        Indexes are created once per table in this process.
+
+        """
+        engine = DB_ENGINES.get(self._db_engine, None)
+        if engine is None or not hasattr(engine, "create_indexes"):
+            return
+        indexes = self._get_indexes()
+        key = self._index_key() + (json.dumps(indexes),)
+        if key in _ENSURED_INDEXES:
+            return
+        try:
+            engine.create_indexes(self._db, indexes, handler=self)
+            _ENSURED_INDEXES.add(key)
+        except Exception as e:
+            self.logger.warning("Failed to create indexes: {}".format(str(e)))
+
     def _get_uuid_from_item(self, data_in):
         """Return UUID of the given item.
 
@@ -455,6 +713,40 @@ class BaseDBHandler(object):
         else:
             raise ValueError("Unsupported DB engine: {}".format(self._db_engine))
 
+    def _engine_accepts(self, arg, func_name="read"):
+        """Check if the DB-engine accepts an argument.
+
+        Args:
+            arg (str): name of the argument
+            func_name (str): name of the engine function
+
+        Returns:
+            (bool): True if the argument is accepted
+
+        """
+        func = getattr(DB_ENGINES[self._db_engine], func_name, None)
+        return func is not None and arg in inspect.signature(func).parameters.keys()
+
+    def _count(self, query=None, pql=None, group_by=None):
+        """Return the number of records in DB.
+
+        Args:
+            query (dict): query to select items
+            pql (PQL): Python-Query-Language to select items
+            group_by (str): column name to group
+
+        Returns:
+            (int): number of records (or groups)
+
+        """
+        engine = DB_ENGINES[self._db_engine]
+        if hasattr(engine, "count"):
+            return engine.count(self._db, query=query, pql=pql, group_by=group_by, handler=self)
+        kwargs = {"query": query, "pql": pql, "group_by": group_by}
+        if self._engine_accepts("limit"):
+            return self._read(limit=1, **kwargs)[1]
+        return self._read(**kwargs)[1]
+
     def read(
         self,
         df_name=None,
@@ -465,10 +757,16 @@ class BaseDBHandler(object):
         order_by=None,
         limit=None,
         offset=None,
+        fields=None,
+        exclude=None,
+        after=None,
         **kwargs,
     ):
         """Read data from SQL.
 
+        Pages can be continued by passing `next_cursor` to `after`, which is faster than
+        `offset` for deep pages. Records in pages are sorted by `order_by` and `_uuid`.
+
         Args:
             df_name (str): Deprecated. Dataframe name to read
             query (str SQL query or SQLAlchemy Selectable): query to select items
@@ -478,6 +776,9 @@ class BaseDBHandler(object):
             order_by (srt): column name to sort by
             limit (int): number of items to return per a page
             offset (int): offset of cursor
+            fields (list): names of the fields to fetch (`_uuid` is always fetched)
+            exclude (list): names of the fields not to fetch
+            after (str): `next_cursor` of the previous page
             **kwargs: kwargs for function `pandas.read_sql_query`
                       or `influxdb.DataFrameClient.query`
 
@@ -493,6 +794,12 @@ class BaseDBHandler(object):
         # load config from DB
         self._load_config_from_db()
 
+        # Keys to sort by are needed for making the cursor of the next page
+        paging = after is not None or (limit is not None and limit > 0)
+        if paging and fields is not None:
+            keys = [key for key, _ in keyset_order(order_by)]
+            fields = list(fields) + [key for key in keys if key not in fields]
+
         # query data
         data, self._count_total = self._read(
             query=query,
@@ -502,6 +809,9 @@ class BaseDBHandler(object):
             order_by=order_by,
             limit=limit,
             offset=offset,
+            fields=fields,
+            exclude=exclude,
+            after=after,
             **kwargs,
         )
 
@@ -510,6 +820,10 @@ class BaseDBHandler(object):
             if "_uuid" not in value.keys():
                 raise ValueError('"_uuid" not found in data')
 
+        self._next_cursor = None
+        if limit is not None and 0 < limit <= len(data) and self._engine_accepts("after"):
+            self._next_cursor = encode_cursor(data[-1], order_by)
+
         # Store conditions
         self._read_conditions = {
             "query": query,
@@ -519,16 +833,141 @@ class BaseDBHandler(object):
             "order_by": order_by,
             "limit": limit,
             "offset": offset,
+            "fields": fields,
+            "exclude": exclude,
+            "after": after,
             **kwargs,
         }
 
         # Fix data-type
         columns = self._config["columns"] if "columns" in self._config.keys() else []
-        for i in range(len(data)):
-            _fix_data_type(data[i], columns, inplace=True, aggregated=group_by is not None)
+        _fix_data_types(data, columns, aggregated=group_by is not None)
 
         self._data = {record["_uuid"]: record for record in data}
+        self._fingerprints = {uuid: _fingerprint(record) for uuid, record in self._data.items()}
+        self._shared = set()
+        if getattr(DB_ENGINES[self._db_engine], "SHARES_NESTED_VALUES", False):
+            self._shared = set(self._data.keys())
         self._uuids_duplicated = []
+        self._uuids_inserted = set()
+        self._uuids_modified = set()
+        self._num_mutations += 1
+
+    def _read_iter(self, batch_size=1000, **kwargs):
+        """Read data from DB batch by batch.
+
+        Engines without `read_iter` read all the data at once, which are then split into batches.
+
+        Args:
+            batch_size (int): number of items in a batch
+
+        Yields:
+            (list): list of data
+
+        """
+        if self._db_engine is None:
+            raise DatabaseNotInitializedError()
+        elif self._db_engine not in DB_ENGINES.keys():
+            raise ValueError("Unsupported DB engine: {}".format(self._db_engine))
+
+        engine = DB_ENGINES[self._db_engine]
+        func = getattr(engine, "read_iter", engine.read)
+        available_args = set(inspect.signature(func).parameters.keys())
+        unavailable_args = set([k for k, v in kwargs.items() if v is not None]).difference(
+            available_args
+        )
+        if len(unavailable_args) > 0:
+            self.logger.warning(
+                'DB-engine "{0}" does not support args: {1}'.format(
+                    self._db_engine, list(unavailable_args)
+                )
+            )
+
+        if hasattr(engine, "read_iter"):
+            yield from func(self._db, handler=self, batch_size=batch_size, **kwargs)
+        else:
+            data, _ = func(self._db, handler=self, **kwargs)
+            for i in range(0, len(data), batch_size):
+                yield data[i : i + batch_size]
+
+    def _postprocess_batch(self, batch):
+        """Post-process a batch of records read by `iter_read`.
+
+        Args:
+            batch (list): list of records with fixed dtypes (modified in-place)
+
+        Returns:
+            (list): list of records
+
+        """
+        return batch
+
+    def _batch_to_df(self, batch):
+        """Convert a batch of records read by `iter_read` to a data-frame.
+
+        Args:
+            batch (list): list of records
+
+        Returns:
+            (pd.DataFrame): a data-frame with display-names
+
+        """
+        return self._to_display_names(self._df_from_dicts(batch))
+
+    def iter_read(
+        self,
+        query=None,
+        pql=None,
+        order_by=None,
+        batch_size=1000,
+        as_dataframe=False,
+        fields=None,
+        exclude=None,
+        **kwargs,
+    ):
+        """Iterate over records in DB without loading all of them into memory.
+
+        Unlike `read()`, the records are not stored in the handler.
+
+        Args:
+            query (dict): query to select items
+            pql (PQL): Python-Query-Language to select items
+            order_by (list): column name to sort by with format [ ( column1, 1 or -1 ), ... ]
+            batch_size (int): number of records fetched from DB at once
+            as_dataframe (bool): if True, yield a data-frame for each batch instead of records
+            fields (list): names of the fields to fetch (`_uuid` is always fetched)
+            exclude (list): names of the fields not to fetch
+
+        Yields:
+            (dict or pd.DataFrame): a record, or a data-frame if `as_dataframe` is True
+
+        """
+        # load config from DB
+        self._load_config_from_db()
+        columns = self._config["columns"] if "columns" in self._config.keys() else []
+
+        for batch in self._read_iter(
+            query=query,
+            pql=pql,
+            order_by=order_by,
+            batch_size=batch_size,
+            fields=fields,
+            exclude=exclude,
+            **kwargs,
+        ):
+            for record in batch:
+                if "_uuid" not in record.keys():
+                    raise ValueError('"_uuid" not found in data')
+            _fix_data_types(batch, columns)
+            batch = self._postprocess_batch(batch)
+
+            if as_dataframe:
+                yield self._batch_to_df(batch)
+            elif getattr(DB_ENGINES[self._db_engine], "SHARES_NESTED_VALUES", False):
+                # The records are owned by the caller, unlike those in the cache of the engine
+                yield from (deepcopy(record) for record in batch)
+            else:
+                yield from batch
 
     def _upsert(self, data):
         """Upsert data to DB.
@@ -544,15 +983,80 @@ class BaseDBHandler(object):
         else:
             raise ValueError("Unsupported DB engine: {}".format(self._db_engine))
 
-    def save(self, **kwargs):
-        """Save data to DB."""
+    def save(self, full=False, **kwargs):
+        """Save data to DB.
+
+        Only records added, modified or removed since the last read or save are written,
+        and configs are written only when they have changed.
+        Records modified in-place (e.g. `handler.data[0]["tags"].append(...)`) are detected by
+        comparing them with fingerprints taken when they were read or saved last time,
+        so they are written as well (though `mark_modified()` is needed to update `df`).
+
+        Args:
+            full (bool): if True, all the records and configs are written
+
+        """
         self._remove(self._uuids_to_remove)
         for table_name in self._tables_to_drop:
             self._drop_table(table_name)
         self._uuids_to_remove = []
         self._uuids_duplicated = []
-        self._upsert(list(self._data.values()))
-        self._save_config_to_db()
+        fingerprints = {uuid: _fingerprint(record) for uuid, record in self._data.items()}
+        if full:
+            self._upsert(list(self._data.values()))
+        else:
+            uuids = self._uuids_inserted | self._uuids_modified
+            self._upsert(
+                [
+                    record
+                    for uuid, record in self._data.items()
+                    if uuid in uuids
+                    or fingerprints[uuid] is None
+                    or fingerprints[uuid] != self._fingerprints.get(uuid, None)
+                ]
+            )
+        self._fingerprints = fingerprints
+        self._uuids_inserted = set()
+        self._uuids_modified = set()
+        if full or self._config_hash is None or self._config_hash != self._get_config_hash():
+            self._save_config_to_db()
+
+    def _own(self, uuid):
+        """Return a record in `self._data` whose nested values can be modified in-place.
+
+        Records read from engines caching documents (e.g. tinymongo) share their nested values
+        with the cache, so they are copied on the first modification instead of on reading.
+
+        Args:
+            uuid (str): UUID of the record
+
+        Returns:
+            (dict): record
+
+        """
+        if uuid in self._shared:
+            self._data[uuid] = deepcopy(self._data[uuid])
+            self._shared.discard(uuid)
+        return self._data[uuid]
+
+    def mark_modified(self, uuids=None):
+        """Mark records as modified after they were modified in-place (e.g. via `data`).
+
+        Caches derived from the records (e.g. `df`) are not updated by in-place modifications,
+        so this must be called after them. It must also be called after modifying `config`
+        in-place, with an empty list if no records were modified.
+        The records are written on the next `save()`.
+        Records in `self._data` must be taken by `_own()` before modifying their nested values.
+
+        Args:
+            uuids (list): list of UUIDs (if None, all the records are marked)
+
+        """
+        if uuids is None:
+            uuids = self._data.keys()
+        self._uuids_modified.update(uuid for uuid in uuids if uuid in self._data.keys())
+        self._num_mutations += 1
+        self._df_cache = None
 
     def _remove(self, uuids):
         """Remove data from DB.
@@ -582,6 +1086,13 @@ class BaseDBHandler(object):
         else:
             raise ValueError("Unsupported DB engine: {}".format(self._db_engine))
 
+        # Indexes are dropped together with the table
+        index_key = self._index_key(name)
+        for key in [key for key in _ENSURED_INDEXES if key[:-1] == index_key]:
+            _ENSURED_INDEXES.discard(key)
+        if name == self._df_name:
+            self._ensure_indexes()
+
     def drop_table(self, name):
         """Drop table from DB (This will no be applied unless `save()` is called).
 
@@ -611,52 +1122,90 @@ class BaseDBHandler(object):
                                           regardless of column specifications
 
         """
-        assert strategy in ["merge", "overwrite"], "Unknown strategy."
+        self.add_many(
+            [data_in], strategy=strategy, ignore_dtype_mismatch=ignore_dtype_mismatch, **kwargs
+        )
 
-        data = deepcopy(data_in)
-        if "_uuid" not in data.keys():
-            data["_uuid"] = self._get_uuid_from_item(data)
-        if "_creation_time" not in data.keys():
-            data["_creation_time"] = datetime.now().timestamp()
-
-        if data["_uuid"] in self._data.keys():
-            if strategy == "merge":
-                base_data = self._data[data["_uuid"]]
-                data = self._merger.merge(base_data, data)
-            self._uuids_duplicated += [data["_uuid"]]
-
-        # Validate data.
-        if "_api_version" in data.keys() and "_kind" in data.keys():
-            get_schema(data["_api_version"], data["_kind"]).validate(data)
-        else:
-            self.logger.warning("`_api_version` or `_kind` are not defined. Validation is skipped.")
+    def add_many(
+        self, records, strategy="overwrite", ignore_dtype_mismatch=False, copy=True, **kwargs
+    ):
+        """Add multiple data to DB-handler at once.
 
-        # Add new columns (keys) to config
+        This is equivalent to calling `add_data()` for each record, but schemas, new columns
+        and dtype conversions are processed once per batch.
+
+        Args:
+            records (list): a list of dicts containing data
+            strategy (str): 'merge' or 'overwrite'
+            ignore_dtype_mismatch (bool): if True, data type will not be modified
+                                          regardless of column specifications
+            copy (bool): if False, the given dicts are stored without being copied
+
+        """
+        assert strategy in ["merge", "overwrite"], "Unknown strategy."
+
+        creation_time = datetime.now().timestamp()
         columns = self._config["columns"] if "columns" in self._config.keys() else []
-        columns_existing = [c["name"] for c in columns]
-        columns_in_data = list(data_in.keys())
-        new_columns = []
-        for new_column in set(columns_in_data).difference(columns_existing):
-            name = new_column
-            dtype = type(data_in[new_column]).__name__
-            aggregation = "first"
-            new_columns.append(
-                {
-                    "name": name,
-                    "dtype": dtype,
-                    "aggregation": aggregation,
-                    "display_name": name,
-                }
+        columns_existing = set(c["name"] for c in columns)
+        new_columns = {}
+        schemas = {}
+        num_not_validated = 0
+        batch = {}
+        for data_in in records:
+            # Keys of the input data (not the internal ones added below) become columns
+            for key, value in data_in.items():
+                if key not in columns_existing and key not in new_columns.keys():
+                    new_columns[key] = type(value).__name__
+
+            data = deepcopy(data_in) if copy else data_in
+            if "_uuid" not in data.keys():
+                data["_uuid"] = self._get_uuid_from_item(data)
+            if "_creation_time" not in data.keys():
+                data["_creation_time"] = creation_time
+
+            uuid = data["_uuid"]
+            if uuid in self._data.keys():
+                self._uuids_modified.add(uuid)
+            else:
+                self._uuids_inserted.add(uuid)
+            if uuid in batch.keys() or uuid in self._data.keys():
+                if strategy == "merge":
+                    base_data = batch[uuid] if uuid in batch.keys() else self._own(uuid)
+                    data = self._merger.merge(base_data, data)
+                self._uuids_duplicated += [uuid]
+
+            # Validate data.
+            if "_api_version" in data.keys() and "_kind" in data.keys():
+                key = (data["_api_version"], data["_kind"])
+                if key not in schemas.keys():
+                    schemas[key] = get_schema(*key)
+                schemas[key].validate(data)
+            else:
+                num_not_validated += 1
+
+            batch[uuid] = data
+
+        if num_not_validated > 0:
+            self.logger.warning(
+                "`_api_version` or `_kind` are not defined. Validation is skipped."
+                + (" ({} records)".format(num_not_validated) if num_not_validated > 1 else "")
             )
-        columns += new_columns
+
+        # Add new columns (keys) to config
+        columns += [
+            {"name": name, "dtype": dtype, "aggregation": "first", "display_name": name}
+            for name, dtype in new_columns.items()
+        ]
 
         # Fix dtype of the input data
         if not ignore_dtype_mismatch:
-            _fix_data_type(data, columns, inplace=True)
+            _fix_data_types(list(batch.values()), columns)
 
         # Update self
         self._config["columns"] = columns
-        self._data.update({data["_uuid"]: data})
+        self._data.update(batch)
+        self._shared.difference_update(batch.keys())
+        self._num_mutations += 1
 
     def remove_data(self, data):
         """Remove data-record from DB-handler.
@@ -673,6 +1222,11 @@ class BaseDBHandler(object):
         # Remove from in-memory data
         if uuid in self._data.keys():
             del self._data[uuid]
+        self._fingerprints.pop(uuid, None)
+        self._shared.discard(uuid)
+        self._uuids_inserted.discard(uuid)
+        self._uuids_modified.discard(uuid)
+        self._num_mutations += 1
 
         # Remove from DB on saving
         self._uuids_to_remove.append(uuid)
@@ -686,22 +1240,61 @@ class BaseDBHandler(object):
         Returns:
             (pd.DataFrame): a data-frame
 
+        """
+        keys = {}
+        for data in dicts:
+            keys.update(dict.fromkeys(data.keys()))
+        values = {key: [data.get(key, np.nan) for data in dicts] for key in keys}
+        return self._df_from_columns(values, len(dicts))
+
+    def _df_from_columns(self, values, num_rows):
+        """Create a DataFrame from columns.
+
+        Columns in the config come first, followed by the other columns in the given order.
+        Columns in the config without values are filled with NaN, unless they are not fetched
+        due to `fields` or `exclude` of `read()`.
+
+        Args:
+            values (dict): column name -> list (or pd.Series) of values (NaN if missing)
+            num_rows (int): number of rows
+
+        Returns:
+            (pd.DataFrame): a data-frame
+
         """
         columns = self._config["columns"] if "columns" in self._config.keys() else []
-        df = pd.concat(
-            [
-                pd.Series(name=c["name"], dtype=dtype_string_to_dtype_object(c["dtype"]))
-                for c in columns
-                if c["name"] != "_uuid" and c["name"] != "_creation_time"
-            ]  # noqa: E501
-            + [
-                pd.Series(name="_uuid", dtype=str),
-                pd.Series(name="_creation_time", dtype=float),
-            ],
-            axis=1,
-        )
-        df.set_index("_uuid", inplace=True)
-        df = pd.concat([df, pd.DataFrame.from_records(dicts)])
+        dtypes = {
+            c["name"]: dtype_string_to_dtype_object(c["dtype"])
+            for c in columns
+            if c["name"] != "_uuid" and c["name"] != "_creation_time"
+        }
+        dtypes["_creation_time"] = float
+        dtypes = {
+            name: dtype
+            for name, dtype in dtypes.items()
+            if name in values.keys() or self._is_fetched(name)
+        }
+
+        if num_rows == 0:
+            index = pd.Index([], dtype=object, name="_uuid")
+        else:
+            index = pd.RangeIndex(num_rows)
+        series = {}
+        for name, dtype in dtypes.items():
+            if name in values.keys() and num_rows > 0:
+                series[name] = pd.Series(values[name], index=index)
+            elif num_rows == 0:
+                series[name] = pd.Series(index=index, dtype=dtype)
+            else:
+                dtype = np.dtype(dtype)
+                series[name] = pd.Series(
+                    np.nan, index=index, dtype=float if dtype.kind in "iub" else dtype
+                )
+        if num_rows > 0:
+            for name, value in values.items():
+                if name not in series.keys():
+                    series[name] = pd.Series(value, index=index)
+        df = pd.DataFrame(series, index=index)
 
         # Apply offset to index
         if "offset" in self._read_conditions.keys() and self._read_conditions["offset"] is not None:
@@ -709,6 +1302,53 @@ class BaseDBHandler(object):
 
         return df
 
+    def _is_fetched(self, name):
+        """Check if a column is fetched by the last `read()`.
+
+        Args:
+            name (str): column name
+
+        Returns:
+            (bool): False if the column is excluded by `fields` or `exclude`
+
+        """
+        fields = self._read_conditions.get("fields", None)
+        exclude = self._read_conditions.get("exclude", None)
+        if fields is not None:
+            return name == "_uuid" or any(
+                field == name or field.startswith(name + ".") for field in fields
+            )
+        if exclude is not None:
+            return name not in exclude
+        return True
+
+    @property
+    def _df_cache_key(self):
+        """Return a key which changes whenever the cached data-frame becomes stale.
+
+        Modifications via methods of the handler change `self._num_mutations`, and configs
+        loaded from or saved to DB change the stamp. In-place modifications of records or
+        configs must be notified by `mark_modified()`.
+
+        """
+        return self._num_mutations, self._config_stamp
+
+    def _build_df(self):
+        """Build a data-frame of all the records."""
+        return self._df_from_dicts(list(self._data.values()))
+
+    def _get_df(self):
+        """Return a data-frame of all the records, cached until the handler is modified.
+
+        Returns:
+            (pd.DataFrame): a data-frame shared with the cache (must not be modified)
+
+        """
+        key = self._df_cache_key
+        if self._df_cache is None or self._df_cache[0] != key:
+            self._df_cache = (key, self._build_df())
+        return self._df_cache[1]
+
     def _to_display_names(self, df, inplace=False):
         """Rename columns to display-names.
 
@@ -735,7 +1375,7 @@ class BaseDBHandler(object):
             (list): list of dicts
 
         """
-        return list(self._data.values())
+        return [self._own(uuid) for uuid in list(self._data.keys())]
 
     @data.setter
     def data(self, data):
@@ -752,21 +1392,36 @@ class BaseDBHandler(object):
     @property
     def columns(self):
         """Return columns of DF."""
-        df = self._df_from_dicts(self.data)
-        return df.columns.tolist()
+        columns = self._config["columns"] if "columns" in self._config.keys() else []
+        names = dict.fromkeys(
+            [c["name"] for c in columns if c["name"] != "_uuid" and c["name"] != "_creation_time"]
+            + ["_creation_time"]
+        )
+        for data in self._data.values():
+            names.update(dict.fromkeys(data.keys()))
+        return list(names.keys())
 
     @property
     def df(self):
         """Return df."""
-        df = self._df_from_dicts(self.data)
-        df = self._to_display_names(df)
-        return df
+        return self._to_display_names(self._get_df())
 
     @property
     def count_total(self):
-        """Return total number of rows."""
+        """Return total number of rows (counted on the first access if deferred on reading)."""
+        if self._count_total is None:
+            self._count_total = self._count(
+                query=self._read_conditions.get("query", None),
+                pql=self._read_conditions.get("pql", None),
+                group_by=self._read_conditions.get("group_by", None),
+            )
         return self._count_total
 
+    @property
+    def next_cursor(self):
+        """Return the cursor to read the page next to the last `read()` (None if not paged)."""
+        return self._next_cursor
+
     @property
     def config(self):
         """Return config."""
@@ -10,7 +10,8 @@ from . import register_handler
 
 
 @register_handler(
-    db_classes=["annotation"], db_engines=["tinydb", "tinymongo", "mongodb", "montydb"]
+    db_classes=["annotation"],
+    db_engines=["tinydb", "tinymongo", "mongodb", "montydb", "sqlite", "parquet"],
 )
 class AnnotationDBHandler(_BaseDBHandler):
     """Handler for annotations."""
@@ -65,9 +66,9 @@ class AnnotationDBHandler(_BaseDBHandler):
 
         super()._initialize_engine(engine, host, database, username, password)
 
-    def add_data(self, *args, **kwargs):
-        """Add data."""
-        super().add_data(*args, **kwargs)
+    def add_many(self, *args, **kwargs):
+        """Add multiple data."""
+        super().add_many(*args, **kwargs)
 
         # Fix column aggregation to 'last' so that the latest annotation is returned
         # when grouping annotations by `annotation_id`
@@ -10,14 +10,18 @@ from copy import deepcopy
 from pathlib import Path
 from typing import Optional
 
-from flatten_dict import flatten
+import numpy as np
+import pandas as pd
 from tqdm import tqdm
 
 from . import BaseDBHandler as _BaseDBHandler
 from . import register_handler
 
 
-@register_handler(db_classes=["meta"], db_engines=["tinydb", "tinymongo", "mongodb", "montydb"])
+@register_handler(
+    db_classes=["meta"],
+    db_engines=["tinydb", "tinymongo", "mongodb", "montydb", "sqlite", "parquet"],
+)
 class MetaDBHandler(_BaseDBHandler):
     """Handler for metadb."""
 
@@ -53,8 +57,12 @@ class MetaDBHandler(_BaseDBHandler):
 
         # Prepare buffer for iteration
         self._buf = []
-        self._indices = []  # [[record_idx, orient_idx]]
+        self._records = []  # records in the order of self._data
+        self._positions = {}  # key: _uuid, value: index in self._records
+        self._offsets = np.zeros(1, dtype=np.int32)  # prefix sum of number of orients
+        self._orient_keys = {}  # key: _uuid, value: keys of a dict in self.orient
         self._indexed = False
+        self._path_cache = {}  # key: _uuid, value: (path in DB, absolute path)
 
         super(MetaDBHandler, self).__init__(**kwargs)
 
@@ -105,12 +113,13 @@ class MetaDBHandler(_BaseDBHandler):
 
         return path
 
-    def _solve_path_in_data(self, data_in: dict, target: str):
+    def _solve_path_in_data(self, data_in: dict, target: str, inplace=False):
         """Fix absolute path to relative one.
 
         Args:
             data_in (dict): a dict containing metadata
             target (str): 'relative' or 'absolute'
+            inplace (bool): if True, `data_in` is modified instead of its copy
 
         Returns:
             (dict): a dict containing metadata with relative path
@@ -119,43 +128,65 @@ class MetaDBHandler(_BaseDBHandler):
         assert isinstance(data_in, dict)
         assert target in ["relative", "absolute"]
 
-        data = deepcopy(data_in)
+        data = data_in if inplace else deepcopy(data_in)
 
         # Convert absolute path to relative path
         if "path" in data.keys():
             if isinstance(data["path"], str):
                 data["path"] = self._solve_path(data["path"], target=target)
             elif isinstance(data["path"], list):
-                for idx in range(len(data["path"])):
-                    data["path"][idx] = self._solve_path(data["path"][idx], target=target)
+                # A new list, as the original one may be shared with the cache of the engine
+                data["path"] = [self._solve_path(path, target=target) for path in data["path"]]
             else:
                 raise TypeError("Unsupported type")
 
         return data
 
     def _reindex(self):
-        """Re-index."""
-        indices = []
-
-        for idx, value in enumerate(self._data.values()):
-            # Count for self.__len__
-            if self.orient in value.keys():
-                if isinstance(value[self.orient], dict) or isinstance(value[self.orient], list):
-                    indices += [[idx, i] for i in range(len(value[self.orient]))]
-                else:
-                    indices += [[idx, 0]]
-            else:
-                indices += [[idx, 0]]
-
-        self._indices = indices
+        """Re-index all the records."""
+        self._records = list(self._data.values())
+        self._positions = {uuid: idx for idx, uuid in enumerate(self._data.keys())}
+        counts = np.fromiter(
+            (self._num_orients(record) for record in self._records),
+            dtype=np.int32,
+            count=len(self._records),
+        )
+        self._offsets = np.zeros(2 * len(counts) + 1, dtype=np.int32)
+        self._offsets[1 : len(counts) + 1] = np.cumsum(counts)
+        self._orient_keys = {}
         self._indexed = True
         self._cursor = 0
 
+    def _update_index(self, uuids):
+        """Update the index for added or modified records.
+
+        Args:
+            uuids (list): `_uuid` of the records in the order of insertion
+
+        """
+        for uuid in uuids:
+            record = self._data[uuid]
+            count = self._num_orients(record)
+            self._orient_keys.pop(uuid, None)
+            num_records = len(self._records)
+            position = self._positions.get(uuid, None)
+            if position is None:
+                if num_records + 1 >= len(self._offsets):
+                    self._offsets = np.resize(self._offsets, 2 * len(self._offsets))
+                self._offsets[num_records + 1] = self._offsets[num_records] + count
+                self._positions[uuid] = num_records
+                self._records.append(record)
+            else:
+                delta = count - (self._offsets[position + 1] - self._offsets[position])
+                if delta != 0:
+                    self._offsets[position + 1 : num_records + 1] += delta
+                self._records[position] = record
+
     def __len__(self):
         """Return number of orients."""
         if not self._indexed:
             self._reindex()
-        return len(self._indices)
+        return int(self._offsets[len(self._records)])
 
     def __next__(self):
         """Return the next item."""
@@ -173,29 +204,144 @@ class MetaDBHandler(_BaseDBHandler):
             (dict): A dict of metadata
 
         """
-        if not self._indexed:
-            self._reindex()
+        num_items = len(self)
+        if idx < 0:
+            idx += num_items
+        if not 0 <= idx < num_items:
+            raise IndexError("Index out of range")
+
+        # The first record whose items end after idx
+        record_idx = int(
+            np.searchsorted(self._offsets[1 : len(self._records) + 1], idx, side="right")
+        )
+        orient_idx = idx - int(self._offsets[record_idx])
+        return self._make_item(self._records[record_idx], orient_idx, **kwargs)
+
+    def iter_items(self, copy=False, remove_internal_columns=True):
+        """Iterate over items (a record per element of `self.orient`).
+
+        Args:
+            copy (bool): if False, nested values are shared with the records in the handler
+                         and must not be modified
+            remove_internal_columns (bool): if True, internal columns are removed
+
+        Yields:
+            (dict): A dict of metadata
+
+        """
+        for record in list(self._data.values()):
+            for orient_idx in range(self._num_orients(record)):
+                yield self._make_item(
+                    record,
+                    orient_idx,
+                    copy=copy,
+                    remove_internal_columns=remove_internal_columns,
+                )
+
+    def _make_item(self, record, orient_idx, copy=True, remove_internal_columns=True):
+        """Make an item from a record without copying the other elements of `self.orient`.
+
+        Args:
+            record (dict): a record in the handler
+            orient_idx (int): index of the element of `self.orient`
+            copy (bool): if True, nested values are copied
+            remove_internal_columns (bool): if True, internal columns are removed
+
+        Returns:
+            (dict): A dict of metadata with a single element of `self.orient` and absolute path
+
+        """
+        item = {}
+        for key, value in record.items():
+            if remove_internal_columns and key in ["_uuid", "_creation_time"]:
+                continue
+            if key == "path":
+                value = self._absolute_path(record)
+            if key == self.orient:
+                value = self._orient_element(value, orient_idx, self._get_orient_keys(record))
+            if copy and isinstance(value, (dict, list)):
+                value = deepcopy(value)
+            item[key] = value
+        return item
+
+    def _absolute_path(self, record):
+        """Return the absolute path of a record, cached per record.
+
+        Args:
+            record (dict): a record in the handler
+
+        Returns:
+            (str or list): absolute path(s)
+
+        """
+        path = record["path"]
+        key = tuple(path) if isinstance(path, list) else path
+        cached = self._path_cache.get(record.get("_uuid", None), None)
+        if cached is None or cached[0] != key:
+            if isinstance(path, str):
+                absolute_path = self._solve_path(path, target="absolute")
+            elif isinstance(path, list):
+                absolute_path = [self._solve_path(p, target="absolute") for p in path]
+            else:
+                raise TypeError("Unsupported type")
+            cached = (key, absolute_path)
+            if "_uuid" in record.keys():
+                self._path_cache[record["_uuid"]] = cached
+        return list(cached[1]) if isinstance(cached[1], list) else cached[1]
+
+    def _get_orient_keys(self, record):
+        """Return keys of a dict in `self.orient` of a record, cached per record.
+
+        Args:
+            record (dict): a record in the handler
+
+        Returns:
+            (list): keys, or None if the value is not a dict
 
-        record_idx, orient_idx = self._indices[idx]
-        data = super().__getitem__(record_idx, **kwargs)
+        """
+        value = record[self.orient]
+        if not isinstance(value, dict):
+            return None
+        uuid = record.get("_uuid", None)
+        keys = self._orient_keys.get(uuid, None)
+        if keys is None:
+            keys = list(value.keys())
+            if uuid is not None:
+                self._orient_keys[uuid] = keys
+        return keys
+
+    def _orient_element(self, value, orient_idx, keys=None):
+        """Return a single element of `self.orient` as a new container."""
+        if isinstance(value, dict):
+            key = (keys if keys is not None else list(value.keys()))[orient_idx]
+            return {key: value[key]}
+        if isinstance(value, list):
+            return [value[orient_idx]]
+        return value
+
+    def _select_orient(self, data, orient_idx):
+        """Select an element of `self.orient` in data.
 
-        # Deserialize content
-        data = self._solve_path_in_data(data, target="absolute")
+        Args:
+            data (dict): a dict of metadata (modified in-place)
+            orient_idx (int): index of the element
 
-        data = deepcopy(data)
+        Returns:
+            (dict): A dict of metadata with a single element of `self.orient`
 
+        """
         if self.orient in data.keys():
-            if isinstance(data[self.orient], dict):
-                data[self.orient] = {
-                    list(data[self.orient].keys())[orient_idx]: list(data[self.orient].values())[
-                        orient_idx
-                    ]
-                }
-            if isinstance(data[self.orient], list):
-                data[self.orient] = [data[self.orient][orient_idx]]
+            data[self.orient] = self._orient_element(data[self.orient], orient_idx)
 
         return data
 
+    def _num_orients(self, data):
+        """Return number of elements of `self.orient` in data."""
+        if self.orient in data.keys():
+            if isinstance(data[self.orient], dict) or isinstance(data[self.orient], list):
+                return len(data[self.orient])
+        return 1
+
     def add_data(self, data_in: dict, **kwargs):
         """Add data to db.
 
@@ -203,9 +349,23 @@ class MetaDBHandler(_BaseDBHandler):
             data_in (dict): data
 
         """
-        data_to_store = self._solve_path_in_data(data_in, target="relative")
-        super().add_data(data_to_store, **kwargs)
-        self._indexed = False
+        self.add_many([data_in], **kwargs)
+
+    def add_many(self, records, copy=True, **kwargs):
+        """Add multiple data to db at once.
+
+        Args:
+            records (list): a list of dicts containing metadata
+            copy (bool): if False, the given dicts are modified and stored without being copied
+
+        """
+        data = [
+            self._solve_path_in_data(record, target="relative", inplace=not copy)
+            for record in records
+        ]
+        super().add_many(data, copy=False, **kwargs)
+        if self._indexed:
+            self._update_index(list(dict.fromkeys(record["_uuid"] for record in data)))
 
     def remove_data(self, data):
         """Remove data from DB.
@@ -218,6 +378,26 @@ class MetaDBHandler(_BaseDBHandler):
         super().remove_data(data_to_remove)
         self._indexed = False
 
+    def mark_modified(self, uuids=None):
+        """Mark records as modified after they were modified in-place.
+
+        The index of items is updated as the number of elements of `self.orient` may change.
+
+        Args:
+            uuids (list): list of UUIDs (if None, all the records are marked)
+
+        """
+        uuids = None if uuids is None else [uuid for uuid in uuids if uuid in self._data.keys()]
+        super().mark_modified(uuids)
+        if uuids is None:
+            self._orient_keys = {}
+            self._indexed = False
+        elif self._indexed:
+            self._update_index(uuids)
+        else:
+            for uuid in uuids:
+                self._orient_keys.pop(uuid, None)
+
     def add_record(self, data_in: dict, **kwargs):
         """Add record metadata to DB-handler.
 
@@ -303,6 +483,7 @@ class MetaDBHandler(_BaseDBHandler):
         """Read function."""
         super().read(*args, **kwargs)
         self._indexed = False
+        self._path_cache = {}
 
     def save(self, *args, **kwargs):
         """Save function."""
@@ -312,8 +493,18 @@ class MetaDBHandler(_BaseDBHandler):
         )
         self._database_id_db_handler.save()
 
-    def migrate_to_new_database(self, new_database_id):
-        """Migrate from a current database into a new database."""
+    def migrate_to_new_database(self, new_database_id, batch_size=1000):
+        """Migrate from a current database into a new database.
+
+        Records are copied batch by batch, so an interrupted migration is resumed by calling
+        this function again. Records already in the new database are skipped, as the records
+        of an interrupted batch may have been written in any order.
+
+        Args:
+            new_database_id (str): ID of the new database
+            batch_size (int): number of records copied at once
+
+        """
         # make new database with the same config of current database
         new_meta_db_handler = MetaDBHandler(
             database_id=new_database_id,
@@ -323,28 +514,41 @@ class MetaDBHandler(_BaseDBHandler):
             db_password=self._db_password,
             db_name=self._db_name,
             base_dir_path=self.base_dir_path,
+            read_on_init=False,
         )
         for k, v in self._config.items():
             new_meta_db_handler._config.__setitem__(k, v, force=True)
         new_meta_db_handler.save()
 
+        # Resume from the records copied in the previous run
+        num_records = self._count()
+        uuids_copied = set()
+        if new_meta_db_handler._count() > 0:
+            fields = ["_uuid"] if self._engine_accepts("fields", "read_iter") else None
+            for batch in new_meta_db_handler._read_iter(batch_size=batch_size, fields=fields):
+                uuids_copied.update(record["_uuid"] for record in batch)
+            self.logger.info("Resuming migration after {} records".format(len(uuids_copied)))
+
         # copy data in old table to new table
-        # TODO(kan-bayashi): Increase limit to perform chunk-wise processing
-        self.read(limit=1)
-        for idx in tqdm(range(self._count_total)):
-            self.read(limit=1, offset=idx)
-            # NOTE(kan-bayashi): To save memory usage, repeat add -> save steps
-            new_meta_db_handler = MetaDBHandler(
-                database_id=new_database_id,
-                db_engine=self._db_engine,
-                db_host=self._db_host,
-                db_username=self._db_username,
-                db_password=self._db_password,
-                db_name=self._db_name,
-                base_dir_path=self.base_dir_path,
+        with tqdm(
+            total=num_records, initial=len(uuids_copied), desc="Migrating", leave=False
+        ) as progress:
+            for batch in self._read_iter(batch_size=batch_size):
+                batch = [
+                    {k: v for k, v in record.items() if k != "_id"}
+                    for record in batch
+                    if record["_uuid"] not in uuids_copied
+                ]
+                new_meta_db_handler._upsert(batch)
+                progress.update(len(batch))
+
+        num_migrated = new_meta_db_handler._count()
+        if num_migrated != num_records:
+            raise RuntimeError(
+                "Migrated {} records, but the current database has {} records".format(
+                    num_migrated, num_records
+                )
             )
-            new_meta_db_handler.add_data(self._data)
-            new_meta_db_handler.save()
 
         # remove old database from database_id_df
         self._database_id_db_handler.remove_data(
@@ -413,43 +617,96 @@ class MetaDBHandler(_BaseDBHandler):
     @property
     def _df(self):
         """Return df."""
-        data = []
-        for idx in range(len(self)):
-            _data = self.__getitem__(idx, remove_internal_columns=False)
-            assert isinstance(_data, dict)
+        return self._get_df().copy()
+
+    @property
+    def _df_cache_key(self):
+        """Return a key which changes whenever the cached data-frame becomes stale."""
+        return super()._df_cache_key + (self.orient, self.base_dir_path)
+
+    def _build_df(self):
+        """Build a data-frame with an item per `self.orient` column by column."""
+        return self._items_to_df(self.iter_items(copy=False, remove_internal_columns=False))
+
+    def _items_to_df(self, items):
+        """Convert items (a record per element of `self.orient`) to a data-frame.
 
-            # Expand the contents of key `self.orient`
+        The contents of `self.orient` are flattened to columns joined with dots.
+
+        Args:
+            items (iterable): items with a single element of `self.orient`
+
+        Returns:
+            (pd.DataFrame): a data-frame
+
+        """
+        rows, nested = [], []
+        for _data in items:
+            value = {}
             if self.orient in _data.keys():
-                if isinstance(_data[self.orient], list):
-                    assert len(_data[self.orient]) == 1
-                    if isinstance(_data[self.orient][0], dict):
-                        value = flatten(next(iter(_data[self.orient])), reducer="dot")
-                        _data = self._merger.merge(_data, value)
+                element = _data[self.orient]
+                if isinstance(element, list):
+                    assert len(element) == 1
+                    if isinstance(element[0], dict):
+                        value = element[0]
                     else:
-                        _data[self.orient] = _data[self.orient][0]
-                elif isinstance(_data[self.orient], dict):
-                    assert len(_data[self.orient]) == 1
-                    key = next(iter(_data[self.orient].keys()))
-                    value = flatten(next(iter(_data[self.orient].values())), reducer="dot")
+                        _data[self.orient] = element[0]
+                elif isinstance(element, dict):
+                    assert len(element) == 1
+                    key, value = next(iter(element.items()))
                     _data[self.orient] = key
-                    _data = self._merger.merge(_data, value)
-                else:
-                    pass
-            data.append(_data)
-
-        df = self._df_from_dicts(data)
-        return df
+            rows.append(_data)
+            nested.append(value if isinstance(value, dict) else {})
+
+        keys = {}
+        for _data in rows:
+            keys.update(dict.fromkeys(_data.keys()))
+        values = {key: [_data.get(key, np.nan) for _data in rows] for key in keys}
+        flattened = pd.json_normalize(nested, sep=".") if len(nested) > 0 else pd.DataFrame()
+        for key in flattened.columns:
+            if key in values.keys():
+                values[key] = self._merge_column(values[key], flattened[key].tolist())
+            else:
+                values[key] = flattened[key]
+
+        return self._df_from_columns(values, len(rows))
+
+    def _merge_column(self, base, nested):
+        """Merge values of a column with flattened values of the same name in `self.orient`."""
+        merged = []
+        for base_value, value in zip(base, nested):
+            if isinstance(value, float) and np.isnan(value):
+                merged.append(base_value)
+            elif isinstance(base_value, list) and isinstance(value, list):
+                merged.append(self._merger.merge(deepcopy(base_value), value))
+            else:
+                merged.append(value)
+        return merged
+
+    def _postprocess_batch(self, batch):
+        """Fix relative paths in a batch of records to absolute ones."""
+        for data in batch:
+            self._solve_path_in_data(data, target="absolute", inplace=True)
+        return batch
+
+    def _batch_to_df(self, batch):
+        """Convert a batch of records to a data-frame with an item per `self.orient`."""
+        items = (
+            self._select_orient(dict(record), orient_idx)
+            for record in batch
+            for orient_idx in range(self._num_orients(record))
+        )
+        return self._to_display_names(self._items_to_df(items))
 
     @property
     def df(self):
         """Return df with display_names."""
-        df = self._df
-        self._to_display_names(df, inplace=True)
-        return df
+        return self._to_display_names(self._get_df())
 
 
 @register_handler(
-    db_classes=["database_id"], db_engines=["tinydb", "tinymongo", "mongodb", "montydb"]
+    db_classes=["database_id"],
+    db_engines=["tinydb", "tinymongo", "mongodb", "montydb", "sqlite", "parquet"],
 )
 class DatabaseIDDBHandler(_BaseDBHandler):
     """Handler for database-id."""
@@ -10,22 +10,37 @@ from abc import ABCMeta
 import pandas as pd
 
 from pydtk.statistics import calculator
+from pydtk.statistics.sketch import DDSketch, FixedBinHistogram, merge_sketches  # NOQA
 
 
 class BaseStatisticCalculation(metaclass=ABCMeta):
     """Base Statistic Calculation."""
 
-    def __init__(self, target_span=60.0, sync_timestamps=False):
+    def __init__(
+        self,
+        target_span=60.0,
+        sync_timestamps=False,
+        sketches=False,
+        relative_accuracy=0.01,
+        histogram_edges=None,
+    ):
         """Initialize Base Statistics Calculation class.
 
         Args:
             target_span (float): interval of statistics calculation
             sync_timestamps (bool): if True, the output timestamps will
                                           start from 'timestamp // span * span'
+            sketches (bool): if True, statistic tables include serialized sketches
+                             (quantile sketches, and histograms if `histogram_edges` is given)
+            relative_accuracy (float): relative accuracy of quantile sketches
+            histogram_edges (list): bin edges of histograms
 
         """
         self.target_span = target_span
         self.sync_timestamps = sync_timestamps
+        self.sketches = sketches
+        self.relative_accuracy = relative_accuracy
+        self.histogram_edges = histogram_edges
 
     def _get_calculator(self, dtype):
         """Get calculator by data type.
@@ -40,6 +55,8 @@ class BaseStatisticCalculation(metaclass=ABCMeta):
         kwargs = {
             "target_span": self.target_span,
             "sync_timestamps": self.sync_timestamps,
+            "relative_accuracy": self.relative_accuracy,
+            "histogram_edges": self.histogram_edges,
         }
         if "bool" in dtype:
             dtype_calculator = getattr(calculator, "BoolCalculator")(**kwargs)
@@ -80,6 +97,31 @@ class BaseStatisticCalculation(metaclass=ABCMeta):
         """Divide and return count of True in divided data."""
         return self.calculate(timestamps, data, "count")
 
+    def sketch(self, timestamps, data):
+        """Divide and return serialized quantile sketches of divided data."""
+        return self.calculate(timestamps, data, "sketch")
+
+    def histogram(self, timestamps, data):
+        """Divide and return serialized histograms of divided data."""
+        return self.calculate(timestamps, data, "histogram")
+
+    @staticmethod
+    def quantiles(sketches, qs=(0.5, 0.95, 0.99)):
+        """Estimate quantiles over sketches stored in statistic tables.
+
+        Args:
+            sketches (iterable): serialized sketches (e.g. a column '<column>/sketch')
+            qs (list): quantiles to estimate
+
+        Returns:
+            (list): estimated values (NaN if no sketch is given)
+
+        """
+        merged = merge_sketches(sketches)
+        if merged is None:
+            return [float("nan") for _ in qs]
+        return merged.quantiles(qs)
+
     def statistic_tables(self, timestamps, data, columns):
         """Make statistic tables.
 
@@ -93,7 +135,10 @@ class BaseStatisticCalculation(metaclass=ABCMeta):
 
         """
         self.calculator = self._get_calculator(str(data.dtype))
-        for i, operation in enumerate(self.calculator.operations):
+        operations = self.calculator.operations
+        if self.sketches:
+            operations = operations + self.calculator.sketch_operations
+        for i, operation in enumerate(operations):
             index_timestamps, stat_data = self.calculate(timestamps, data, operation)
             time_df = pd.DataFrame(data=index_timestamps, columns=["timestamp"])
             if i == 0:
@@ -9,6 +9,8 @@ from abc import ABCMeta
 
 import numpy as np
 
+from pydtk.statistics.sketch import DDSketch, FixedBinHistogram
+
 
 class UnsupportedOperationError(BaseException):
     """Error for unsupported file."""
@@ -19,18 +21,29 @@ class UnsupportedOperationError(BaseException):
 class BaseCalculator(metaclass=ABCMeta):
     """Base Calculator."""
 
-    def __init__(self, target_span=60.0, sync_timestamps=False):
+    def __init__(
+        self,
+        target_span=60.0,
+        sync_timestamps=False,
+        relative_accuracy=0.01,
+        histogram_edges=None,
+    ):
         """Initialize Base Statistics Calculator.
 
         Args:
             target_span (float): interval of statistics calculation
             sync_timestamps (bool): if True, the output timestamps will
                                           start from 'timestamp // span * span'
+            relative_accuracy (float): relative accuracy of quantile sketches
+            histogram_edges (list): bin edges of histograms
 
         """
         self.target_span = target_span
         self.sync_timestamps = sync_timestamps
+        self.relative_accuracy = relative_accuracy
+        self.histogram_edges = histogram_edges
         self.operations = None
+        self.sketch_operations = []
 
     def divide(self, timestamps, data):
         """Divide data with target span.
@@ -108,6 +121,42 @@ class BaseCalculator(metaclass=ABCMeta):
             "Model '{0}' does not support operation: {1}".format(type(self).__name__, "count")
         )
 
+    def sketch(self, timestamps, data):
+        """Divide and return serialized quantile sketches of divided data."""
+        raise UnsupportedOperationError(
+            "Model '{0}' does not support operation: {1}".format(type(self).__name__, "sketch")
+        )
+
+    def histogram(self, timestamps, data):
+        """Divide and return serialized histograms of divided data."""
+        raise UnsupportedOperationError(
+            "Model '{0}' does not support operation: {1}".format(type(self).__name__, "histogram")
+        )
+
+    def _sketch_each(self, timestamps, data, new_sketch):
+        """Divide data and serialize a sketch per span and column.
+
+        Args:
+            timestamps (ndarray): timestamps [sec]
+            data (ndarray): input data
+            new_sketch (callable): function returning an empty sketch
+
+        Returns:
+            index_timestamps (ndarray): timestamps [sec]
+            stat_data (ndarray): serialized sketches (JSON strings)
+
+        """
+        index_timestamps, divided_data = self.divide(timestamps, data)
+        shape = (len(divided_data),) + data.shape[1:2]
+        stat_data = np.empty(shape, dtype=object)
+        for i, values in enumerate(divided_data):
+            if data.ndim == 1:
+                stat_data[i] = new_sketch().add(values).to_json()
+                continue
+            for j in range(data.shape[1]):
+                stat_data[i, j] = new_sketch().add(values[:, j]).to_json()
+        return index_timestamps, stat_data
+
 
 class FloatCalculator(BaseCalculator):
     """Calculator for data of float."""
@@ -115,6 +164,9 @@ class FloatCalculator(BaseCalculator):
     def __init__(self, target_span=60.0, **kwargs):
         super().__init__(target_span, **kwargs)
         self.operations = ["mean", "max", "min"]
+        self.sketch_operations = ["sketch"]
+        if self.histogram_edges is not None:
+            self.sketch_operations.append("histogram")
 
     def mean(self, timestamps, data):
         """Calculate mean.
@@ -176,6 +228,38 @@ class FloatCalculator(BaseCalculator):
         stat_data = np.array(stat_data)
         return index_timestamps, stat_data
 
+    def sketch(self, timestamps, data):
+        """Calculate quantile sketches.
+
+        Args:
+            timestamps (ndarray): timestamps [sec]
+            data (ndarray): input data
+
+        Returns:
+            index_timestamps (ndarray): timestamps [sec]
+            stat_data (ndarray): serialized DDSketch of input data
+
+        """
+        return self._sketch_each(
+            timestamps, data, lambda: DDSketch(relative_accuracy=self.relative_accuracy)
+        )
+
+    def histogram(self, timestamps, data):
+        """Calculate histograms with fixed bins.
+
+        Args:
+            timestamps (ndarray): timestamps [sec]
+            data (ndarray): input data
+
+        Returns:
+            index_timestamps (ndarray): timestamps [sec]
+            stat_data (ndarray): serialized FixedBinHistogram of input data
+
+        """
+        if self.histogram_edges is None:
+            raise UnsupportedOperationError("`histogram_edges` must be specified for histograms")
+        return self._sketch_each(timestamps, data, lambda: FixedBinHistogram(self.histogram_edges))
+
 
 class BoolCalculator(BaseCalculator):
     """Calculator for data of float."""
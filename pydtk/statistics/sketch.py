@@ -0,0 +1,340 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright Toolkit Authors
+
+"""Mergeable sketches for statistics calculation."""
+
+import json
+import math
+
+import numpy as np
+
+
+class DDSketch(object):
+    """Quantile sketch with relative-error guarantees (DDSketch).
+
+    Values are mapped to logarithmically-spaced buckets so that any quantile
+    can be estimated within `relative_accuracy` of the true value.
+    Sketches with the same accuracy can be merged without loss.
+
+    """
+
+    kind = "ddsketch"
+    min_indexable_value = 1e-9
+
+    def __init__(self, relative_accuracy=0.01):
+        """Initialize DDSketch.
+
+        Args:
+            relative_accuracy (float): relative accuracy of quantile estimates (0 < a < 1)
+
+        """
+        if not 0.0 < relative_accuracy < 1.0:
+            raise ValueError("relative_accuracy must be in (0, 1)")
+        self.relative_accuracy = relative_accuracy
+        self._gamma = (1.0 + relative_accuracy) / (1.0 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._positive = {}
+        self._negative = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _keys(self, values):
+        return np.ceil(np.log(values) / self._log_gamma).astype(np.int64)
+
+    def _value(self, key):
+        return 2.0 * self._gamma**key / (self._gamma + 1.0)
+
+    @staticmethod
+    def _serialize_store(store):
+        keys = sorted(store.keys())
+        return [keys, [store[key] for key in keys]]
+
+    @staticmethod
+    def _store(store, keys):
+        for key, count in zip(*np.unique(keys, return_counts=True)):
+            store[int(key)] = store.get(int(key), 0) + int(count)
+
+    def add(self, values):
+        """Add values to the sketch.
+
+        Args:
+            values (float or ndarray): values to add (NaN is ignored)
+
+        Returns:
+            (DDSketch): self
+
+        """
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+
+        positive = values[values > self.min_indexable_value]
+        negative = -values[values < -self.min_indexable_value]
+        self._store(self._positive, self._keys(positive))
+        self._store(self._negative, self._keys(negative))
+        self.zero_count += len(values) - len(positive) - len(negative)
+
+        self.count += len(values)
+        self.sum += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        return self
+
+    def merge(self, other):
+        """Merge another sketch into this one.
+
+        Args:
+            other (DDSketch): sketch to merge
+
+        Returns:
+            (DDSketch): self
+
+        """
+        if not isinstance(other, DDSketch):
+            raise TypeError("Cannot merge {} into DDSketch".format(type(other).__name__))
+        if not math.isclose(self.relative_accuracy, other.relative_accuracy):
+            raise ValueError("Cannot merge sketches with different relative accuracies")
+        for store, other_store in [
+            (self._positive, other._positive),
+            (self._negative, other._negative),
+        ]:
+            for key, count in other_store.items():
+                store[key] = store.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def quantile(self, q):
+        """Estimate the q-quantile.
+
+        Args:
+            q (float): quantile in [0, 1]
+
+        Returns:
+            (float): estimated value (NaN if the sketch is empty)
+
+        """
+        if not 0.0 <= q <= 1.0:
+            raise ValueError("q must be in [0, 1]")
+        if self.count == 0:
+            return math.nan
+
+        rank = q * (self.count - 1)
+        if rank <= 0:
+            return self.min
+        if rank >= self.count - 1:
+            return self.max
+
+        accumulated = 0
+        for key in sorted(self._negative.keys(), reverse=True):
+            accumulated += self._negative[key]
+            if accumulated > rank:
+                return max(-self._value(key), self.min)
+        accumulated += self.zero_count
+        if accumulated > rank:
+            return 0.0
+        for key in sorted(self._positive.keys()):
+            accumulated += self._positive[key]
+            if accumulated > rank:
+                return min(self._value(key), self.max)
+        return self.max
+
+    def quantiles(self, qs):
+        """Estimate multiple quantiles.
+
+        Args:
+            qs (list): list of quantiles in [0, 1]
+
+        Returns:
+            (list): list of estimated values
+
+        """
+        return [self.quantile(q) for q in qs]
+
+    @property
+    def mean(self):
+        """Return mean of the added values."""
+        return self.sum / self.count if self.count > 0 else math.nan
+
+    def to_dict(self):
+        """Serialize the sketch to a dict."""
+        return {
+            "type": self.kind,
+            "relative_accuracy": self.relative_accuracy,
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count > 0 else None,
+            "max": self.max if self.count > 0 else None,
+            "zero_count": self.zero_count,
+            "positive": self._serialize_store(self._positive),
+            "negative": self._serialize_store(self._negative),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Deserialize a sketch from a dict."""
+        sketch = cls(relative_accuracy=data["relative_accuracy"])
+        sketch._positive = dict(zip(*data["positive"]))
+        sketch._negative = dict(zip(*data["negative"]))
+        sketch.zero_count = data["zero_count"]
+        sketch.count = data["count"]
+        sketch.sum = data["sum"]
+        sketch.min = data["min"] if data["min"] is not None else math.inf
+        sketch.max = data["max"] if data["max"] is not None else -math.inf
+        return sketch
+
+    def to_json(self):
+        """Serialize the sketch to a compact JSON string."""
+        return json.dumps(self.to_dict(), separators=(",", ":"))
+
+
+class FixedBinHistogram(object):
+    """Histogram with fixed bin edges.
+
+    Histograms sharing the same edges can be merged by adding their counts.
+    Values outside the edges are counted as underflow or overflow.
+
+    """
+
+    kind = "histogram"
+
+    def __init__(self, edges):
+        """Initialize FixedBinHistogram.
+
+        Args:
+            edges (list): monotonically increasing bin edges
+
+        """
+        edges = np.asarray(edges, dtype=np.float64)
+        if edges.ndim != 1 or len(edges) < 2 or np.any(np.diff(edges) <= 0):
+            raise ValueError("edges must be a monotonically increasing list of length >= 2")
+        self.edges = edges
+        self.counts = np.zeros(len(edges) - 1, dtype=np.int64)
+        self.underflow = 0
+        self.overflow = 0
+
+    @property
+    def count(self):
+        """Return total number of the added values."""
+        return int(self.counts.sum()) + self.underflow + self.overflow
+
+    def add(self, values):
+        """Add values to the histogram.
+
+        Args:
+            values (float or ndarray): values to add (NaN is ignored)
+
+        Returns:
+            (FixedBinHistogram): self
+
+        """
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        counts, _ = np.histogram(values, bins=self.edges)
+        self.counts += counts
+        self.underflow += int((values < self.edges[0]).sum())
+        self.overflow += int((values > self.edges[-1]).sum())
+        return self
+
+    def merge(self, other):
+        """Merge another histogram into this one.
+
+        Args:
+            other (FixedBinHistogram): histogram to merge
+
+        Returns:
+            (FixedBinHistogram): self
+
+        """
+        if not isinstance(other, FixedBinHistogram):
+            raise TypeError("Cannot merge {} into FixedBinHistogram".format(type(other).__name__))
+        if not np.array_equal(self.edges, other.edges):
+            raise ValueError("Cannot merge histograms with different edges")
+        self.counts += other.counts
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+        return self
+
+    def to_dict(self):
+        """Serialize the histogram to a dict."""
+        return {
+            "type": self.kind,
+            "edges": self.edges.tolist(),
+            "counts": self.counts.tolist(),
+            "underflow": self.underflow,
+            "overflow": self.overflow,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Deserialize a histogram from a dict."""
+        histogram = cls(data["edges"])
+        histogram.counts = np.asarray(data["counts"], dtype=np.int64)
+        histogram.underflow = data["underflow"]
+        histogram.overflow = data["overflow"]
+        return histogram
+
+    def to_json(self):
+        """Serialize the histogram to a compact JSON string."""
+        return json.dumps(self.to_dict(), separators=(",", ":"))
+
+
+SKETCHES = {DDSketch.kind: DDSketch, FixedBinHistogram.kind: FixedBinHistogram}
+
+
+def load_sketch(data):
+    """Deserialize a sketch.
+
+    Args:
+        data (str or dict): a JSON string or a dict made by `to_json()` or `to_dict()`
+
+    Returns:
+        (DDSketch or FixedBinHistogram): sketch
+
+    """
+    if isinstance(data, str):
+        data = json.loads(data)
+    if not isinstance(data, dict) or data.get("type", None) not in SKETCHES.keys():
+        kind = data.get("type", None) if isinstance(data, dict) else type(data).__name__
+        raise ValueError("Unknown sketch type: {}".format(kind))
+    return SKETCHES[data["type"]].from_dict(data)
+
+
+def merge_sketches(sketches):
+    """Merge serialized sketches (e.g. a column of the statistics table).
+
+    Args:
+        sketches (iterable): sketches, JSON strings or dicts (None and NaN are skipped)
+
+    Returns:
+        (DDSketch or FixedBinHistogram): merged sketch, or None if nothing is given
+
+    Raises:
+        ValueError: if a sketch is broken (the message tells its position, e.g. the span)
+
+    """
+    merged = None
+    for position, sketch in enumerate(sketches):
+        if sketch is None or (isinstance(sketch, float) and math.isnan(sketch)):
+            continue
+        if not isinstance(sketch, (DDSketch, FixedBinHistogram)):
+            try:
+                sketch = load_sketch(sketch)
+            except (KeyError, TypeError, ValueError) as e:
+                raise ValueError(
+                    "Invalid sketch at position {}: {}: {}".format(position, type(e).__name__, e)
+                ) from e
+        if merged is None:
+            merged = load_sketch(sketch.to_dict())
+        else:
+            merged.merge(sketch)
+    return merged
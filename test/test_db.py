@@ -5,6 +5,9 @@
 
 import datetime
 import os
+import shutil
+import threading
+from copy import deepcopy
 from typing import Optional
 
 import pytest
@@ -16,6 +19,7 @@ db_list = [
     ("tinydb", "test/test_v4.json", None, None, None),
     ("tinymongo", "test/test_v4", None, None, None),
     ("montydb", "test/test_v4", None, None, None),
+    ("sqlite", "test/test_v4", None, None, None),
     # ('mongodb', '<host>', '<username>', '<password>', '<database>')
 ]
 default_db_parameter = db_list[0]
@@ -163,6 +167,101 @@ def test_migrate_db(
     assert len(new_handler.data) > 0
 
 
+@pytest.mark.parametrize(db_args, db_list)
+def test_migrate_db_resume(
+    db_engine: str,
+    db_host: str,
+    db_username: Optional[str],
+    db_password: Optional[str],
+    db_name: Optional[str],
+):
+    """Resume an interrupted migration.
+
+    Args:
+        db_engine (str): DB engine (e.g., 'tinydb')
+        db_host (str): Host of path of DB
+        db_username (str): Username
+        db_password (str): Password
+        db_name (str): Database name
+
+    """
+    kwargs = {
+        "db_engine": db_engine,
+        "db_host": db_host,
+        "db_username": db_username,
+        "db_password": db_password,
+        "db_name": db_name,
+        "base_dir_path": os.path.join(os.getcwd(), "test"),
+    }
+    handler = V4MetaDBHandler(database_id="resume_old", **kwargs)
+    _add_files_to_db(handler)
+    records = sorted(handler._read()[0], key=lambda r: r["_uuid"])
+
+    # Interrupted after copying some records of a batch, which may be written in any order
+    new_handler = V4MetaDBHandler(database_id="resume_new", read_on_init=False, **kwargs)
+    new_handler._upsert(
+        [{k: v for k, v in r.items() if k != "_id"} for r in [records[0], records[-1]]]
+    )
+
+    handler.migrate_to_new_database("resume_new", batch_size=2)
+    new_handler = V4MetaDBHandler(database_id="resume_new", **kwargs)
+    new_handler.read()
+    assert sorted(r["_uuid"] for r in new_handler._data.values()) == [r["_uuid"] for r in records]
+
+
+@pytest.mark.parametrize(db_args, db_list)
+def test_connection_pool(
+    db_engine: str,
+    db_host: str,
+    db_username: Optional[str],
+    db_password: Optional[str],
+    db_name: Optional[str],
+):
+    """Share connections among handlers.
+
+    Args:
+        db_engine (str): DB engine (e.g., 'tinydb')
+        db_host (str): Host of path of DB
+        db_username (str): Username
+        db_password (str): Password
+        db_name (str): Database name
+
+    """
+    from pydtk.db.v4 import close_connections
+    from pydtk.db.v4.engines import _CONNECTIONS
+
+    kwargs = {
+        "db_engine": db_engine,
+        "db_host": db_host,
+        "db_username": db_username,
+        "db_password": db_password,
+        "db_name": db_name,
+        "base_dir_path": os.path.join(os.getcwd(), "test"),
+    }
+    handler = V4MetaDBHandler(database_id="pool", **kwargs)
+    _add_files_to_db(handler)
+    num_connections = len(_CONNECTIONS)
+    other_handler = V4MetaDBHandler(database_id="pool", **kwargs)
+    assert len(_CONNECTIONS) == num_connections
+    other_handler.read()
+    assert len(other_handler) == len(handler)
+
+    close_connections(db_engine)
+    assert all(key[0] != db_engine for key in _CONNECTIONS.keys())
+    other_handler = V4MetaDBHandler(database_id="pool", **kwargs)
+    other_handler.read()
+    assert len(other_handler) == len(handler)
+
+    # Connections to removed files are re-opened
+    if os.path.isdir(db_host):
+        shutil.rmtree(db_host)
+    else:
+        os.remove(db_host)
+    other_handler = V4MetaDBHandler(database_id="pool", **kwargs)
+    other_handler.read()
+    assert len(other_handler) == 0
+
+
 def test_validate_schema_file():
     """Validate schema."""
     handler = V4DBHandler(
@@ -786,7 +885,7 @@ def test_search_tinydb(
 
 @pytest.mark.parametrize(
     db_args,
-    list(filter(lambda d: d[0] in ["tinymongo", "mongodb", "montydb"], db_list)),
+    list(filter(lambda d: d[0] in ["tinymongo", "mongodb", "montydb", "sqlite"], db_list)),
 )
 def test_search_mongo(
     db_engine: str,
@@ -855,7 +954,10 @@ def test_search_mongo(
     assert len(handler) > 0
 
 
-@pytest.mark.parametrize(db_args, list(filter(lambda d: d[0] in ["mongodb"], db_list)))
+@pytest.mark.parametrize(
+    db_args,
+    list(filter(lambda d: d[0] in ["mongodb", "tinymongo", "montydb", "sqlite"], db_list)),
+)
 def test_group_by_mongo(
     db_engine: str,
     db_host: str,
@@ -863,7 +965,7 @@ def test_group_by_mongo(
     db_password: Optional[str],
     db_name: Optional[str],
 ):
-    """Evaluate Group-by on MongoDB.
+    """Evaluate Group-by on MongoDB and the engines aggregating in process.
 
     Args:
         db_engine (str): DB engine (e.g., 'tinydb')
@@ -884,6 +986,7 @@ def test_group_by_mongo(
         orient="contents",
         read_on_init=False,
     )
+    _add_files_to_db(handler)
 
     handler.read()
     group_keys = ["record_id"]
@@ -892,6 +995,20 @@ def test_group_by_mongo(
         handler.read(group_by=key)
         grouped = [data[key] for data in handler.data]
         assert len(grouped) == len(set(all[key])), "AssertionError: group_key: {}".format(key)
+        assert handler.count_total == len(grouped)
+
+    # Columns are aggregated as configured (contents: mergeObjects, start_timestamp: min)
+    handler.read(pql='record_id == "sample"')
+    contents = set(content for data in handler.data for content in data["contents"].keys())
+    start_timestamp = min(data["start_timestamp"] for data in handler.data)
+    handler.read(pql='record_id == "sample"', group_by="record_id")
+    assert len(handler.data) == 1
+    assert set(handler.data[0]["contents"].keys()) == contents
+    assert handler.data[0]["start_timestamp"] == start_timestamp
+
+    handler.read(group_by="record_id", order_by=[("record_id", -1)], limit=1)
+    assert len(handler.data) == 1 and handler.count_total == len(set(all["record_id"]))
+    assert handler.data[0]["record_id"] == max(all["record_id"])
 
 
 @pytest.mark.parametrize(db_args, list(filter(lambda d: d[0] in ["mongodb", "montydb"], db_list)))
@@ -1130,6 +1247,1110 @@ def test_read_with_offset(
     assert handler.df.index[0] == 1
 
 
+@pytest.mark.parametrize(db_args, db_list)
+def test_iter_read(
+    db_engine: str,
+    db_host: str,
+    db_username: Optional[str],
+    db_password: Optional[str],
+    db_name: Optional[str],
+):
+    """Test for reading database batch by batch.
+
+    Args:
+        db_engine (str): DB engine (e.g., 'tinydb')
+        db_host (str): Host of path of DB
+        db_username (str): Username
+        db_password (str): Password
+        db_name (str): Database name
+
+    """
+    handler = V4DBHandler(
+        db_class="meta",
+        db_engine=db_engine,
+        db_host=db_host,
+        db_username=db_username,
+        db_password=db_password,
+        db_name=db_name,
+        base_dir_path=os.path.join(os.getcwd(), "test"),
+        orient="contents",
+    )
+    _add_files_to_db(handler)
+    handler.read()
+
+    records = list(handler.iter_read(batch_size=2))
+    assert len(records) == len(handler.data)
+    assert len(handler._data) == len(records)
+    assert sorted(r["path"] for r in records) == sorted(r["path"] for r in handler.data)
+    assert all(os.path.isabs(r["path"]) for r in records)
+
+    dfs = list(handler.iter_read(batch_size=2, as_dataframe=True))
+    assert len(dfs) == (len(records) + 1) // 2
+    assert sum(len(df) for df in dfs) == len(handler.df)
+    assert set(dfs[0].columns) <= set(handler.df.columns)
+
+    if db_engine != "tinydb":
+        records = list(handler.iter_read(pql='record_id == "sample"'))
+        assert len(records) > 0
+        assert all(r["record_id"] == "sample" for r in records)
+
+
+@pytest.mark.parametrize(db_args, db_list)
+def test_iter_items(
+    db_engine: str,
+    db_host: str,
+    db_username: Optional[str],
+    db_password: Optional[str],
+    db_name: Optional[str],
+):
+    """Test for iterating over items without copying records.
+
+    Args:
+        db_engine (str): DB engine (e.g., 'tinydb')
+        db_host (str): Host of path of DB
+        db_username (str): Username
+        db_password (str): Password
+        db_name (str): Database name
+
+    """
+    for orient in ["contents", "path"]:
+        handler = V4DBHandler(
+            db_class="meta",
+            db_engine=db_engine,
+            db_host=db_host,
+            db_username=db_username,
+            db_password=db_password,
+            db_name=db_name,
+            base_dir_path=os.path.join(os.getcwd(), "test"),
+            orient=orient,
+        )
+        _add_files_to_db(handler)
+        handler.read()
+        snapshot = deepcopy(handler._data)
+
+        items = list(handler.iter_items())
+        assert len(items) == len(handler)
+        assert all(os.path.isabs(item["path"]) for item in items)
+        assert items == [handler[i] for i in range(len(handler))]
+
+        item = handler[0]
+        item["path"] = "modified"
+        for value in item.values():
+            if isinstance(value, dict):
+                value.clear()
+        _ = handler.df
+        assert handler._data == snapshot
+
+
+def test_incremental_index():
+    """Test for updating the index of items incrementally."""
+    handler = V4DBHandler(
+        db_class="meta",
+        db_engine="tinydb",
+        db_host="test/test_v4.json",
+        base_dir_path="/opt/pydtk/test",
+        orient="contents",
+        read_on_init=False,
+    )
+    assert len(handler) == 0
+    for i in range(5):
+        handler.add_data(
+            {
+                "record_id": "index",
+                "path": "/opt/pydtk/test/index_{}.csv".format(i),
+                "contents": {"/topic_{}".format(j): {"tags": [str(j)]} for j in range(i)},
+            }
+        )
+        if i > 0:
+            assert handler[-1]["contents"] == {"/topic_{}".format(i - 1): {"tags": [str(i - 1)]}}
+    handler.add_data(
+        {
+            "record_id": "index",
+            "path": "/opt/pydtk/test/index_1.csv",
+            "contents": {"/topic_a": {}, "/topic_b": {}},
+        }
+    )
+    items = [handler[i] for i in range(len(handler))]
+
+    handler._reindex()
+    assert len(handler) == len(items) == 0 + 2 + 2 + 3 + 4
+    assert items == [handler[i] for i in range(len(handler))]
+    assert items == list(handler.iter_items())
+    assert items[1]["contents"] == {"/topic_b": {}}
+    with pytest.raises(IndexError):
+        handler[len(handler)]
+
+
+def test_df_cache():
+    """Test for caching the data-frame until the handler is modified."""
+    handler = V4DBHandler(
+        db_class="meta",
+        db_engine="tinydb",
+        db_host="test/test_v4.json",
+        base_dir_path="/opt/pydtk/test",
+        orient="contents",
+        read_on_init=False,
+    )
+    handler.add_data(
+        {
+            "record_id": "cache",
+            "path": "/opt/pydtk/test/cache.csv",
+            "tags": ["a"],
+            "contents": {"/topic": {"tags": ["b"], "msg": {"type": "int"}}, "/empty": {}},
+        }
+    )
+    df = handler.df
+    assert len(df) == 2
+    assert df["msg.type"].tolist()[0] == "int"
+    assert sorted(df["tags"].tolist()[0]) == ["a", "b"]
+    assert df["tags"].tolist()[1] == ["a"]
+    assert handler._df_cache is not None
+
+    df.loc[0, "msg.type"] = "modified"
+    assert handler.df["msg.type"].tolist()[0] == "int"
+
+    handler.add_data({"record_id": "cache", "path": "/opt/pydtk/test/cache_2.csv"})
+    assert len(handler.df) == 3
+    assert "_uuid" in handler.columns
+
+    handler.config["columns"].append({"name": "new", "dtype": "str", "display_name": "New"})
+    handler.mark_modified([])
+    assert "New" in handler.df.columns
+
+    # In-place modifications are notified
+    uuid = next(iter(handler._data.keys()))
+    handler._data[uuid]["contents"]["/new"] = {"tags": ["c"]}
+    handler.mark_modified([uuid])
+    assert len(handler.df) == 4
+    assert len(handler) == 4
+
+    handler.orient = "path"
+    assert len(handler.df) == 2
+
+
+@pytest.mark.parametrize(db_args, db_list)
+def test_add_many(
+    db_engine: str,
+    db_host: str,
+    db_username: Optional[str],
+    db_password: Optional[str],
+    db_name: Optional[str],
+):
+    """Test for adding multiple records at once.
+
+    Args:
+        db_engine (str): DB engine (e.g., 'tinydb')
+        db_host (str): Host of path of DB
+        db_username (str): Username
+        db_password (str): Password
+        db_name (str): Database name
+
+    """
+    from pydtk.models import MetaDataModel
+
+    paths = [
+        "test/records/sample/data/records.bag.json",
+        "test/records/csv_model_test/data/test.csv.json",
+        "test/records/json_model_test/json_test.json.json",
+    ]
+    records = []
+    for path in paths:
+        metadata = MetaDataModel()
+        metadata.load(path)
+        records.append(metadata.data)
+    paths_in_records = [r["path"] for r in records]
+
+    kwargs = {
+        "db_class": "meta",
+        "db_engine": db_engine,
+        "db_host": db_host,
+        "db_username": db_username,
+        "db_password": db_password,
+        "db_name": db_name,
+        "base_dir_path": os.path.join(os.getcwd(), "test"),
+    }
+    handler_one = V4DBHandler(database_id="one", **kwargs)
+    for record in records:
+        handler_one.add_data(record)
+    handler_many = V4DBHandler(database_id="many", **kwargs)
+    handler_many.add_many(records + records[:1])
+
+    assert [r["path"] for r in records] == paths_in_records
+    assert handler_many._uuids_duplicated == [handler_one.data[0]["_uuid"]]
+    assert sorted(c["name"] for c in handler_many.config["columns"]) == sorted(
+        c["name"] for c in handler_one.config["columns"]
+    )
+    df_one = handler_one.df.drop(columns=["_creation_time"])
+    df_many = handler_many.df.drop(columns=["_creation_time"])
+    assert df_many.equals(df_one[df_many.columns])
+
+    handler_many.save()
+    handler_many.read()
+    assert len(handler_many.data) == len(records)
+
+
+@pytest.mark.parametrize(db_args, db_list)
+def test_save_delta(
+    db_engine: str,
+    db_host: str,
+    db_username: Optional[str],
+    db_password: Optional[str],
+    db_name: Optional[str],
+    monkeypatch,
+):
+    """Test for saving only modified records.
+
+    Args:
+        db_engine (str): DB engine (e.g., 'tinydb')
+        db_host (str): Host of path of DB
+        db_username (str): Username
+        db_password (str): Password
+        db_name (str): Database name
+
+    """
+    from pydtk.db.v4.engines import DB_ENGINES
+
+    handler = V4DBHandler(
+        db_class="meta",
+        db_engine=db_engine,
+        db_host=db_host,
+        db_username=db_username,
+        db_password=db_password,
+        db_name=db_name,
+        base_dir_path=os.path.join(os.getcwd(), "test"),
+    )
+    _add_files_to_db(handler)
+    handler.read()
+    num_records = len(handler.data)
+
+    upserted = []
+    upsert = DB_ENGINES[db_engine].upsert
+
+    def _upsert(db, data, **kwargs):
+        upserted.append([record["_uuid"] for record in data])
+        return upsert(db, data, **kwargs)
+
+    monkeypatch.setattr(DB_ENGINES[db_engine], "upsert", _upsert)
+
+    # Nothing has changed
+    handler.save()
+    assert upserted[0] == []
+
+    # Modify a record and remove another
+    records = handler.data
+    records[0]["description"] = "modified"
+    handler.add_data(records[0])
+    handler.remove_data(records[1])
+    upserted.clear()
+    handler.save()
+    assert upserted[0] == [records[0]["_uuid"]]
+
+    handler.read()
+    assert len(handler.data) == num_records - 1
+    assert handler.data[0]["description"] == "modified"
+
+    # Records modified in-place are detected
+    record = list(handler._data.values())[-1]
+    record["description"] = "modified in-place"
+    upserted.clear()
+    handler.save()
+    assert upserted[0] == [record["_uuid"]]
+    upserted.clear()
+    handler.save()
+    assert upserted[0] == []
+
+    # Save everything including configs
+    upserted.clear()
+    handler.save(full=True)
+    assert len(upserted[0]) == num_records - 1
+    assert ["__config__"] in upserted
+
+
+@pytest.mark.parametrize(db_args, db_list)
+def test_config_stamp(
+    db_engine: str,
+    db_host: str,
+    db_username: Optional[str],
+    db_password: Optional[str],
+    db_name: Optional[str],
+):
+    """Test for reloading configs only when they are updated in DB.
+
+    Args:
+        db_engine (str): DB engine (e.g., 'tinydb')
+        db_host (str): Host of path of DB
+        db_username (str): Username
+        db_password (str): Password
+        db_name (str): Database name
+
+    """
+    kwargs = {
+        "db_engine": db_engine,
+        "db_host": db_host,
+        "db_username": db_username,
+        "db_password": db_password,
+        "db_name": db_name,
+        "base_dir_path": os.path.join(os.getcwd(), "test"),
+    }
+    handler = V4MetaDBHandler(database_id="stamp", **kwargs)
+    _add_files_to_db(handler)
+    assert handler.config["_config_version"] == 1
+
+    # Configs are not re-created unless they are updated
+    config = handler.config
+    handler.read()
+    assert handler.config is config
+
+    other_handler = V4MetaDBHandler(database_id="stamp", **kwargs)
+    cached_handler = V4MetaDBHandler(database_id="stamp", config_ttl=3600, **kwargs)
+    other_handler.config["columns"].append({"name": "stamp", "dtype": "str"})
+    other_handler.save()
+    assert other_handler.config["_config_version"] == 2
+
+    handler.read()
+    assert "stamp" in [c["name"] for c in handler.config["columns"]]
+    cached_handler.read()
+    assert "stamp" not in [c["name"] for c in cached_handler.config["columns"]]
+    cached_handler._load_config_from_db(force=True)
+    assert "stamp" in [c["name"] for c in cached_handler.config["columns"]]
+
+    # Unmodified configs are not written
+    handler.save()
+    assert handler.config["_config_version"] == 2
+
+
+@pytest.mark.parametrize(db_args, db_list)
+def test_read_fields(
+    db_engine: str,
+    db_host: str,
+    db_username: Optional[str],
+    db_password: Optional[str],
+    db_name: Optional[str],
+):
+    """Test for reading a part of fields.
+
+    Args:
+        db_engine (str): DB engine (e.g., 'tinydb')
+        db_host (str): Host of path of DB
+        db_username (str): Username
+        db_password (str): Password
+        db_name (str): Database name
+
+    """
+    handler = V4MetaDBHandler(
+        db_engine=db_engine,
+        db_host=db_host,
+        db_username=db_username,
+        db_password=db_password,
+        db_name=db_name,
+        database_id="fields",
+        base_dir_path=os.path.join(os.getcwd(), "test"),
+        orient="contents",
+    )
+    _add_files_to_db(handler)
+
+    handler.read(fields=["record_id", "path"])
+    assert len(handler.data) > 0
+    for record in handler.data:
+        assert set(record.keys()).difference(["_id"]) == {"_uuid", "record_id", "path"}
+    columns = [c for c in handler.df.columns if not c.startswith("_")]
+    assert set(columns) == {"Record ID", "File path"}
+    assert all(isinstance(item["path"], str) for item in handler)
+
+    handler.read(exclude=["contents"])
+    assert all("contents" not in record.keys() for record in handler.data)
+    assert "Contents" not in handler.df.columns and "End timestamp" in handler.df.columns
+    with pytest.raises(ValueError):
+        handler.read(fields=["record_id"], exclude=["contents"])
+
+    records = list(handler.iter_read(fields=["contents"]))
+    assert len(records) == len(handler.data)
+    assert all("path" not in record.keys() and "contents" in record for record in records)
+
+
+@pytest.mark.parametrize(db_args, db_list)
+def test_keyset_pagination(
+    db_engine: str,
+    db_host: str,
+    db_username: Optional[str],
+    db_password: Optional[str],
+    db_name: Optional[str],
+):
+    """Test for paging with cursors.
+
+    Args:
+        db_engine (str): DB engine (e.g., 'tinydb')
+        db_host (str): Host of path of DB
+        db_username (str): Username
+        db_password (str): Password
+        db_name (str): Database name
+
+    """
+    handler = V4MetaDBHandler(
+        db_engine=db_engine,
+        db_host=db_host,
+        db_username=db_username,
+        db_password=db_password,
+        db_name=db_name,
+        database_id="keyset",
+        base_dir_path="/tmp",
+    )
+    if not handler._engine_accepts("after"):
+        pytest.skip("{} does not support cursors".format(db_engine))
+    for i in range(10):
+        handler.add_data({"record_id": "record_{}".format(i % 4), "path": "/tmp/{}.bag".format(i)})
+    handler.save()
+
+    order_by = [("record_id", -1)]
+    handler.read(order_by=order_by)
+    expected = sorted(handler.data, key=lambda r: r["_uuid"])
+    expected = [r["_uuid"] for r in sorted(expected, key=lambda r: r["record_id"], reverse=True)]
+
+    uuids, after = [], None
+    while True:
+        handler.read(order_by=order_by, limit=3, after=after, fields=["path"])
+        assert len(handler.data) <= 3 and handler.count_total == 10
+        assert all("record_id" in record.keys() for record in handler.data)
+        uuids += [record["_uuid"] for record in handler.data]
+        after = handler.next_cursor
+        if after is None:
+            break
+    assert uuids == expected
+
+    handler.read(order_by=order_by, limit=3, offset=3, disable_count_total=True)
+    assert [record["_uuid"] for record in handler.data] == expected[3:6]
+    with pytest.raises(ValueError):
+        handler.read(order_by=[("path", 1)], limit=3, after=handler.next_cursor)
+    with pytest.raises(ValueError):
+        handler.read(limit=3, after="invalid")
+
+    # Null and missing values of a sort key
+    from pydtk.db.v4.engines import keyset_order, sort_documents
+
+    for i, description in enumerate([None, "b", None, "a", "b"]):
+        record = {"record_id": "sparse", "path": "/tmp/sparse_{}.bag".format(i)}
+        record.update({"description": description} if description is not None else {})
+        handler.add_data(record)
+    handler.add_data({"record_id": "sparse", "path": "/tmp/sparse_null.bag", "description": None})
+    handler.save()
+    query = {"record_id": "sparse"}
+    for order_by in [[("description", 1)], [("description", -1)]]:
+        handler.read(query=query)
+        expected = [r["_uuid"] for r in sort_documents(handler.data, keyset_order(order_by))]
+        uuids, after = [], None
+        while True:
+            handler.read(query=query, order_by=order_by, limit=2, after=after)
+            uuids += [record["_uuid"] for record in handler.data]
+            after = handler.next_cursor
+            if after is None:
+                break
+        assert uuids == expected
+
+
+def test_read_count_mongodb():
+    """Test for counting records on reading from MongoDB."""
+    mongomock = pytest.importorskip("mongomock")
+    from pymongo.errors import OperationFailure
+
+    from pydtk.db.v4.engines import mongodb
+
+    collection = mongomock.MongoClient().db.collection
+    collection.insert_many(
+        [{"_uuid": "{:02d}".format(i), "record_id": "record_{}".format(i % 3)} for i in range(10)]
+    )
+    query = {"record_id": {"$ne": "record_0"}}
+
+    data, count_total = mongodb.read(collection, query=query, limit=2, offset=1)
+    assert [d["_uuid"] for d in data] == ["02", "04"] and count_total == 6
+    data, count_total = mongodb.read(collection, query=query, count_mode="deferred", limit=2)
+    assert len(data) == 2 and count_total is None
+    assert mongodb.count(collection, query=query) == 6
+    data, count_total = mongodb.read(collection, count_mode="estimated", limit=2)
+    assert len(data) == 2 and count_total == 10
+    data, count_total = mongodb.read(collection, limit=4, disable_count_total=True)
+    assert len(data) == 4 and count_total == 4
+    data, count_total = mongodb.read(collection, query={"record_id": "none"}, limit=2)
+    assert len(data) == 0 and count_total == 0
+    with pytest.raises(ValueError):
+        mongodb.read(collection, count_mode="unknown")
+
+    # Grouped records are counted in the same aggregation unless the page is too large
+    expected = (["record_1", "record_2"], 3)
+    data, count_total = mongodb.read(collection, group_by="record_id", limit=2, offset=1)
+    assert ([d["record_id"] for d in data], count_total) == expected
+    aggregate = collection.aggregate
+
+    def _aggregate(pipeline, **kwargs):
+        if any("$facet" in stage for stage in pipeline):
+            raise OperationFailure("BSONObj size is invalid", code=10334)
+        return aggregate(pipeline, **kwargs)
+
+    collection.aggregate = _aggregate
+    data, count_total = mongodb.read(collection, group_by="record_id", limit=2, offset=1)
+    assert ([d["record_id"] for d in data], count_total) == expected
+
+
+def test_apply_projection():
+    """Test for projections emulated by engines."""
+    from pydtk.db.v4.engines import apply_projection, get_projection
+
+    document = {"_uuid": "a", "path": "/a", "contents": {"/a": {"tags": ["x"]}, "/b": {}}}
+    projected = apply_projection(document, get_projection(fields=["contents./a.tags"]))
+    assert projected == {"_uuid": "a", "contents": {"/a": {"tags": ["x"]}}}
+    projected = apply_projection(document, get_projection(exclude=["path", "contents./b"]))
+    assert projected == {"_uuid": "a", "contents": {"/a": {"tags": ["x"]}}}
+    assert "/b" in document["contents"].keys() and "path" in document.keys()
+    assert apply_projection(document, get_projection()) is document
+    with pytest.raises(ValueError):
+        get_projection(exclude=["_uuid"])
+
+
+def test_tinydb_batched_writes(monkeypatch):
+    """Test that the tinydb engine writes the file once per upsert or remove."""
+    from pydtk.db.v4.engines import tinydb as engine
+
+    writes = []
+    write = engine.AtomicJSONStorage.write
+    monkeypatch.setattr(
+        engine.AtomicJSONStorage, "write", lambda self, data: writes.append(1) or write(self, data)
+    )
+
+    path = "test/test_v4.json"
+    db = engine.connect(path)
+    db.all()  # creates the table
+    inode = os.stat(path).st_ino
+    writes.clear()
+    engine.upsert(db, [{"_uuid": str(i), "value": i} for i in range(100)])
+    assert len(writes) == 1
+    assert os.stat(path).st_ino != inode
+    assert not any(name.endswith(".tmp") for name in os.listdir("test"))
+
+    engine.upsert(db, [{"_uuid": "0", "value": -1}, {"_uuid": "100", "value": 100}])
+    engine.remove(db, [str(i) for i in range(1, 50)])
+    assert len(writes) == 3
+    data, count_total = engine.read(db)
+    assert count_total == 52 and len(set(d.doc_id for d in data)) == 52
+    assert sorted(int(d["_uuid"]) for d in data) == [0] + list(range(50, 101))
+    assert next(d for d in data if d["_uuid"] == "0")["value"] == -1
+
+    # The file replaced by the other connection is reopened on reading
+    other = engine._open(path, engine.DEFAULT_COLLECTION_NAME)
+    engine.upsert(other, [{"_uuid": "101", "value": 101}])
+    other.close()
+    assert engine.read(db)[1] == 53
+    engine.upsert(db, [{"_uuid": "102", "value": 102}])
+    assert len(set(d.doc_id for d in engine.read(db)[0])) == 54
+
+
+def test_tinymongo_cache(monkeypatch):
+    """Test that tinymongo reads are served from memory until the DB file is modified."""
+    from pydtk.db.v4.engines import tinymongo as engine
+
+    db = engine.connect("test/test_v4")
+    engine.upsert(db, [{"_uuid": str(i), "value": i} for i in range(100)])
+
+    opened = []
+    open_database = engine._open_database
+    monkeypatch.setattr(
+        engine,
+        "_open_database",
+        lambda *args: opened.append(1) or open_database(*args),
+    )
+    assert engine.read(db, query={"_uuid": "10"})[0][0]["value"] == 10
+    engine.upsert(db, [{"_uuid": "10", "value": -10}, {"_uuid": "100", "value": 100}])
+    engine.remove(db, [str(i) for i in range(50)])
+    data, count_total = engine.read(db, order_by=[("value", 1)])
+    assert count_total == 51 and data[0]["value"] == 50 and data[-1]["value"] == 100
+    assert all("_id" in document for document in data)
+    assert len(opened) == 0
+
+    # Modifications by another connection are reloaded
+    other = engine._open_database("test/test_v4", engine.DEFAULT_DB_NAME)
+    other.default.insert_one({"_uuid": "101", "value": 101})
+    other.tinydb.close()
+    assert engine.read(db, query={"_uuid": "101"})[1] == 1
+    assert len(opened) == 2
+
+    # Records are copied shallowly on reading and deeply on writing
+    record = {"_uuid": "102", "value": {"nested": [102]}}
+    engine.upsert(db, [record])
+    record["value"]["nested"].append(-1)
+    data = engine.read(db, query={"_uuid": "102"})[0]
+    data[0]["value"] = None
+    assert engine.read(db, query={"_uuid": "102"})[0][0]["value"] == {"nested": [102]}
+
+    # Writes wait for those of the other processes to take the stat of their own
+    path = engine._table_key(db)[0]
+    with engine._locked(path):
+        thread = threading.Thread(target=engine.remove, args=(db, ["102"]))
+        thread.start()
+        thread.join(0.2)
+        assert thread.is_alive()
+    thread.join()
+    assert engine._SNAPSHOTS[engine._table_key(db)][0] == engine._stat(path)
+    assert engine.read(db, query={"_uuid": "102"})[1] == 0
+    assert len(opened) == 2
+
+
+def test_tinymongo_copy_on_modification(tmp_path):
+    """Test that records read from tinymongo are copied on modifications by the handler."""
+    kwargs = {
+        "db_class": "meta",
+        "db_engine": "tinymongo",
+        "db_host": str(tmp_path),
+        "base_dir_path": os.path.join(os.getcwd(), "test"),
+        "read_on_init": False,
+    }
+    handler = V4DBHandler(**kwargs)
+    _add_files_to_db(handler)
+    handler.read(order_by=[("_uuid", 1)])
+    expected = handler.data
+    assert len(handler._shared) == len(handler._data) > 0
+
+    record = deepcopy(next(r for r in expected if isinstance(r.get("contents"), dict)))
+    topic = next(iter(record["contents"].keys()))
+    record["contents"][topic]["tags"] = ["modified"]
+    handler.add_data(record, strategy="merge")
+    assert record["_uuid"] not in handler._shared
+
+    # The cache of the engine is not modified
+    other = V4DBHandler(**kwargs)
+    other.read(order_by=[("_uuid", 1)])
+    assert other.data == expected
+
+
+def test_tinymongo_sharded(monkeypatch, tmp_path):
+    """Test for the sharded layout of tinymongo databases."""
+    from pydtk.db.v4.engines import _segments
+    from pydtk.db.v4.engines import tinymongo as engine
+
+    kwargs = {
+        "db_class": "meta",
+        "db_engine": "tinymongo",
+        "db_host": str(tmp_path),
+        "base_dir_path": os.path.join(os.getcwd(), "test"),
+        "orient": "contents",
+        "read_on_init": False,
+    }
+    handler = V4DBHandler(**kwargs)
+    _add_files_to_db(handler)
+    handler.read(order_by=[("_uuid", 1)])
+    data = handler.data
+
+    engine.migrate(str(tmp_path), num_shards=4)
+    assert os.path.isfile(os.path.join(tmp_path, "default.json.migrated"))
+    assert not os.path.exists(os.path.join(tmp_path, "default.json"))
+    with pytest.raises(FileExistsError):
+        engine.migrate(str(tmp_path))
+
+    handler = V4DBHandler(**kwargs)
+    assert isinstance(handler._db, engine.ShardedCollection)
+    handler.read(order_by=[("_uuid", 1)])
+    assert handler.data == data
+    handler.read(pql='record_id == "sample"')
+    assert len(handler) > 0 and all(d["record_id"] == "sample" for d in handler.data)
+
+    # Writes are appended to the log and seen by the other stores (e.g. in other processes)
+    store = handler._db.store
+    other = _segments.SegmentStore(store.db_path, handler._db._collection_name)
+    assert len(other.snapshot()[1]) == len(data)
+    handler.remove_data(handler.data[0])
+    handler.add_data({"record_id": "sharded", "path": "/tmp/sharded.bag"})
+    handler.save()
+    assert len(other.snapshot()[1]) == len(data)
+    assert len(os.listdir(store.path)) <= 5
+
+    # Compaction merges the log into the segments
+    monkeypatch.setattr(_segments, "COMPACTION_THRESHOLD", 0)
+    handler.add_data({"record_id": "sharded", "path": "/tmp/sharded2.bag"})
+    handler.save()
+    with open(os.path.join(store.path, "log.jsonl")) as f:
+        assert len(f.readlines()) == 1
+    engine.compact(handler._db)
+    version, documents = other.snapshot()
+    assert sorted(d["_uuid"] for d in documents) == sorted(d["_uuid"] for d in store.snapshot()[1])
+    assert other.refresh() == version
+
+    handler = V4DBHandler(**kwargs)
+    handler.read(pql='record_id == "sharded"')
+    assert len(handler) == 2
+    assert engine.exist_table(handler._db, handler._db._collection_name)
+    engine.drop_table(handler._db, handler._db._collection_name)
+    handler.read()
+    assert len(handler) == 0
+
+
+def test_montydb_bulk_writes(monkeypatch):
+    """Test that the montydb engine writes records in batches."""
+    from montydb.storage.sqlite import SQLiteKVEngine
+
+    from pydtk.db.v4.engines import montydb as engine
+
+    db = engine.connect("test/test_v4")
+    db.insert_one({"_uuid": "legacy", "value": 0})  # `_id` is an ObjectId
+
+    connections = []
+    connect = SQLiteKVEngine._connect
+    monkeypatch.setattr(
+        SQLiteKVEngine,
+        "_connect",
+        lambda self, *args: connections.append(1) or connect(self, *args),
+    )
+    monkeypatch.setattr(engine, "BATCH_SIZE", 60)
+    records = [{"_uuid": str(i), "value": i} for i in range(100)]
+    records += [{"_uuid": "legacy", "value": -1, "new": True}, {"_uuid": "0", "extra": 1}]
+    engine.upsert(db, records)
+    assert len(connections) <= 2 * 4  # a query, an insert and an update per batch
+
+    data = {record["_uuid"]: record for record in db.find({})}
+    assert len(data) == 101
+    assert all(record["_id"] == uuid for uuid, record in data.items() if uuid != "legacy")
+    assert data["0"] == {"_id": "0", "_uuid": "0", "value": 0, "extra": 1}
+    assert data["legacy"]["value"] == -1 and data["legacy"]["new"]
+
+    engine.upsert(db, [{"_uuid": "1", "value": -1}])
+    assert db.find_one({"_uuid": "1"})["value"] == -1
+    connections.clear()
+    engine.remove(db, [str(i) for i in range(50)] + ["legacy"])
+    assert len(connections) <= 2
+    assert sorted(int(record["_uuid"]) for record in db.find({})) == list(range(50, 100))
+
+
+def test_sqlite_queries():
+    """Test that the sqlite engine matches documents as MongoDB does."""
+    mongomock = pytest.importorskip("mongomock")
+    from pydtk.db.v4.deps import pql as PQL
+    from pydtk.db.v4.engines import sqlite
+
+    records = [
+        {"_uuid": "1", "record_id": "a", "n": 3, "tags": ["x", "y"], "flag": True, "c": {"k": 1}},
+        {"_uuid": "2", "record_id": "b", "n": 5.5, "tags": "x", "flag": False},
+        {"_uuid": "3", "record_id": "a", "n": None, "tags": [], "s": "1"},
+        {"_uuid": "4", "record_id": "C", "n": "text", "tags": [["x"]]},
+    ]
+    sqlite_db = sqlite.connect("test/test_v4", collection_name="queries")
+    sqlite.create_indexes(sqlite_db, [{"keys": [("record_id", 1), ("n", 1)], "unique": False}])
+    sqlite.upsert(sqlite_db, records)
+    mongo_db = mongomock.MongoClient().db.queries
+    mongo_db.insert_many(deepcopy(records))
+
+    queries = [
+        'tags == "x"',
+        'tags in ["y", "z"]',
+        "n > 3",
+        "n >= 3 and n < 6",
+        "n == None",
+        "n != None",
+        'n > "a"',
+        'record_id == regex("^[ab]")',
+        'record_id == regex("c", "i")',
+        "not (n > 3)",
+        "flag == True",
+        "flag != False",
+        "tags == size(2)",
+        'tags == all(["x", "y"])',
+        '"c.k" == 1',
+        "s == exists(True)",
+        's == exists(False) and record_id != "a"',
+        '(n > 4 or record_id == "a") and tags != "y"',
+    ]
+    for query in queries:
+        expected = sorted(record["_uuid"] for record in mongo_db.find(PQL.find(query)))
+        actual = sorted(record["_uuid"] for record in sqlite.read(sqlite_db, pql=query)[0])
+        assert actual == expected, query
+
+    # Queries on indexed keys are executed with the indexes
+    where, params = sqlite._where_clause({"record_id": "a"}, sqlite_db.fields())
+    plan = sqlite_db.connection.execute(
+        "EXPLAIN QUERY PLAN SELECT document FROM queries WHERE {}".format(where), params
+    ).fetchall()
+    assert "USING INDEX" in plan[0][-1]
+
+    data, count_total = sqlite.read(sqlite_db, order_by=[("n", -1)], limit=2, offset=1)
+    assert [record["_uuid"] for record in data] == ["2", "1"] and count_total == 4
+    data, _ = sqlite.read(sqlite_db, group_by="record_id", order_by=[("record_id", 1)])
+    assert [(record["record_id"], record["_uuid"]) for record in data] == [
+        ("C", "4"),
+        ("a", "1"),
+        ("b", "2"),
+    ]
+    assert sqlite.count(sqlite_db, group_by="record_id") == 3
+
+    sqlite.upsert(sqlite_db, [{"_uuid": "1", "n": float("nan")}])
+    assert sqlite.read_one(sqlite_db, {"_uuid": "1"}) == {**records[0], "n": None}
+    sqlite.remove(sqlite_db, ["1", "2"])
+    assert [record["_uuid"] for record in sqlite.read(sqlite_db)[0]] == ["3", "4"]
+
+
+def test_parquet_engine(monkeypatch):
+    """Test for the parquet engine with delta files and query pushdown."""
+    pytest.importorskip("pyarrow")
+    mongomock = pytest.importorskip("mongomock")
+    import pyarrow as pa
+
+    from pydtk.db.v4.deps import pql as PQL
+    from pydtk.db.v4.engines import parquet as engine
+
+    records = [
+        {"_uuid": "1", "record_id": "a", "n": 3, "tags": ["x", "y"], "flag": True},
+        {"_uuid": "2", "record_id": "b", "n": 5.5, "tags": ["x"], "flag": False},
+        {"_uuid": "3", "record_id": "a", "tags": [], "s": "1"},
+        {"_uuid": "4", "record_id": "c", "n": 1, "contents": {"/t": {"tags": ["z"]}}},
+    ]
+    records[0]["contents"] = {"/t": {"msg_type": "m", "count": 2}, "/u": {"count": 1}}
+    db = engine.connect("test/test_v4", collection_name="records")
+    engine.upsert(db, records)
+    mongo_db = mongomock.MongoClient().db.records
+    mongo_db.insert_many(deepcopy(records))
+
+    queries = [
+        'tags == "x"',
+        'tags in ["y", "z"]',
+        "n > 3",
+        "n >= 1 and n < 5",
+        "n == None",
+        "n != None",
+        'record_id == "a"',
+        'record_id in ["b", "c"]',
+        'record_id == regex("^[ab]")',
+        "flag == True",
+        "tags == size(2)",
+        '"contents./t" == exists(True)',
+        '"contents./t.count" > 1',
+        '(n > 4 or record_id == "a") and tags != "y"',
+    ]
+    for query in queries:
+        expected = sorted(record["_uuid"] for record in mongo_db.find(PQL.find(query)))
+        actual = sorted(record["_uuid"] for record in engine.read(db, pql=query)[0])
+        assert actual == expected, query
+
+    # Only the needed partitions, columns and rows are read
+    scans = []
+    dataset = engine.ds.dataset
+
+    class _Dataset(object):
+        def __init__(self, paths, **kwargs):
+            self.paths, self.dataset = paths, dataset(paths, **kwargs)
+
+        def to_table(self, **kwargs):
+            table = self.dataset.to_table(**kwargs)
+            scans.append((self.paths, kwargs["columns"], table.num_rows))
+            return table
+
+    monkeypatch.setattr(engine.ds, "dataset", _Dataset)
+    data, _ = engine.read(db, pql='record_id == "b" and n > 5', fields=["n"])
+    assert data == [{"_uuid": "2", "n": 5.5}]
+    partition = "{:04d}".format(engine._partition({"record_id": "b"}))
+    path = os.path.join(db.path, engine._read_manifest(db.path)["base"][partition])
+    assert scans == [([path], ["_uuid", "record_id", "n"], 1)]
+    monkeypatch.setattr(engine.ds, "dataset", dataset)
+
+    # `contents` is stored as a map and written back as it is
+    schema = engine._read_manifest(db.path)["schema"]
+    assert pa.types.is_map(schema.field("contents").type)
+    assert engine.read(db, pql='record_id == "c"')[0] == [records[3]]
+
+    # Writes are appended to delta files, which are compacted
+    monkeypatch.setattr(engine, "MAX_DELTAS", 2)
+    engine.upsert(db, [{"_uuid": "1", "n": 4}, {"_uuid": "5", "record_id": "d"}])
+    engine.remove(db, ["2"])
+    assert len(engine._read_manifest(db.path)["deltas"]) == 2
+    data = {record["_uuid"]: record for record in engine.read(db)[0]}
+    assert sorted(data.keys()) == ["1", "3", "4", "5"]
+    assert data["1"] == {**records[0], "n": 4}
+    assert engine.count(db, pql="n > 3") == 1
+
+    engine.upsert(db, [{"_uuid": "3", "n": "text"}])  # the column needs to be rewritten
+    manifest = engine._read_manifest(db.path)
+    assert manifest["deltas"] == [] and "n" in manifest["json_columns"]
+    assert len(os.listdir(db.path)) == len(manifest["base"]) + 1
+    assert engine.read(db, pql='n == "text"')[0] == [{**records[2], "n": "text"}]
+    assert engine.count(db, group_by="record_id") == 3
+
+    engine.drop_table(db, "records")
+    assert not engine.exist_table(db, "records") and engine.read(db) == ([], 0)
+
+
+def test_parquet_handler():
+    """Test that the parquet engine works with V4MetaDBHandler."""
+    pytest.importorskip("pyarrow")
+
+    results = []
+    for db_engine, db_host in [
+        ("tinymongo", "test/test_v4/tinymongo"),
+        ("parquet", "test/test_v4"),
+    ]:
+        handler = V4MetaDBHandler(
+            db_engine=db_engine,
+            db_host=db_host,
+            base_dir_path="/opt/pydtk/test",
+            read_on_init=False,
+        )
+        _add_files_to_db(handler)
+        result = []
+        for pql in ['"contents./points_concat_downsampled" == exists(True)', "_kind != None"]:
+            handler.read(pql=pql, order_by=[("path", 1)])
+            result.append([record["path"] for record in handler.data])
+        handler.read(group_by="record_id", order_by=[("record_id", 1)])
+        result.append([record["record_id"] for record in handler.data])
+        handler.read(limit=2, order_by=[("path", -1)], fields=["path"])
+        result.append(([record["path"] for record in handler.data], handler.count_total))
+        results.append(result)
+    assert results[0] == results[1]
+
+
+def test_meta_db_with_job_queue(tmp_path):
+    """Test building a meta DB with workers sharing a job queue."""
+    from pydtk.builder import meta_db
+
+    results = []
+    for queue_dir in [None, str(tmp_path / "queue")]:
+        db_host = str(tmp_path / ("queue" if queue_dir else "serial"))
+        meta_db.main(
+            "test/records",
+            output_db_engine="sqlite",
+            output_db_host=db_host,
+            queue_dir=queue_dir,
+            num_jobs=2,
+        )
+        handler = V4MetaDBHandler(
+            db_engine="sqlite", db_host=db_host, base_dir_path="test/records", read_on_init=False
+        )
+        handler.read()
+        columns = sorted(c["name"] for c in handler.config["columns"])
+        results.append((sorted(record["_uuid"] for record in handler.data), columns))
+    assert len(results[0][0]) > 0
+    assert results[0] == results[1]
+
+
+def test_group_documents():
+    """Test for the in-process aggregation of engines without `$group`."""
+    from pydtk.db.v4.engines._aggregation import group_documents
+
+    documents = [
+        {"_uuid": "1", "key": "a", "value": 2, "tags": ["x"], "contents": {"/a": {}}},
+        {"_uuid": "2", "key": "b", "value": 1},
+        {"_uuid": "3", "key": "a", "value": None, "tags": ["x"], "contents": {"/b": {}}},
+        {"_uuid": "4", "value": 3},
+    ]
+    accumulators = {
+        "key": "first",
+        "_uuid": "last",
+        "value": "max",
+        "tags": "addToSet",
+        "contents": "mergeObjects",
+    }
+    grouped = group_documents(documents, "key", accumulators)
+    assert grouped == [
+        {"key": "a", "_uuid": "3", "value": 2, "tags": [["x"]], "contents": {"/a": {}, "/b": {}}},
+        {"key": "b", "_uuid": "2", "value": 1, "tags": [], "contents": {}},
+        {"key": None, "_uuid": "4", "value": 3, "tags": [], "contents": {}},
+    ]
+
+    grouped = group_documents(documents, "key", {"value": "sum", "tags": "push", "key": "avg"})
+    assert [group["value"] for group in grouped] == [2, 1, 3]
+    assert [group["tags"] for group in grouped] == [[["x"], ["x"]], [], []]
+    assert [group["key"] for group in grouped] == [None, None, None]
+    with pytest.raises(ValueError):
+        group_documents(documents, "key", {"value": "stdDevPop"})
+
+
+def test_local_index():
+    """Test for in-process indexes of engines without native indexes."""
+    from pydtk.db.v4.engines._index import IndexedDocuments
+
+    documents = [
+        {"record_id": "a", "timestamp": 1.0, "tags": ["x", "y"]},
+        {"record_id": "b", "timestamp": 2.0, "tags": ["y"]},
+        {"record_id": "a", "timestamp": 3.0},
+        {"record_id": "c", "timestamp": "invalid", "contents": {"/topic": {"tags": ["z"]}}},
+    ]
+    indexes = [
+        {"keys": [("record_id", 1), ("timestamp", 1)], "unique": False},
+        {"keys": [("timestamp", 1)], "unique": False},
+        {"keys": [("tags", 1)], "unique": False},
+        {"keys": [("contents./topic.tags", 1)], "unique": False},
+    ]
+    indexed = IndexedDocuments(documents, indexes)
+
+    assert indexed.candidates({"record_id": "a", "timestamp": 3.0}) == [documents[2]]
+    assert indexed.candidates({"record_id": "a", "timestamp": {"$in": [1.0, 2.0]}}) == [
+        documents[0]
+    ]
+    assert indexed.candidates({"timestamp": {"$gte": 2.0, "$lt": 3.0}}) == [documents[1]]
+    assert indexed.candidates({"timestamp": {"$gt": 1.0}, "tags": "y"}) == [documents[1]]
+    assert indexed.candidates({"$and": [{"tags": "x"}, {"timestamp": {"$lte": 1.0}}]}) == [
+        documents[0]
+    ]
+    assert indexed.candidates({"contents./topic.tags": {"$eq": "z"}}) == [documents[3]]
+
+    # Conditions not covered by the indexes
+    assert indexed.candidates({"record_id": "a"}) is None
+    assert indexed.candidates({"timestamp": {"$regex": "1"}}) is None
+    assert indexed.candidates({"$or": [{"tags": "x"}, {"tags": "z"}]}) is None
+
+
+def test_indexed_read():
+    """Test for reading tinymongo tables with in-process indexes."""
+    from pydtk.db.v4.engines import tinymongo
+
+    kwargs = {
+        "db_engine": "tinymongo",
+        "db_host": "test/test_v4",
+        "base_dir_path": os.path.join(os.getcwd(), "test"),
+    }
+    handler = V4MetaDBHandler(database_id="indexed", **kwargs)
+    indexes = [index["keys"] for index in handler._get_indexes()]
+    assert indexes[0] == [("_uuid", 1)]
+    assert [("record_id", 1)] in indexes and [("path", 1)] in indexes
+    _add_files_to_db(handler)
+    assert tinymongo._table_key(handler._db) in tinymongo._INDEXES.keys()
+
+    queries = [
+        {"record_id": "sample"},
+        {"record_id": "sample", "start_timestamp": {"$gt": 0}},
+        {"$and": [{"record_id": {"$regex": "^csv"}}, {"start_timestamp": {"$gte": 0}}]},
+        {"start_timestamp": {"$lt": 1489728492.0}},
+    ]
+    results = []
+    for query in queries:
+        handler.read(query=query, order_by=[("path", 1)])
+        results.append(handler.data)
+        assert len(handler.data) > 0
+
+    # Records written by another handler are read
+    other_handler = V4MetaDBHandler(database_id="indexed", **kwargs)
+    other_handler.add_data({"record_id": "indexed", "path": "/tmp/indexed.bag"})
+    other_handler.save()
+    handler.read(query={"record_id": "indexed"})
+    assert len(handler.data) == 1
+
+    # Results are the same as those without the indexes
+    del tinymongo._INDEXES[tinymongo._table_key(handler._db)]
+    for query, result in zip(queries, results):
+        handler.read(query=query, order_by=[("path", 1)])
+        assert handler.data == result
+
+
+def test_create_indexes_mongodb():
+    """Test for creating indexes on MongoDB."""
+    mongomock = pytest.importorskip("mongomock")
+    from pydtk.db.v4.engines import mongodb
+    from pydtk.db.v4.handlers import _normalize_indexes
+
+    collection = mongomock.MongoClient().db.collection
+    indexes = _normalize_indexes([{"keys": ["record_id", ["timestamp", -1]]}, "path"])
+    mongodb.create_indexes(collection, indexes)
+    mongodb.create_indexes(collection, indexes)
+
+    info = collection.index_information()
+    keys = [value["key"] for value in info.values()]
+    assert [("_uuid", 1)] in keys
+    assert [("record_id", 1), ("timestamp", -1)] in keys
+    assert [("path", 1)] in keys
+    assert any(value.get("unique", False) for value in info.values())
+
+
 @pytest.mark.parametrize(db_args, db_list)
 def test_db_handler_dtype(
     db_engine: str,
@@ -1290,6 +2511,47 @@ def test_remove_database_id(
     assert "pytest" not in _metadata_handler.config.keys()
 
 
+def test_fix_data_type():
+    """Test for dtype conversion of records."""
+    from datetime import datetime
+
+    from pydtk.db.exceptions import InvalidDatabaseConfigError
+    from pydtk.db.v4.handlers import _fix_data_type, _fix_data_types
+
+    columns = [
+        {"name": "a", "dtype": "Integer", "aggregation": "push"},
+        {"name": "b", "dtype": "float"},
+        {"name": "c", "dtype": "str[]"},
+        {"name": "d", "dtype": "datetime"},
+        {"name": "e"},
+        {"name": "_creation_time", "dtype": "string"},
+    ]
+    data = [
+        {"_uuid": "0", "a": "1", "b": 1, "c": ("x",), "d": 0.0, "e": "1", "_creation_time": 1.0},
+        {"_uuid": "1", "a": None, "b": "2.5", "e": 1},
+    ]
+    expected = [
+        {
+            "_uuid": "0",
+            "a": 1,
+            "b": 1.0,
+            "c": ["x"],
+            "d": datetime.fromtimestamp(0.0),
+            "e": "1",
+            "_creation_time": 1.0,  # internal columns are kept as they are
+        },
+        {"_uuid": "1", "a": None, "b": 2.5, "e": 1},
+    ]
+    assert [_fix_data_type(d, columns) for d in data] == expected
+    assert _fix_data_types(data, columns) == expected
+
+    aggregated = _fix_data_type({"a": ["1", 2], "b": "0.5"}, columns, aggregated=True)
+    assert aggregated == {"a": [1, 2], "b": 0.5}
+
+    with pytest.raises(InvalidDatabaseConfigError):
+        _fix_data_types([{"f": 1}], columns)
+
+
 def test_get_schema():
     """Test `get_schema` function."""
     from pydtk.db.schemas import get_schema
@@ -252,6 +252,424 @@ def test_base_statistic_calculation_with_sync_timestamp():
         assert without_sync["timestamp"] // target_span * target_span == with_sync["timestamp"]
 
 
+def test_ddsketch_quantiles_and_merge():
+    """Run the quantile sketch test."""
+    import json
+
+    import numpy as np
+
+    from pydtk.statistics import DDSketch, merge_sketches
+    from pydtk.statistics.sketch import load_sketch
+
+    rng = np.random.default_rng(0)
+    values = np.concatenate([rng.normal(10.0, 3.0, 5000), -rng.exponential(2.0, 5000), [0.0]])
+
+    sketch = DDSketch(relative_accuracy=0.01).add(values)
+    for q in [0.01, 0.5, 0.95, 0.99]:
+        expected = np.sort(values)[int(np.floor(q * (len(values) - 1)))]  # the lower one
+        assert abs(sketch.quantile(q) - expected) <= 0.011 * abs(expected) + 1e-9
+    assert sketch.quantile(0.0) == values.min()
+    assert sketch.quantile(1.0) == values.max()
+
+    # Merging per-chunk sketches must equal sketching all values at once
+    chunks = [
+        DDSketch(relative_accuracy=0.01).add(chunk).to_json() for chunk in np.array_split(values, 7)
+    ]
+    merged = merge_sketches(chunks + [None, float("nan")])
+    assert merged.count == len(values)
+    assert merged.quantiles([0.5, 0.95, 0.99]) == sketch.quantiles([0.5, 0.95, 0.99])
+
+    with pytest.raises(ValueError):
+        DDSketch(relative_accuracy=0.01).merge(DDSketch(relative_accuracy=0.05))
+
+    # Broken sketches are reported with their positions and the original errors
+    with pytest.raises(ValueError, match="Unknown sketch type: tdigest"):
+        load_sketch({"type": "tdigest"})
+    broken = {**sketch.to_dict()}
+    del broken["zero_count"]
+    with pytest.raises(KeyError, match="zero_count"):
+        load_sketch(broken)
+    with pytest.raises(ValueError, match="position 1: KeyError: 'zero_count'"):
+        merge_sketches([chunks[0], json.dumps(broken)])
+
+
+def test_fixed_bin_histogram_merge():
+    """Run the fixed-bin histogram test."""
+    import numpy as np
+
+    from pydtk.statistics import FixedBinHistogram, merge_sketches
+
+    edges = [0.0, 1.0, 2.0, 3.0]
+    histogram_1 = FixedBinHistogram(edges).add([-1.0, 0.5, 1.5, 1.5, np.nan])
+    histogram_2 = FixedBinHistogram(edges).add([2.5, 3.0, 4.0])
+
+    merged = merge_sketches([histogram_1.to_json(), histogram_2.to_json()])
+    assert merged.counts.tolist() == [1, 2, 2]
+    assert merged.underflow == 1
+    assert merged.overflow == 1
+    assert merged.count == 7
+
+    with pytest.raises(ValueError):
+        histogram_1.merge(FixedBinHistogram([0.0, 10.0]))
+
+
+def test_statistic_tables_with_sketches():
+    """Run the statistic table test with sketches."""
+    import numpy as np
+
+    from pydtk.statistics import BaseStatisticCalculation
+
+    timestamps = np.arange(0.0, 10.0, 0.1)
+    data = np.stack([np.sin(timestamps), np.cos(timestamps)], axis=1)
+    columns = ["sin", "cos"]
+
+    calculator = BaseStatisticCalculation(
+        1.0, sync_timestamps=True, sketches=True, histogram_edges=np.linspace(-1.0, 1.0, 11)
+    )
+    stat_df = calculator.statistic_tables(timestamps, data, columns)
+    for column in columns:
+        for operation in ["mean", "max", "min", "sketch", "histogram"]:
+            assert "{}/{}".format(column, operation) in stat_df.columns
+    assert len(stat_df) == 10
+
+    # Quantiles over all windows only need the stored sketches
+    p50, p100 = calculator.quantiles(stat_df["sin/sketch"], qs=[0.5, 1.0])
+    assert abs(p50 - np.quantile(data[:, 0], 0.5)) < 0.05
+    assert p100 == data[:, 0].max()
+
+    # Sketches are not included by default
+    stat_df = BaseStatisticCalculation(1.0).statistic_tables(timestamps, data, columns)
+    assert "sin/sketch" not in stat_df.columns
+
+
+def test_incremental_statistic_db(tmp_path, monkeypatch):
+    """Run the incremental statistics rebuild test."""
+    import json
+    import os
+    import shutil
+
+    from pydtk.builder import statistic_db
+    from pydtk.db import V3DBHandler as DBHandler
+
+    # Prepare a meta DB containing one file
+    shutil.copytree("test/records/csv_model_test/data", tmp_path / "data")
+    with open(tmp_path / "data" / "test.csv.json", "r") as f:
+        metadata = json.load(f)
+    path = str(tmp_path / "data" / "test.csv")
+    metadata["path"] = path
+    meta_db_handler = DBHandler(
+        db_class="meta",
+        db_engine="sqlite",
+        db_host=str(tmp_path / "meta.db"),
+        database_id="pytest",
+        base_dir_path=str(tmp_path),
+        read_on_init=False,
+    )
+    meta_db_handler.add_data(metadata)
+    meta_db_handler.save(remove_duplicates=True)
+
+    # Count the number of files read
+    read_paths = []
+    original_read = statistic_db.BaseFileReader.read
+
+    def _read(self, metadata=None, **kwargs):
+        read_paths.append(metadata["path"])
+        return original_read(self, metadata=metadata, **kwargs)
+
+    monkeypatch.setattr(statistic_db.BaseFileReader, "read", _read)
+
+    kwargs = {
+        "span": 10.0,
+        "meta_db_base_dir": str(tmp_path),
+        "meta_db_engine": "sqlite",
+        "meta_db_host": str(tmp_path / "meta.db"),
+        "output_db_engine": "sqlite",
+        "output_db_host": str(tmp_path / "statistics.db"),
+        "incremental": True,
+    }
+    statistic_db.main("pytest", "camera/front-center", **kwargs)
+    assert len(read_paths) == 1
+
+    # Nothing has changed
+    statistic_db.main("pytest", "camera/front-center", **kwargs)
+    assert len(read_paths) == 1
+
+    # The source file is updated
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 10.0))
+    statistic_db.main("pytest", "camera/front-center", **kwargs)
+    assert len(read_paths) == 2
+
+    state_db_handler = DBHandler(
+        db_class="statistics_state",
+        db_engine="sqlite",
+        db_host=str(tmp_path / "statistics.db"),
+        database_id="pytest",
+        span=10.0,
+    )
+    assert len(state_db_handler.df) == 1
+    stat_db_handler = DBHandler(
+        db_class="statistics",
+        db_engine="sqlite",
+        db_host=str(tmp_path / "statistics.db"),
+        database_id="pytest",
+        span=10.0,
+    )
+    num_rows = len(stat_db_handler.df)
+    assert num_rows > 0
+
+    # Rows computed from the old contents of a shortened file are removed
+    with open(path, "r") as f:
+        lines = f.readlines()
+    with open(path, "w") as f:
+        f.writelines(lines[: len(lines) // 4])
+    statistic_db.main("pytest", "camera/front-center", **kwargs)
+    assert len(read_paths) == 3
+    stat_db_handler.read()
+    assert 0 < len(stat_db_handler.df) < num_rows
+    assert stat_db_handler.df["timestamp"].max() < float(lines[len(lines) // 4].split(",")[0]) / 1e3
+
+
+class _FlakyWorker(object):
+    """Worker failing at the first attempt of each task."""
+
+    def __init__(self, attempts, instances=None):
+        self.attempts = attempts
+        if instances is not None:
+            instances.append(self)
+
+    def process(self, chunk):
+        results = {}
+        for task_id, payload in chunk:
+            self.attempts[task_id] = self.attempts.get(task_id, 0) + 1
+            results[task_id] = None if self.attempts[task_id] > 1 else "failed"
+        return results
+
+
+def test_scheduler(tmp_path):
+    """Run the work scheduler test."""
+    from pydtk.builder.scheduler import Scheduler, Task, pack_chunks
+
+    tasks = [Task(str(i), i, weight=w) for i, w in enumerate([9, 7, 6, 5, 4, 3, 2, 1])]
+    chunks = pack_chunks(tasks, 3)
+    totals = [sum(task.weight for task in chunk) for chunk in chunks]
+    assert sum(totals) == 37
+    assert totals == sorted(totals, reverse=True)
+    assert max(totals) - min(totals) <= 1
+
+    attempts, instances = {}, []
+    checkpoint = str(tmp_path / "checkpoint.jsonl")
+    scheduler = Scheduler(
+        _FlakyWorker,
+        worker_kwargs={"attempts": attempts, "instances": instances},
+        max_retries=1,
+        checkpoint=checkpoint,
+    )
+    summary = scheduler.run(tasks)
+    assert summary["succeeded"] == len(tasks)
+    assert summary["failed"] == {}
+    assert all(count == 2 for count in attempts.values())
+    assert len(instances) == 1  # the worker is reused for the retries
+
+    # Completed tasks are skipped when resumed
+    tasks += [Task("8", 8)]
+    scheduler = Scheduler(
+        _FlakyWorker, worker_kwargs={"attempts": {}}, max_retries=0, checkpoint=checkpoint
+    )
+    summary = scheduler.run(tasks)
+    assert summary["skipped"] == 8
+    assert summary["succeeded"] == 0
+    assert list(summary["failed"].keys()) == ["8"]
+
+
+def test_batch_statistic_db(tmp_path):
+    """Run the scheduled batch analysis test."""
+    import json
+    import shutil
+
+    from pydtk.builder import statistic_db
+    from pydtk.db import V3DBHandler as DBHandler
+
+    shutil.copytree("test/records/csv_model_test/data", tmp_path / "data")
+    with open(tmp_path / "data" / "test.csv.json", "r") as f:
+        metadata = json.load(f)
+    meta_db_handler = DBHandler(
+        db_class="meta",
+        db_engine="sqlite",
+        db_host=str(tmp_path / "meta.db"),
+        database_id="pytest",
+        base_dir_path=str(tmp_path),
+        read_on_init=False,
+    )
+    for i in range(3):
+        shutil.copy(tmp_path / "data" / "test.csv", tmp_path / "data" / "test_{}.csv".format(i))
+        metadata["record_id"] = "record_{}".format(i)
+        metadata["path"] = str(tmp_path / "data" / "test_{}.csv".format(i))
+        meta_db_handler.add_data(dict(metadata))
+    metadata["record_id"] = "missing"
+    metadata["path"] = str(tmp_path / "data" / "missing.csv")
+    meta_db_handler.add_data(dict(metadata))
+    meta_db_handler.save(remove_duplicates=True)
+
+    kwargs = {
+        "span": 10.0,
+        "num_jobs": 2,
+        "meta_db_base_dir": str(tmp_path),
+        "meta_db_engine": "sqlite",
+        "meta_db_host": str(tmp_path / "meta.db"),
+        "output_db_engine": "sqlite",
+        "output_db_host": str(tmp_path / "statistics.db"),
+        "max_retries": 1,
+        "checkpoint": str(tmp_path / "checkpoint.jsonl"),
+    }
+    summary = statistic_db.batch_analysis("pytest", **kwargs)
+    assert summary["succeeded"] == 3
+    assert len(summary["failed"]) == 1
+
+    summary = statistic_db.batch_analysis("pytest", **kwargs)
+    assert summary["skipped"] == 3
+    assert summary["succeeded"] == 0
+
+    stat_db_handler = DBHandler(
+        db_class="statistics",
+        db_engine="sqlite",
+        db_host=str(tmp_path / "statistics.db"),
+        database_id="pytest",
+        span=10.0,
+    )
+    assert set(stat_db_handler.df["record_id"]) == {"record_0", "record_1", "record_2"}
+
+
+class _MarkerWorker(object):
+    """Worker writing a marker file for each task."""
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+
+    def process(self, chunk):
+        import os
+
+        results = {}
+        for task_id, payload in chunk:
+            if payload == "fail":
+                results[task_id] = "failed"
+                continue
+            with open(os.path.join(self.output_dir, "{}.{}".format(task_id, os.getpid())), "w"):
+                pass
+            results[task_id] = None
+        return results
+
+
+def test_job_queue(tmp_path):
+    """Run the shared-filesystem job queue test."""
+    import os
+    import time
+
+    from pydtk.builder.job_queue import JobQueue, run_workers
+    from pydtk.builder.scheduler import Task
+
+    queue_dir = str(tmp_path / "queue")
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+    tasks = [Task(str(i), str(i)) for i in range(20)] + [Task("bad", "fail")]
+
+    queue = JobQueue(queue_dir, max_retries=1)
+    assert queue.put(tasks) == 21
+    assert queue.put(tasks) == 0
+
+    # A job waiting long is not expired right after being claimed
+    old = time.time() - 3600.0
+    for name in os.listdir(os.path.join(queue_dir, "pending")):
+        os.utime(os.path.join(queue_dir, "pending", name), (old, old))
+    claimed = JobQueue(queue_dir, lease=60.0).claim()
+    assert len(claimed) == 1
+    assert JobQueue(queue_dir, lease=60.0).expire() == 0
+
+    # The worker dies without heartbeats, so the claim expires
+    for name in os.listdir(os.path.join(queue_dir, "claimed")):
+        os.utime(os.path.join(queue_dir, "claimed", name), (old, old))
+
+    counts = run_workers(
+        queue_dir,
+        _MarkerWorker,
+        worker_kwargs={"output_dir": str(output_dir)},
+        num_jobs=3,
+        batch_size=2,
+        lease=60.0,
+        max_retries=1,
+    )
+    assert counts == {"pending": 0, "claimed": 0, "done": 20, "failed": 1}
+
+    # Each job is processed exactly once
+    markers = [name.split(".")[0] for name in os.listdir(output_dir)]
+    assert sorted(markers) == sorted(str(i) for i in range(20))
+
+    # Completed jobs are not added again unless their payloads have changed
+    assert queue.put(tasks) == 0
+    assert queue.put([Task("0", "modified")]) == 1
+
+    # A claim lost meanwhile is neither completed nor failed
+    job = queue.claim()[0]
+    assert queue.expire() == 0
+    os.rename(
+        os.path.join(queue_dir, "claimed", "{}.{}.json".format(job["_name"], queue.owner)),
+        os.path.join(queue_dir, "pending", "{}.json".format(job["_name"])),
+    )
+    assert len(queue.heartbeat([job])) == 1
+    assert not queue.fail(job, "failed")
+    assert not queue.complete(job)
+    assert queue.counts() == {"pending": 1, "claimed": 0, "done": 20, "failed": 1}
+
+
+def test_batch_statistic_db_with_job_queue(tmp_path):
+    """Run the batch analysis with a job queue test."""
+    import json
+    import shutil
+
+    from pydtk.builder import statistic_db
+    from pydtk.db import V3DBHandler as DBHandler
+
+    shutil.copytree("test/records/csv_model_test/data", tmp_path / "data")
+    with open(tmp_path / "data" / "test.csv.json", "r") as f:
+        metadata = json.load(f)
+    meta_db_handler = DBHandler(
+        db_class="meta",
+        db_engine="sqlite",
+        db_host=str(tmp_path / "meta.db"),
+        database_id="pytest",
+        base_dir_path=str(tmp_path),
+        read_on_init=False,
+    )
+    for i in range(4):
+        shutil.copy(tmp_path / "data" / "test.csv", tmp_path / "data" / "test_{}.csv".format(i))
+        metadata["record_id"] = "record_{}".format(i)
+        metadata["path"] = str(tmp_path / "data" / "test_{}.csv".format(i))
+        meta_db_handler.add_data(dict(metadata))
+    meta_db_handler.save(remove_duplicates=True)
+
+    counts = statistic_db.batch_analysis(
+        "pytest",
+        span=10.0,
+        num_jobs=2,
+        meta_db_base_dir=str(tmp_path),
+        meta_db_engine="sqlite",
+        meta_db_host=str(tmp_path / "meta.db"),
+        output_db_engine="sqlite",
+        output_db_host=str(tmp_path / "statistics.db"),
+        queue_dir=str(tmp_path / "queue"),
+    )
+    assert counts["done"] == 4
+
+    stat_db_handler = DBHandler(
+        db_class="statistics",
+        db_engine="sqlite",
+        db_host=str(tmp_path / "statistics.db"),
+        database_id="pytest",
+        span=10.0,
+    )
+    assert len(set(stat_db_handler.df["record_id"])) == 4
+
+
 if __name__ == "__main__":
     # test_v3_db_statistic_sqlite()
     # test_v3_db_statistic_sqlite_2()